@@ -1,35 +1,42 @@
-from typing import Optional, List, Dict, Any, Union, Callable
+import time
+_RUN_STARTED = time.perf_counter()  # Start of this script run, for the startup profile
+from typing import Optional, List
 import streamlit as st
-import datetime
-import requests
-import zipfile
-import os
+import collections
+import json
 from datetime import datetime as dt_object
-import time
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import google.generativeai as genai
-import PyPDF2
-from io import BytesIO
-import psutil
-import socket
-from pydrive2.auth import GoogleAuth
-from pydrive2.drive import GoogleDrive
-from functools import wraps
-
-# Constants
-MAX_LLM_INPUT_LENGTH = 5000
-MAX_TEXT_LENGTH_PDF = 15000
-WEBSITE_CHECK_TIMEOUT = 5
-SMTP_SERVER = 'smtp.gmail.com'
-SMTP_PORT = 465
-
-# API Endpoints
-COINDESK_API_URL = "https://api.coindesk.com/v1/bpi/currentprice/BTC.json"
-COINGECKO_API_URL = "https://api.coingecko.com/api/v3/simple/price"
-OPENWEATHER_API_URL = "http://api.openweathermap.org/data/2.5/weather"
-NEWS_API_URL = "https://newsapi.org/v2/top-headlines"
+
+from services import (
+    APIError, IntegrationUnavailable, INTEGRATIONS, SCHEDULED_JOBS,
+    METRICS_BIND_ADDRESS, METRICS_RATE_WINDOW, PRICE_VS_CURRENCY, DEFAULT_CRYPTO_ASSETS,
+    SYSTEM_SAMPLE_INTERVAL, UPTIME_POLL_INTERVAL, UPTIME_SUMMARY_WINDOW,
+    get_secret, missing_secrets, get_process_profile, get_drive, drive_unavailable_message, get_response_cache,
+    metrics, metrics_exposition, get_metrics_server, unhealthy_hosts,
+    get_uptime_poller, get_system_sampler, get_scheduler, get_email_outbox, get_price_poller,
+    parse_asset_list, crypto_display_name, get_crypto_prices, get_weather,
+    get_weather_board, check_website_uptime, check_websites_bulk, get_machine_report,
+    incremental_backup_to_drive, backup_folder_to_drive,
+    list_backup_snapshots, list_snapshot_members, restore_backup, describe_restore,
+    send_email, parse_email_recipients, render_bulk_emails, queue_bulk_email,
+    get_news_summary, summarize_pdf_content, precompression_savings, run_scheduled_task,
+)
+
+STATUS_REFRESH_INTERVAL = 10  # Seconds between redraws of the status overview, which reads the other panels' results
+
+class RunProfiler:
+    """Named timing spans for one script run; each mark() closes the span since the previous mark."""
+
+    def __init__(self, started: float):
+        self.spans: List[tuple] = []
+        self._last = started
+
+    def mark(self, name: str):
+        now = time.perf_counter()
+        self.spans.append((name, now - self._last))
+        self._last = now
+
+profiler = RunProfiler(_RUN_STARTED)
+profiler.mark("Imports & services")
 
 # --- 1. Streamlit Page Configuration (ABSOLUTE FIRST STREAMLIT COMMAND) ---
 st.set_page_config(
@@ -39,372 +46,44 @@ st.set_page_config(
 )
 
 # --- 2. Custom CSS Injection for Modern Theme ---
-def inject_custom_css(css_file):
+@st.cache_data
+def load_css(css_file: str) -> Optional[str]:
+    """The stylesheet's contents, read once per process; None if the file is missing."""
     try:
         with open(css_file) as f:
-            st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
+            return f.read()
     except FileNotFoundError:
-        st.error(f"CSS file not found: {css_file}. Ensure 'style.css' is in the root directory.")
-
-inject_custom_css("style.css")
-
-
-# --- 3. Configuration & API Key Loading ---
-try:
-    WEATHER_API_KEY = st.secrets["OPENWEATHERMAP_API_KEY"]
-    NEWS_API_KEY = st.secrets["NEWS_API_KEY"]
-    GEMINI_API_KEY = st.secrets["GEMINI_API_KEY"]
-    GMAIL_USER = st.secrets["GMAIL_USER"]
-    GMAIL_APP_PASSWORD = st.secrets["GMAIL_APP_PASSWORD"]
-except KeyError as e:
-    st.error(f"Missing API key or credential in .streamlit/secrets.toml: {e}. Please refer to the setup instructions.")
-    st.stop()
-
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel('models/gemini-1.5-flash')
-
-
-# --- 4. Google Drive Authentication Setup (for PyDrive2) ---
-@st.cache_resource
-def init_google_drive():
-    try:
-        gauth = GoogleAuth('settings.yaml')
-        gauth.LoadCredentialsFile("creds.json")
-
-        if gauth.credentials is None:
-            st.warning("Google Drive authentication required. A browser window will open for initial setup.")
-            gauth.LocalWebserverAuth()
-        elif gauth.access_token_expired:
-            gauth.Refresh()
-        else:
-            gauth.Authorize()
-
-        gauth.SaveCredentialsFile("creds.json")
-        st.success("Google Drive authenticated successfully!")
-        return GoogleDrive(gauth)
-    except Exception as e:
-        st.error(f"Google Drive authentication failed: {e}. "
-                 "Ensure 'client_secrets.json' is in the root directory, "
-                 "Google Drive API is enabled in Google Cloud Console, "
-                 "and test user is added to OAuth consent screen (if applicable).")
         return None
 
-drive = init_google_drive()
-
-
-# --- 5. Function Definitions for Automation Modules ---
-
-def retry_on_failure(max_retries: int = 3, delay: float = 1.0):
-    """Decorator to retry functions on failure."""
-    def decorator(func: Callable) -> Callable:
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            last_exception = None
-            for attempt in range(max_retries):
-                try:
-                    return func(*args, **kwargs)
-                except Exception as e:
-                    last_exception = e
-                    if attempt < max_retries - 1:
-                        time.sleep(delay * (attempt + 1))  # Exponential backoff
-            raise last_exception
-        return wrapper
-    return decorator
-
-class APIError(Exception):
-    """Custom exception for API-related errors."""
-    pass
-
-@retry_on_failure(max_retries=3)
-def get_btc_price() -> Union[float, str]:
-    """Get current Bitcoin price from CoinDesk API."""
-    try:
-        r = requests.get(COINDESK_API_URL, timeout=10)
-        r.raise_for_status()
-        data = r.json()
-        if "bpi" not in data or "USD" not in data["bpi"]:
-            raise APIError("Invalid response format from CoinDesk API")
-        return float(data["bpi"]["USD"]["rate_float"])
-    except requests.exceptions.RequestException as e:
-        raise APIError(f"Network error fetching Bitcoin price: {e}")
-    except (KeyError, ValueError) as e:
-        raise APIError(f"Error parsing Bitcoin price data: {e}")
-
-@retry_on_failure(max_retries=3)
-def get_eth_price() -> Union[float, str]:
-    """Get current Ethereum price from CoinGecko API."""
-    try:
-        r = requests.get(f"{COINGECKO_API_URL}?ids=ethereum&vs_currencies=usd", timeout=10)
-        r.raise_for_status()
-        data = r.json()
-        if "ethereum" not in data or "usd" not in data["ethereum"]:
-            raise APIError("Invalid response format from CoinGecko API")
-        return float(data["ethereum"]["usd"])
-    except requests.exceptions.RequestException as e:
-        raise APIError(f"Network error fetching Ethereum price: {e}")
-    except (KeyError, ValueError) as e:
-        raise APIError(f"Error parsing Ethereum price data: {e}")
-
-def backup_folder_to_drive(folder_path=".", output_dir=".", drive_folder_name="Automated_Backups"):
-    if not drive:
-        return "Google Drive not authenticated. Please restart the app and ensure credentials are set up."
-    if not os.path.exists(folder_path):
-        return f"Error: Local folder '{folder_path}' does not exist."
-    now = dt_object.now().strftime("%Y%m%d_%H%M%S")
-    base_folder_name = os.path.basename(os.path.abspath(folder_path))
-    zip_filename_local = os.path.join(output_dir, f"backup_{base_folder_name}_{now}.zip")
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    try:
-        with zipfile.ZipFile(zip_filename_local, "w", zipfile.Z_DEFLATED) as z:
-            for root, _, files in os.walk(folder_path):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    arcname = os.path.relpath(file_path, folder_path)
-                    z.write(file_path, arcname)
-        st.info(f"Local zip created: `{zip_filename_local}`. Proceeding to upload to Google Drive...")
-
-        file_list = drive.ListFile(
-            {'q': f"'{'root'}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"}
-        ).GetList()
-        target_folder = None
-        for file in file_list:
-            if file['title'] == drive_folder_name:
-                target_folder = file
-                break
-        if not target_folder:
-            folder_metadata = {'title': drive_folder_name, 'mimeType': 'application/vnd.google-apps.folder'}
-            target_folder = drive.CreateFile(folder_metadata)
-            target_folder.Upload()
-            st.info(f"Created new Google Drive folder: '{drive_folder_name}'")
-
-        file_metadata = {'title': os.path.basename(zip_filename_local), 'parents': [{'id': target_folder['id']}]}
-        uploaded_file = drive.CreateFile(file_metadata)
-        uploaded_file.SetContentFile(zip_filename_local)
-        uploaded_file.Upload()
-
-        os.remove(zip_filename_local)
-        return (f"Backup of `{folder_path}` successfully uploaded to Google Drive "
-                f"as `{uploaded_file['title']}` in folder `{drive_folder_name}`. "
-                "Local zip removed.")
-    except Exception as e:
-        if os.path.exists(zip_filename_local):
-            os.remove(zip_filename_local)
-        return f"Error during backup to Google Drive: {e}"
-
-@retry_on_failure(max_retries=3)
-def get_weather(city: str = "London") -> str:
-    """Get weather information for a city."""
-    if not WEATHER_API_KEY or WEATHER_API_KEY == 'YOUR_OPENWEATHERMAP_API_KEY':
-        return "Please set your OpenWeatherMap API key in .streamlit/secrets.toml."
-    
-    url = f"{OPENWEATHER_API_URL}?q={city}&appid={WEATHER_API_KEY}&units=metric"
-    try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        if data.get("cod") != 200:
-            raise APIError(f"Weather API error: {data.get('message', 'Unknown error')}")
-            
-        temp = data["main"]["temp"]
-        description = data["weather"][0]["description"]
-        humidity = data["main"]["humidity"]
-        wind_speed = data["wind"]["speed"]
-        return f"**{temp}°C**, {description.capitalize()}. Humidity: {humidity}%, Wind: {wind_speed} m/s."
-    except requests.exceptions.RequestException as e:
-        raise APIError(f"Network error fetching weather: {e}")
-    except (KeyError, ValueError) as e:
-        raise APIError(f"Error parsing weather data: {e}")
-
-def get_news_summary(query="general", language="en", num_articles=3):
-    if not NEWS_API_KEY or NEWS_API_KEY == 'YOUR_NEWSAPI_ORG_API_KEY':
-        return "Please set your NewsAPI.org API key in .streamlit/secrets.toml."
-    if not GEMINI_API_KEY or GEMINI_API_KEY == 'YOUR_GOOGLE_GEMINI_API_KEY':
-        return "Please set your Google Gemini API key in .streamlit/secrets.toml for summarization."
-
-    url = f"{NEWS_API_URL}?q={query}&language={language}&apiKey={NEWS_API_KEY}"
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-        articles = data.get("articles", [])
-
-        if not articles:
-            return f"No news found for '{query}'."
-
-        summary_parts = []
-        for i, article in enumerate(articles[:num_articles]):
-            title = article.get("title", "No Title")
-            description = article.get("description", "No Description")
-            content = article.get("content", "")
-            article_url = article.get("url", "#")
-
-            text_to_summarize = f"Title: {title}\nDescription: {description}\nContent: {content}"
-            if len(text_to_summarize) > MAX_LLM_INPUT_LENGTH:
-                text_to_summarize = text_to_summarize[:MAX_LLM_INPUT_LENGTH] + "\n... [Content truncated for summarization]"
-
-            try:
-                response_llm = model.generate_content(
-                    f"Summarize the following news article briefly (1-2 sentences), "
-                    f"highlighting the main topic and outcome: {text_to_summarize}"
-                )
-                summary_text = response_llm.text.strip()
-            except Exception as e:
-                if "429 You exceeded your current quota" in str(e):
-                    summary_text = f"LLM Quota Exceeded. Please try again later. (Error: {e})"
-                elif "blocked" in str(e).lower() or "safety" in str(e).lower():
-                    summary_text = "Content blocked by safety settings. Cannot summarize."
-                else:
-                    summary_text = f"Could not summarize article (LLM Error: {e})"
+def inject_custom_css(css_file):
+    css = load_css(css_file)
+    if css is None:
+        st.error(f"CSS file not found: {css_file}. Ensure 'style.css' is in the root directory.")
+    else:
+        st.markdown(f"<style>{css}</style>", unsafe_allow_html=True)
 
-            summary_parts.append(f"**{i+1}. [{title}]({article_url})**\n   - {summary_text}")
+inject_custom_css("style.css")
+profiler.mark("Page config & CSS")
 
-        return "### Top News Headlines:\n" + "\n\n".join(summary_parts)
 
-    except requests.exceptions.RequestException as e:
-        return f"Error fetching news from NewsAPI: {e}"
-    except Exception as e:
-        return f"An unexpected error occurred during news processing: {e}"
+# --- 3. Dashboard Layout ---
+# Each panel is an st.fragment: its widgets rerun only that panel, not the whole dashboard. Results other
+# panels need go into session_state, and the status overview redraws itself every STATUS_REFRESH_INTERVAL.
 
-def check_website_uptime(url):
-    try:
-        response = requests.get(url, timeout=WEBSITE_CHECK_TIMEOUT)
-        if response.status_code == 200:
-            return f"🟢 {url} is UP (Status: {response.status_code})"
-        else:
-            return f"🟠 {url} is DOWN (Status: {response.status_code})"
-    except requests.exceptions.RequestException as e:
-        return f"🔴 {url} is DOWN (Error: {e})"
-
-def summarize_pdf_content(uploaded_file):
-    if not GEMINI_API_KEY or GEMINI_API_KEY == 'YOUR_GOOGLE_GEMINI_API_KEY':
-        return "Please set your Google Gemini API key in .streamlit/secrets.toml for summarization."
-    if uploaded_file is None:
-        return "Please upload a PDF file to summarize."
-    try:
-        pdf_reader = PyPDF2.PdfReader(uploaded_file)
-        text_content = ""
-        for page_num in range(len(pdf_reader.pages)):
-            page = pdf_reader.pages[page_num]
-            extracted = page.extract_text()
-            if extracted:
-                text_content += extracted + "\n"
-        if not text_content.strip():
-            return "Could not extract text from the PDF. It might be an image-based PDF, password-protected, or empty."
-        if len(text_content) > MAX_TEXT_LENGTH_PDF:
-            st.warning(f"PDF content is very large ({len(text_content)} chars). Truncating for summarization.")
-            text_content = text_content[:MAX_TEXT_LENGTH_PDF] + "\n... [Content truncated for summarization]"
-        st.info("Sending content to Gemini for summarization. This may take a moment...")
-        response_llm = model.generate_content(
-            f"Summarize the following document content concisely, highlighting key findings or arguments:\n\n{text_content}"
-        )
-        summary = response_llm.text.strip()
-        return f"**Summary of '{uploaded_file.name}':**\n\n{summary}"
-    except PyPDF2.utils.PdfReadError:
-        return "Error reading PDF file. It might be corrupted or not a valid PDF."
-    except Exception as e:
-        if "429 You exceeded your current quota" in str(e):
-            return f"LLM Quota Exceeded. Please try again later. (Error: {e})"
-        elif "blocked" in str(e).lower() or "safety" in str(e).lower():
-            return "Content blocked by safety settings. Cannot summarize."
-        else:
-            return f"An unexpected error occurred during PDF summarization: {e}"
-
-def run_scheduled_task(task_name):
-    st.info(f"Running scheduled task: '{task_name}' now...")
-    time.sleep(1)
-    return f"Task '{task_name}' executed successfully."
-
-def send_email(to_email, subject, message_body):
-    if not GMAIL_USER or not GMAIL_APP_PASSWORD:
-        return "Please set your GMAIL_USER and GMAIL_APP_PASSWORD in .streamlit/secrets.toml for email sending."
-    msg = MIMEMultipart()
-    msg['From'] = GMAIL_USER
-    msg['To'] = to_email
-    msg['Subject'] = subject
-    msg.attach(MIMEText(message_body, 'plain'))
-    try:
-        with smtplib.SMTP_SSL(SMTP_SERVER, SMTP_PORT) as smtp:
-            smtp.login(GMAIL_USER, GMAIL_APP_PASSWORD)
-            smtp.send_message(msg)
-        return "Email sent successfully!"
-    except Exception as e:
-        return (f"Error sending email: {e}. "
-                "Please check your Gmail credentials and 'App passwords' settings "
-                "(if using 2FA) or ensure Less Secure App Access is enabled (for older setups).")
-
-def get_machine_report():
-    """Gathers and formats detailed system information."""
-    report = []
-    report.append(f"**System Information ({dt_object.now().strftime('%Y-%m-%d %H:%M:%S')})**")
-    report.append("---")
-
-    cpu_percent = psutil.cpu_percent(interval=1)
-    report.append(f"CPU Usage: {cpu_percent:.1f}%")
-
-    svmem = psutil.virtual_memory()
-    mem_total_gb = svmem.total / (1024**3)
-    mem_used_gb = svmem.used / (1024**3)
-    mem_percent = svmem.percent
-    report.append(f"Memory Usage: {mem_used_gb:.2f} GB / {mem_total_gb:.2f} GB ({mem_percent:.1f}%)")
-
-    disk_usage = psutil.disk_usage(os.getcwd())
-    disk_total_gb = disk_usage.total / (1024**3)
-    disk_used_gb = disk_usage.used / (1024**3)
-    disk_percent = disk_usage.percent
-    report.append(f"Disk Usage ({os.getcwd()}): {disk_used_gb:.2f} GB / {disk_total_gb:.2f} GB ({disk_percent:.1f}%)")
-
-    report.append("\n**Network Interfaces:**")
-    net_if_addrs = psutil.net_if_addrs()
-    if not net_if_addrs:
-        report.append("  No network interfaces found.")
-    else:
-        for interface_name, interface_addresses in net_if_addrs.items():
-            report.append(f"  - **{interface_name}:**")
-            found_ip = False
-            for addr in interface_addresses:
-                # IMPORTANT: Use socket module constants as a fallback or primary for AF_INET/AF_INET6
-                # And use hasattr checks for AF_LINK/AF_PACKET as they are OS-dependent or not always present.
-                if addr.family == socket.AF_INET: # IPv4 address
-                    report.append(f"    - IP Address: {addr.address}")
-                    report.append(f"    - Netmask: {addr.netmask}")
-                    if addr.broadcast: report.append(f"    - Broadcast: {addr.broadcast}")
-                    found_ip = True
-                elif addr.family == socket.AF_INET6: # IPv6 address
-                    report.append(f"    - IPv6 Address: {addr.address}")
-                # Check for platform-specific MAC address constants
-                elif hasattr(socket, 'AF_LINK') and addr.family == socket.AF_LINK: # Often macOS, BSD
-                    report.append(f"    - MAC Address: {addr.address}")
-                elif hasattr(socket, 'AF_PACKET') and addr.family == socket.AF_PACKET: # Often Linux
-                    report.append(f"    - MAC Address: {addr.address}")
-                # Fallback for systems where MAC address family might not be explicitly AF_LINK/AF_PACKET,
-                # but might appear as another family with a MAC-like address string.
-                elif not found_ip and addr.address and len(addr.address.replace(':', '')) == 12 and all(c in '0123456789abcdefABCDEF' for c in addr.address.replace(':', '')):
-                    report.append(f"    - MAC Address (heuristic): {addr.address}")
-
-            if not found_ip and not interface_addresses: # If no IP address found for interface
-                report.append("    - No address details.")
-
-    boot_time_timestamp = psutil.boot_time()
-    boot_time_dt = dt_object.fromtimestamp(boot_time_timestamp)
-    current_time_dt = dt_object.now()
-    uptime_duration = current_time_dt - boot_time_dt
-    report.append(f"\nSystem Boot Time: {boot_time_dt.strftime('%Y-%m-%d %H:%M:%S')}")
-    report.append(f"System Uptime: {uptime_duration}")
-
-    return "\n".join(report)
-
-
-# --- 6. Dashboard Layout ---
+def integration_notice(name: str):
+    """Explain inside the current panel why an integration is unavailable, without stopping the app."""
+    missing = missing_secrets(name)
+    if missing:
+        st.warning(f"{INTEGRATIONS[name]['label']} is not configured: set {', '.join(missing)} "
+                   "in .streamlit/secrets.toml to use this module.")
 
 st.title("🛠️ Personal Automation Dashboard")
 st.markdown("---")
 
-if 'btc_price' not in st.session_state:
-    st.session_state['btc_price'] = "N/A"
-if 'eth_price' not in st.session_state:
-    st.session_state['eth_price'] = "N/A"
+if 'crypto_assets' not in st.session_state:
+    st.session_state['crypto_assets'] = list(DEFAULT_CRYPTO_ASSETS)
+if 'crypto_prices' not in st.session_state:
+    st.session_state['crypto_prices'] = {}
 if 'weather_report' not in st.session_state:
     st.session_state['weather_report'] = "No weather fetched yet."
 if 'website_status' not in st.session_state:
@@ -412,34 +91,59 @@ if 'website_status' not in st.session_state:
 if 'machine_report' not in st.session_state:
     st.session_state['machine_report'] = "Click 'Refresh Machine Report' to view."
 
+uptime_poller = get_uptime_poller()
+price_poller = get_price_poller()
+system_sampler = get_system_sampler()
+scheduler = get_scheduler()
+metrics_port = get_secret("METRICS_PORT")
+if metrics_port:
+    try:
+        get_metrics_server(int(metrics_port))
+    except (OSError, ValueError) as e:
+        st.warning(f"Prometheus endpoint could not start on port {metrics_port}: {e}")
+profiler.mark("Background services")
 
-with st.sidebar:
-    st.header("⚙️ Quick Actions")
-    st.markdown("---")
 
+@st.fragment
+def crypto_panel():
     with st.container(border=True):
         st.subheader("📊 Crypto Price Refresh")
+        crypto_assets_input = st.text_input("Coins to Track (CoinGecko IDs, comma-separated):",
+                                            value=", ".join(DEFAULT_CRYPTO_ASSETS), key="crypto_assets_input")
         if st.button("🔄 Refresh Crypto Prices", use_container_width=True):
+            crypto_assets = parse_asset_list(crypto_assets_input)
             with st.spinner("Fetching crypto prices..."):
-                btc_price_val = get_btc_price()
-                eth_price_val = get_eth_price()
-                st.session_state['btc_price'] = f"${btc_price_val:,.2f}" if isinstance(btc_price_val, float) else btc_price_val
-                st.session_state['eth_price'] = f"${eth_price_val:,.2f}" if isinstance(eth_price_val, float) else eth_price_val
-            st.success("Prices updated!")
-
-    st.markdown("---")
-
+                try:
+                    crypto_prices = get_crypto_prices(crypto_assets)
+                except APIError as e:
+                    crypto_prices = None
+                    st.error(f"Could not fetch crypto prices: {e}")
+            if crypto_prices is not None:
+                st.session_state['crypto_assets'] = crypto_assets
+                st.session_state['crypto_prices'] = crypto_prices
+                st.success("Prices updated!")
+                st.caption(" · ".join(f"{crypto_display_name(asset)} ${price:,.2f}"
+                                      for asset, price in crypto_prices.items() if price is not None))
+
+@st.fragment
+def weather_panel():
     with st.container(border=True):
         st.subheader("☁️ Weather Location")
         weather_city_input = st.text_input("Enter City for Weather:", value="Nairobi", key="weather_city")
         if st.button("Get Weather", use_container_width=True):
             with st.spinner("Fetching weather..."):
-                weather_report = get_weather(weather_city_input)
-            st.session_state['weather_report'] = weather_report
-            st.success("Weather updated!")
-
-    st.markdown("---")
-
+                try:
+                    weather_report = get_weather(weather_city_input)
+                except APIError as e:
+                    weather_report = None
+                    st.error(f"Could not fetch weather: {e}")
+            if weather_report is not None:
+                st.session_state['weather_report'] = weather_report
+                st.success("Weather updated!")
+                st.markdown(weather_report)
+
+@st.fragment
+def website_panel():
     with st.container(border=True):
         st.subheader("🌐 Website Monitor")
         website_url = st.text_input("Website URL to Check:", value="https://www.google.com", key="website_url_input")
@@ -448,43 +152,130 @@ with st.sidebar:
                 website_status = check_website_uptime(website_url)
             st.session_state['website_status'] = website_status
             st.success("Website status updated!")
-
-    st.markdown("---")
-
+            st.markdown(website_status)
+        if st.button("➕ Monitor in Background", use_container_width=True):
+            uptime_poller.store.add_target(website_url.strip())
+            uptime_poller.poll_now()
+            st.success(f"Now checking {website_url} every {UPTIME_POLL_INTERVAL}s.")
+
+@st.fragment
+def machine_report_panel():
     with st.container(border=True):
         st.subheader("🖥️ Machine Report")
         if st.button("Refresh Machine Report", use_container_width=True):
             with st.spinner("Gathering system information..."):
-                machine_report = get_machine_report()
+                machine_report = get_machine_report(system_sampler)
             st.session_state['machine_report'] = machine_report
             st.success("Machine report updated!")
 
+with st.sidebar:
+    st.header("⚙️ Quick Actions")
+    st.markdown("---")
+    crypto_panel()
+    st.markdown("---")
+    weather_panel()
     st.markdown("---")
-    st.markdown("For continuous scheduling, consider a separate script running with `schedule` or `APScheduler`.")
+    website_panel()
+    st.markdown("---")
+    machine_report_panel()
 
+    st.markdown("---")
+    enabled_jobs = {job_id: job for job_id, job in scheduler.store.jobs().items()
+                    if job["enabled"] and job_id in SCHEDULED_JOBS}
+    if enabled_jobs:
+        next_job_id = min(enabled_jobs, key=lambda job_id: enabled_jobs[job_id]["next_run"])
+        st.caption(f"🕒 {len(enabled_jobs)} scheduled jobs enabled · next: {SCHEDULED_JOBS[next_job_id]['label']} "
+                   f"at {dt_object.fromtimestamp(enabled_jobs[next_job_id]['next_run']):%H:%M}")
+    else:
+        st.caption("🕒 No scheduled jobs enabled. Configure them in the Task Scheduler panel.")
 
-st.header("⚡ Core Automation Modules")
 
-col1, col2 = st.columns(2)
+profiler.mark("Sidebar")
 
-with col1:
+
+@st.fragment
+def backup_panel():
     with st.container(border=True):
         st.subheader("📁 File Backup (to Google Drive)")
         st.caption("First time backup requires browser authentication for Google Drive via 'client_secrets.json'.")
         backup_source_folder = st.text_input("Local Folder to Backup (e.g., '.' for current):", value=".", key="backup_source_folder")
-        backup_output_folder_local = st.text_input("Local Temp Folder for Zip:", value="temp_backups", key="backup_output_folder_local_zip")
         drive_folder_name_input = st.text_input("Google Drive Target Folder:", value="Automated_Backups", key="drive_folder_name_input")
+        backup_mode = st.radio("Backup Mode:", ["Incremental (changed files only)", "Full ZIP snapshot"],
+                               key="backup_mode", horizontal=True)
 
         if st.button("▶️ Start Google Drive Backup", use_container_width=True):
-            if not drive:
-                st.warning("Google Drive not initialized. Please ensure setup and try again.")
+            if get_drive() is None:
+                st.warning(drive_unavailable_message())
             else:
                 with st.spinner(f"Backing up '{backup_source_folder}' to Google Drive..."):
-                    backup_result = backup_folder_to_drive(backup_source_folder, backup_output_folder_local, drive_folder_name_input)
+                    if backup_mode.startswith("Incremental"):
+                        backup_result = incremental_backup_to_drive(backup_source_folder, drive_folder_name_input)
+                    else:
+                        backup_result = backup_folder_to_drive(backup_source_folder, drive_folder_name_input)
                 st.info(backup_result)
 
+@st.fragment
+def restore_panel():
+    with st.container(border=True):
+        st.subheader("♻️ Restore from Google Drive")
+        restore_drive_folder = st.text_input("Google Drive Backup Folder:", value="Automated_Backups", key="restore_drive_folder")
+        if st.button("🔍 List Backups", use_container_width=True):
+            if get_drive() is None:
+                st.warning(drive_unavailable_message())
+            else:
+                try:
+                    st.session_state['restore_snapshots'] = list_backup_snapshots(restore_drive_folder)
+                    st.session_state.pop('restore_members', None)
+                except Exception as e:
+                    st.error(f"Could not list backups: {e}")
+        snapshots = st.session_state.get('restore_snapshots')
+        if snapshots is None:
+            return
+        if not snapshots:
+            st.info(f"No backups found in `{restore_drive_folder}`.")
+            return
+        def describe_snapshot(s):
+            return f"{s['title']} (incremental)" if s["kind"] == "incremental" else f"{s['title']} ({s['size'] / (1024**2):.1f} MB)"
+
+        snapshot = st.selectbox("Backup:", snapshots, key="restore_snapshot", format_func=describe_snapshot)
+        members = st.session_state.get('restore_members')
+        if (members is None or members[0] != snapshot["id"]) and st.button(
+                "📂 Load File List", use_container_width=True,
+                help="Optional; without a selection the whole backup is restored."):
+            try:
+                with st.spinner("Reading the backup's file list..."):
+                    members = st.session_state['restore_members'] = (snapshot["id"], list_snapshot_members(snapshot))
+            except Exception as e:
+                st.error(f"Could not read the backup: {e}")
+        selected = None
+        if members is not None and members[0] == snapshot["id"]:
+            selected = st.multiselect("Files to restore (leave empty for all):", [m["name"] for m in members[1]],
+                                      key="restore_selected_files")
+        restore_target = st.text_input("Restore into local folder:", value="restored", key="restore_target_folder")
+        if st.button("♻️ Restore", use_container_width=True):
+            restore_progress = st.progress(0.0, text="Starting restore...")
+
+            def update_restore_progress(done, total):
+                restore_progress.progress(done / total, text=f"Restored {done}/{total} files")
+
+            try:
+                with st.spinner("Downloading and verifying files..."):
+                    results = restore_backup(snapshot, restore_target, selected or None, progress=update_restore_progress)
+                restore_progress.empty()
+                failed = [r for r in results if r["status"] != "restored"]
+                (st.warning if failed else st.success)(describe_restore(results, restore_target))
+                if failed:
+                    st.dataframe([{"File": r["name"], "Error": r["error"]} for r in failed],
+                                 use_container_width=True, hide_index=True)
+            except Exception as e:
+                restore_progress.empty()
+                st.error(f"Error during restore: {e}")
+
+@st.fragment
+def quick_email_panel():
     with st.container(border=True):
         st.subheader("📧 Send Quick Email")
+        integration_notice("smtp")
         email_to = st.text_input("Recipient Email:", key="email_to_input")
         email_subject = st.text_input("Subject:", key="email_subject_input")
         email_message = st.text_area("Message:", key="email_message_input")
@@ -496,34 +287,282 @@ with col1:
             else:
                 st.warning("Please fill in recipient and message for the email.")
 
-with col2:
+@st.fragment
+def bulk_email_panel():
+    with st.container(border=True):
+        st.subheader("📨 Bulk Email")
+        integration_notice("smtp")
+        bulk_email_to = st.text_area("Recipients (comma or newline separated):", key="bulk_email_to_input")
+        bulk_email_csv = st.file_uploader("...or a CSV with an 'email' column:", type="csv", key="bulk_email_csv")
+        bulk_email_subject = st.text_input("Subject:", key="bulk_email_subject_input")
+        bulk_email_body = st.text_area("Message:", key="bulk_email_body_input",
+                                       help="CSV columns can be used as placeholders, e.g. 'Hi $name'.")
+        bulk_recipients = parse_email_recipients(
+            bulk_email_to, bulk_email_csv.getvalue().decode("utf-8-sig") if bulk_email_csv else "")
+        if bulk_recipients and bulk_email_body:
+            with st.expander(f"Preview ({len(bulk_recipients)} recipients)"):
+                preview = render_bulk_emails(bulk_recipients[:1], bulk_email_subject, bulk_email_body)[0]
+                st.markdown(f"**To:** {preview['to']}  \n**Subject:** {preview['subject']}")
+                st.text(preview["body"])
+        if st.button("📤 Queue Bulk Email", use_container_width=True):
+            if bulk_recipients and bulk_email_body:
+                try:
+                    st.session_state['email_batch_id'] = queue_bulk_email(bulk_recipients, bulk_email_subject,
+                                                                          bulk_email_body)
+                except IntegrationUnavailable as e:
+                    st.error(str(e))
+            else:
+                st.warning("Please add at least one recipient and a message.")
+        if st.session_state.get('email_batch_id'):
+            batch = get_email_outbox().batch_status(st.session_state['email_batch_id'])
+            counts = collections.Counter(m["status"] for m in batch)
+            st.caption(" · ".join(f"{counts[status]} {status}" for status in ("sent", "sending", "queued", "failed")
+                                  if counts[status]))
+            st.dataframe([{"To": m["to"], "Status": m["status"], "Attempts": m["attempts"],
+                           "Sent": m["sent_at"] or "", "Error": m["error"] or ""} for m in batch],
+                         use_container_width=True, hide_index=True)
+            if counts["queued"] or counts["sending"]:
+                st.button("🔄 Refresh Status", key="email_batch_refresh")
+
+@st.fragment
+def bulk_website_panel():
+    with st.container(border=True):
+        st.subheader("🌐 Bulk Website Monitor")
+        bulk_urls_input = st.text_area("URLs to Check (one per line):",
+                                       value="https://www.google.com\nhttps://www.github.com", key="bulk_urls_input")
+        if st.button("📡 Check All Websites", use_container_width=True):
+            bulk_urls = bulk_urls_input.splitlines()
+            with st.spinner("Checking websites..."):
+                started = time.perf_counter()
+                st.session_state['bulk_website_results'] = check_websites_bulk(bulk_urls)
+                st.session_state['bulk_website_elapsed'] = time.perf_counter() - started
+        if st.session_state.get('bulk_website_results'):
+            results = st.session_state['bulk_website_results']
+            up_count = sum(1 for r in results if r["up"])
+            st.caption(f"{up_count}/{len(results)} up · checked in {st.session_state['bulk_website_elapsed']:.2f}s")
+            st.dataframe(
+                [{"URL": r["url"], "Up": "🟢" if r["up"] else ("🔴" if r["error"] else "🟠"),
+                  "Status": str(r["status"] or r["error"]), "DNS (ms)": round(r["dns_ms"], 1),
+                  "Connect (ms)": round(r["connect_ms"], 1), "TTFB (ms)": round(r["ttfb_ms"], 1),
+                  "Total (ms)": round(r["total_ms"], 1)} for r in results],
+                use_container_width=True, hide_index=True,
+            )
+
+@st.fragment
+def news_panel():
     with st.container(border=True):
         st.subheader("🗞️ News Summary")
+        integration_notice("llm")
         news_query = st.text_input("News Topic (e.g., 'technology', 'finance'):", value="AI", key="news_query_input")
         if st.button("📰 Fetch & Summarize News", use_container_width=True):
             with st.spinner(f"Fetching and summarizing news about '{news_query}'..."):
                 news_summary = get_news_summary(query=news_query)
             st.markdown(news_summary)
 
+@st.fragment
+def weather_board_panel():
+    with st.container(border=True):
+        st.subheader("🌦️ Weather Board")
+        board_cities_input = st.text_area("Cities (one per line, optionally 'City,CC'):",
+                                          value="Nairobi\nLondon\nNew York\nTokyo", key="weather_board_cities")
+        if st.button("🔄 Refresh Weather Board", use_container_width=True):
+            with st.spinner("Fetching weather..."):
+                started = time.perf_counter()
+                try:
+                    st.session_state['weather_board'] = get_weather_board(board_cities_input.splitlines())
+                    st.session_state['weather_board_elapsed'] = time.perf_counter() - started
+                except APIError as e:
+                    st.error(f"Could not fetch weather: {e}")
+        if st.session_state.get('weather_board'):
+            board = st.session_state['weather_board']
+            located = [r for r in board if not r["error"]]
+            st.caption(f"{len(located)}/{len(board)} cities · fetched in {st.session_state['weather_board_elapsed']:.2f}s")
+            st.dataframe(
+                [{"City": r["city"], "Location": ", ".join(p for p in (r.get("name"), r.get("state"), r.get("country")) if p),
+                  "Temp (°C)": r.get("temp_c"), "Feels Like (°C)": r.get("feels_like_c"),
+                  "Conditions": (r.get("description") or "").capitalize(), "Humidity (%)": r.get("humidity"),
+                  "Wind (m/s)": r.get("wind_speed"), "Error": r["error"] or ""} for r in board],
+                use_container_width=True, hide_index=True,
+            )
+            if located:
+                st.map({"lat": [r["lat"] for r in located], "lon": [r["lon"] for r in located]}, height=260)
+
+@st.fragment
+def pdf_panel():
     with st.container(border=True):
         st.subheader("📝 PDF/Note Summarizer")
+        integration_notice("llm")
         uploaded_file = st.file_uploader("Upload a PDF file", type="pdf", key="pdf_uploader")
         if st.button("🧠 Summarize Document", use_container_width=True):
             if uploaded_file is not None:
+                pdf_progress = st.progress(0.0, text="Reading PDF...")
+
+                def update_pdf_progress(stage, done, total):
+                    pdf_progress.progress(done / total if total else 0.0, text=f"{stage}: {done}/{total}")
+
                 with st.spinner("Summarizing document..."):
-                    summary_output = summarize_pdf_content(uploaded_file)
+                    summary_output = summarize_pdf_content(uploaded_file, progress=update_pdf_progress)
+                pdf_progress.empty()
                 st.info(summary_output)
             else:
                 st.warning("Please upload a PDF file first.")
 
+@st.fragment
+def scheduler_panel():
     with st.container(border=True):
-        st.subheader("🕒 Task Scheduler (Trigger Now)")
-        task_name_input = st.text_input("Task to Trigger (e.g., 'Daily Report Generation'):", key="task_name_input")
-        if st.button("⚡ Trigger Task", use_container_width=True):
-            if task_name_input:
-                st.info(run_scheduled_task(task_name_input))
+        st.subheader("🕒 Task Scheduler")
+        jobs = scheduler.store.jobs()
+        failures = scheduler.store.failure_counts()
+        job_rows = []
+        for job_id, spec in SCHEDULED_JOBS.items():
+            job = jobs.get(job_id)
+            if job is None:
+                continue
+            last_run = next(iter(scheduler.store.runs(job_id, limit=1)), None)
+            job_rows.append({
+                "Job": spec["label"], "Schedule": job["trigger"], "Enabled": job["enabled"],
+                "Next Run": f"{dt_object.fromtimestamp(job['next_run']):%Y-%m-%d %H:%M}" if job["enabled"] else "",
+                "Running": scheduler.running[job_id],
+                "Last Run": f"{dt_object.fromtimestamp(last_run['started_at']):%Y-%m-%d %H:%M:%S}" if last_run else "",
+                "Last Status": last_run["status"] if last_run else "",
+                "Duration (s)": round(last_run["duration"], 2) if last_run else None,
+                "Failures": failures.get(job_id, 0),
+            })
+        st.dataframe(job_rows, use_container_width=True, hide_index=True)
+        task_job_id = st.selectbox("Job:", list(SCHEDULED_JOBS), format_func=lambda j: SCHEDULED_JOBS[j]["label"],
+                                   key="task_job_select")
+        if st.button("⚡ Trigger Now", use_container_width=True):
+            st.info(run_scheduled_task(task_job_id))
+        with st.expander("Edit Schedule"):
+            job = jobs[task_job_id]
+            job_trigger = st.text_input("Schedule (cron, or e.g. 'every 15m'):", value=job["trigger"],
+                                        key=f"job_trigger_{task_job_id}")
+            job_enabled = st.checkbox("Enabled", value=job["enabled"], key=f"job_enabled_{task_job_id}")
+            job_params = st.text_area("Parameters (JSON):", value=json.dumps(job["params"], indent=2),
+                                      key=f"job_params_{task_job_id}")
+            if st.button("💾 Save Schedule", use_container_width=True):
+                try:
+                    params = json.loads(job_params)
+                    scheduler.store.update(task_job_id, job_trigger, job_enabled, params)
+                    scheduler.wake()
+                    st.success("Schedule saved.")
+                except (ValueError, TypeError) as e:
+                    st.error(f"Could not save schedule: {e}")
+        recent_runs = scheduler.store.runs(limit=10)
+        if recent_runs:
+            with st.expander("Recent Runs"):
+                st.dataframe([{"Job": SCHEDULED_JOBS.get(r["job_id"], {}).get("label", r["job_id"]),
+                               "Started": f"{dt_object.fromtimestamp(r['started_at']):%Y-%m-%d %H:%M:%S}",
+                               "Duration (s)": round(r["duration"], 2), "Status": r["status"],
+                               "Detail": r["detail"][:200]} for r in recent_runs],
+                             use_container_width=True, hide_index=True)
+
+st.header("⚡ Core Automation Modules")
+
+col1, col2 = st.columns(2)
+
+with col1:
+    backup_panel()
+    restore_panel()
+    quick_email_panel()
+    bulk_email_panel()
+    bulk_website_panel()
+
+with col2:
+    news_panel()
+    weather_board_panel()
+    pdf_panel()
+    scheduler_panel()
+
+profiler.mark("Core modules")
+
+
+@st.fragment(run_every=STATUS_REFRESH_INTERVAL)
+def key_metrics_panel():
+    with st.container(border=True):
+        st.subheader("Key Metrics")
+        for asset in st.session_state['crypto_assets']:
+            # Served from the background-polled history; no API call happens here.
+            indicators = price_poller.history.indicators(asset)
+            price = indicators["price"] if indicators else st.session_state['crypto_prices'].get(asset)
+            covered = [(label, figures) for label, figures in (indicators or {}).get("windows", {}).items()
+                       if figures["change_pct"] is not None]
+            details = [f"{label}: {figures['change_pct']:+.2f}% · SMA ${figures['sma']:,.2f} · "
+                       f"volatility {figures['volatility_pct']:.2f}%" for label, figures in covered]
+            st.metric(label=f"{crypto_display_name(asset)} Price ({PRICE_VS_CURRENCY.upper()})",
+                      value=f"${price:,.2f}" if price is not None else "N/A",
+                      delta=f"{covered[-1][1]['change_pct']:+.2f}%" if covered else None,
+                      delta_description=covered[-1][0] if covered else None,
+                      chart_data=price_poller.history.sparkline(asset) or None,
+                      help="  \n".join(details) or "Change figures appear once enough price history has been polled.")
+        st.info(f"**Current Weather:** {st.session_state['weather_report']}")
+        st.info(f"**Website Uptime:** {st.session_state['website_status']}")
+        for breaker in unhealthy_hosts():
+            st.warning(f"⚠️ `{breaker.host}` is unhealthy ({breaker.state.replace('_', '-')}); "
+                       "showing last known values where available.")
+        monitored_urls = uptime_poller.store.targets()
+        if monitored_urls:
+            st.caption(f"Background monitor · last {UPTIME_SUMMARY_WINDOW // 3600}h")
+            for summary in (uptime_poller.store.summary(url) for url in monitored_urls):
+                uptime = f"{summary['uptime_pct']:.2f}%" if summary['uptime_pct'] is not None else "N/A"
+                latency = (f"p50 {summary['p50_ms']:.0f} ms · p95 {summary['p95_ms']:.0f} ms"
+                           if summary['p50_ms'] is not None else "no latency data")
+                st.metric(label=f"Uptime · {summary['url']}", value=uptime, help=f"{summary['checks']} checks")
+                st.caption(latency)
+
+@st.fragment(run_every=STATUS_REFRESH_INTERVAL)
+def system_overview_panel():
+    with st.expander("Detailed Machine Report", expanded=True):
+        st.code(st.session_state['machine_report'], language='text')
+
+    with st.expander("Live System Metrics", expanded=True):
+        latest_sample = system_sampler.latest()
+        if latest_sample is None:
+            st.caption(f"Collecting the first sample (every {SYSTEM_SAMPLE_INTERVAL:.0f}s)...")
+        else:
+            mib = 1024 ** 2
+            live_cols = st.columns(4)
+            live_cols[0].metric("CPU", f"{latest_sample['cpu']:.1f}%")
+            live_cols[1].metric("Memory", f"{latest_sample['memory']:.1f}%")
+            live_cols[2].metric("Disk R/W (MiB/s)",
+                                f"{latest_sample['disk_read'] / mib:.2f} / {latest_sample['disk_write'] / mib:.2f}")
+            live_cols[3].metric("Net ↑/↓ (MiB/s)",
+                                f"{latest_sample['net_sent'] / mib:.2f} / {latest_sample['net_recv'] / mib:.2f}")
+
+            window_minutes = st.select_slider("Window (minutes):", options=[1, 5, 15, 30], value=5,
+                                              key="system_window_minutes")
+            window = system_sampler.window(window_minutes * 60)
+            times = [dt_object.fromtimestamp(t) for t in window[:, 0]]
+            st.line_chart({"time": times, "CPU %": window[:, 1], "Memory %": window[:, 2]}, x="time", height=160)
+            st.line_chart({"time": times, "Net sent MiB/s": window[:, 5] / mib, "Net recv MiB/s": window[:, 6] / mib},
+                          x="time", height=160)
+            st.dataframe(
+                [{"Metric": name, "Min": round(v["min"], 2), "Avg": round(v["avg"], 2), "Max": round(v["max"], 2)}
+                 for name, v in system_sampler.stats(window_minutes * 60).items()],
+                use_container_width=True, hide_index=True,
+            )
+            st.caption("Top processes by CPU")
+            st.dataframe(
+                [{"PID": p["pid"], "Name": p["name"], "CPU %": round(p["cpu_percent"] or 0.0, 1),
+                  "Memory %": round(p["memory_percent"] or 0.0, 2)} for p in system_sampler.top_processes],
+                use_container_width=True, hide_index=True,
+            )
+
+@st.fragment
+def uptime_history_panel():
+    monitored_urls = uptime_poller.store.targets()
+    if monitored_urls:
+        with st.expander("Uptime History", expanded=False):
+            history_url = st.selectbox("Monitored URL:", monitored_urls, key="uptime_history_url")
+            history = uptime_poller.store.history(history_url)
+            if history:
+                st.line_chart(history, x="time", y="avg_ms", y_label="Avg latency (ms)")
+                st.line_chart(history, x="time", y="uptime_pct", y_label="Uptime (%)")
             else:
-                st.warning("Please enter a task name to trigger.")
+                st.caption("No checks recorded yet.")
+            if st.button("Stop Monitoring This URL", key="uptime_remove_url"):
+                uptime_poller.store.remove_target(history_url)
+                st.rerun(scope="fragment")
 
 st.markdown("---")
 st.header("📊 Current Status & System Overview")
@@ -531,16 +570,90 @@ st.header("📊 Current Status & System Overview")
 col_status_1, col_status_2 = st.columns([1, 2])
 
 with col_status_1:
-    with st.container(border=True):
-        st.subheader("Key Metrics")
-        st.metric(label="Bitcoin Price (USD)", value=st.session_state['btc_price'])
-        st.metric(label="Ethereum Price (USD)", value=st.session_state['eth_price'])
-        st.info(f"**Current Weather:** {st.session_state['weather_report']}")
-        st.info(f"**Website Uptime:** {st.session_state['website_status']}")
+    key_metrics_panel()
 
 with col_status_2:
-    with st.expander("Detailed Machine Report", expanded=True):
-        st.code(st.session_state['machine_report'], language='text')
+    system_overview_panel()
+    uptime_history_panel()
+
+profiler.mark("Status overview")
+
+
+@st.fragment
+def performance_panel():
+    span_kind = st.radio("Show:", ["All", "Module functions", "External calls & background work"], horizontal=True,
+                         key="performance_span_kind")
+    performance_rows = [row for row in metrics.summary()
+                        if span_kind == "All" or (":" in row["name"]) == (span_kind != "Module functions")]
+    if performance_rows:
+        def as_ms(value: Optional[float]) -> Optional[float]:
+            return None if value is None else round(value, 1)
+        st.dataframe([{"Span": row["name"], "Calls": row["calls"], "Calls/min": round(row["calls_per_min"], 2),
+                       "Errors": row["errors"], "Error %": round(row["error_rate"] * 100, 1),
+                       f"Error % ({METRICS_RATE_WINDOW // 60} min)": round(row["recent_error_rate"] * 100, 1),
+                       "p50 ms": as_ms(row["p50_ms"]), "p95 ms": as_ms(row["p95_ms"]), "p99 ms": as_ms(row["p99_ms"]),
+                       "Mean ms": as_ms(row["mean_ms"]), "Total s": round(row["total_s"], 2)}
+                      for row in performance_rows],
+                     use_container_width=True, hide_index=True)
+        st.caption(f"Percentiles come from fixed histogram buckets; rates cover the last {METRICS_RATE_WINDOW // 60} "
+                   "minutes. Names with a prefix (`http:`, `llm:`, `smtp:`, `drive:`, `zip:`, `psutil:`, `job:`) are "
+                   "single external calls or background work; the rest are module functions.")
+    else:
+        st.caption("Nothing has been measured yet.")
+    savings = precompression_savings()
+    if savings["raw_tokens"]:
+        model_time = (f"~{savings['model_s_saved']:.1f}s of model time saved" if savings["model_s_saved"] is not None
+                      else "model time saved not yet estimable")
+        st.caption(f"LLM pre-compression · {savings['raw_tokens']:,.0f} → {savings['sent_tokens']:,.0f} prompt tokens "
+                   f"({savings['saved_pct']:.0f}% saved) · {model_time} for {savings['compress_s']:.2f}s of local work")
+    counter_rows = [{"Counter": name, **dict(labels), "Total": value}
+                    for (name, labels), value in metrics.counter_totals()]
+    if counter_rows:
+        st.dataframe(counter_rows, use_container_width=True, hide_index=True)
+    performance_col_1, performance_col_2 = st.columns([1, 2])
+    with performance_col_1:
+        st.download_button("⬇️ Prometheus metrics", metrics_exposition(), file_name="dashboard_metrics.prom",
+                           mime="text/plain", use_container_width=True)
+    with performance_col_2:
+        if metrics_port:
+            st.caption(f"Scrape endpoint: http://{METRICS_BIND_ADDRESS}:{metrics_port}/metrics")
+        else:
+            st.caption("Set METRICS_PORT in .streamlit/secrets.toml to serve these metrics for Prometheus to scrape.")
+
+st.markdown("---")
+st.header("🚀 Performance")
+performance_panel()
+
+profiler.mark("Performance")
+process_profile = get_process_profile()
+if process_profile["cold_start"] is None:
+    process_profile["cold_start"] = list(profiler.spans)
+
+with st.expander("⏱️ Startup & Rerun Profile", expanded=False):
+    st.caption("Full-page runs only; buttons inside a panel rerun just that panel.")
+    profile_col_1, profile_col_2, profile_col_3 = st.columns(3)
+    with profile_col_1:
+        st.caption(f"This run · {sum(t for _, t in profiler.spans) * 1000:.0f} ms")
+        st.dataframe([{"Stage": name, "ms": round(t * 1000, 1)} for name, t in profiler.spans],
+                     use_container_width=True, hide_index=True)
+    with profile_col_2:
+        st.caption(f"Cold start (first run of this process) · "
+                   f"{sum(t for _, t in process_profile['cold_start']) * 1000:.0f} ms")
+        st.dataframe([{"Stage": name, "ms": round(t * 1000, 1)} for name, t in process_profile["cold_start"]],
+                     use_container_width=True, hide_index=True)
+    with profile_col_3:
+        st.caption("Integrations (loaded on first use)")
+        st.dataframe([{"Integration": spec["label"],
+                       "Status": ("missing " + ", ".join(missing_secrets(name)) if missing_secrets(name)
+                                  else "loaded" if spec["label"] in process_profile["integrations"] else "not loaded"),
+                       "Load ms": round(process_profile["integrations"].get(spec["label"], 0.0) * 1000, 1)}
+                      for name, spec in INTEGRATIONS.items()],
+                     use_container_width=True, hide_index=True)
+    cache_stats = get_response_cache().stats()
+    memory_tier = cache_stats.pop("_memory")
+    st.caption(f"Response cache · {memory_tier['entries']}/{memory_tier['capacity']} entries in memory")
+    st.dataframe([{"Source": source, **counts} for source, counts in sorted(cache_stats.items())],
+                 use_container_width=True, hide_index=True)
 
 st.markdown("---")
-st.markdown(f"Last updated: {dt_object.now().strftime('%Y-%m-%d %H:%M:%S')}")
\ No newline at end of file
+st.markdown(f"Last updated: {dt_object.now().strftime('%Y-%m-%d %H:%M:%S')}")
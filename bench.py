@@ -0,0 +1,644 @@
+"""Offline load benchmark for the dashboard's module functions.
+
+Every external service is replaced by a local stand-in with configurable latency, error rate and
+payload size: CoinGecko, OpenWeatherMap, NewsAPI, Gemini (REST), an SMTP server, the Drive
+resumable-upload and ranged-download endpoints and a monitored website. Each scenario calls one module function from
+services.py at a fixed concurrency and reports throughput and p50/p95/p99 latency. Results are written
+as JSON, and a previous results file can be passed as a baseline to print the change.
+
+    python bench.py
+    python bench.py --scenarios weather,news --requests 200 --concurrency 16
+    python bench.py --stub gemini:latency_ms=1500,error_rate=0.05 --output after.json --baseline before.json
+
+The app runs inside a temporary working directory, so its caches and databases start empty and
+nothing under .dashboard_data is touched. The Drive metadata client is replaced by a pre-seeded
+folder index. Only uploads and downloads go over HTTP, to the stand-in.
+"""
+import argparse
+import collections
+import hashlib
+import json
+import logging
+import os
+import platform
+import random
+import re
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Per-service stand-in defaults: added latency (mean and uniform jitter), injected error rate and
+# response payload size. Gemini also slows down with prompt size (ms_per_request_kb), like a real model.
+# Override any of them with --stub SERVICE:key=value[,key=value].
+STUB_DEFAULTS: Dict[str, Dict[str, float]] = {
+    "coingecko": {"latency_ms": 80, "jitter_ms": 40, "error_rate": 0.0, "payload_kb": 0},
+    "openweathermap": {"latency_ms": 60, "jitter_ms": 30, "error_rate": 0.0, "payload_kb": 1},
+    "newsapi": {"latency_ms": 120, "jitter_ms": 60, "error_rate": 0.0, "payload_kb": 2},
+    "gemini": {"latency_ms": 400, "jitter_ms": 200, "error_rate": 0.0, "payload_kb": 0.5, "ms_per_request_kb": 5},
+    "smtp": {"latency_ms": 30, "jitter_ms": 10, "error_rate": 0.0, "payload_kb": 0},
+    "drive": {"latency_ms": 40, "jitter_ms": 20, "error_rate": 0.0, "payload_kb": 0},
+    "website": {"latency_ms": 20, "jitter_ms": 10, "error_rate": 0.0, "payload_kb": 16},
+}
+
+# Scenario -> stand-ins it talks to.
+SCENARIOS: Dict[str, List[str]] = {
+    "prices": ["coingecko"],
+    "weather": ["openweathermap"],
+    "weather_board": ["openweathermap"],
+    "news": ["newsapi", "gemini"],
+    "pdf": ["gemini"],
+    "backup": ["drive"],
+    "restore": ["drive"],
+    "email": ["smtp"],
+    "uptime": ["website"],
+}
+
+
+class StubStats:
+    """Thread-safe request and injected-error counters for one stand-in."""
+
+    def __init__(self):
+        self.counts: collections.Counter = collections.Counter()
+        self._lock = threading.Lock()
+
+    def add(self, event: str, n: int = 1):
+        with self._lock:
+            self.counts[event] += n
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counts)
+
+
+class StubBehaviour:
+    """Latency, error injection and payload size shared by the HTTP and SMTP stand-ins."""
+
+    def __init__(self, latency_ms: float, jitter_ms: float, error_rate: float, payload_kb: float,
+                 ms_per_request_kb: float = 0.0):
+        self.latency_ms = latency_ms
+        self.ms_per_request_kb = ms_per_request_kb
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.payload_bytes = int(payload_kb * 1024)
+        self.stats = StubStats()
+
+    def delay(self, request_bytes: int = 0):
+        latency_ms = self.latency_ms + self.ms_per_request_kb * request_bytes / 1024
+        time.sleep(max(0.0, latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000)
+
+    def should_fail(self) -> bool:
+        return random.random() < self.error_rate
+
+    def padding(self, n: Optional[int] = None) -> str:
+        return "x" * (self.payload_bytes if n is None else n)
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, name: str, behaviour: StubBehaviour, route: Callable):
+        super().__init__(("127.0.0.1", 0), StubHTTPHandler)
+        self.name = name
+        self.behaviour = behaviour
+        self.route = route  # (server, method, path, query, headers, body) -> (status, headers, body)
+        self.state: Dict[str, Any] = {}
+        self.state_lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+
+class StubHTTPHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, so pooled clients behave as they would in production
+
+    def _dispatch(self, method: str):
+        server: StubHTTPServer = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        server.behaviour.stats.add("requests")
+        server.behaviour.delay(len(body))
+        if server.behaviour.should_fail():
+            server.behaviour.stats.add("injected_errors")
+            status, headers, payload = 503, {"Retry-After": "1"}, b'{"error": "injected failure"}'
+        else:
+            parts = urlsplit(self.path)
+            status, headers, payload = server.route(server, method, parts.path, parse_qs(parts.query),
+                                                    self.headers, body)
+        self.send_response(status)
+        for key, value in {"Content-Type": "application/json", **headers}.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _json(data: Any, status: int = 200, headers: Optional[Dict[str, str]] = None) -> tuple:
+    return status, headers or {}, json.dumps(data).encode("utf-8")
+
+
+def coingecko_route(server, method, path, query, headers, body):
+    ids = query.get("ids", [""])[0].split(",")
+    currency = query.get("vs_currencies", ["usd"])[0]
+    return _json({asset: {currency: round(random.uniform(1, 70000), 2)} for asset in ids if asset})
+
+
+def openweathermap_route(server, method, path, query, headers, body):
+    if path.startswith("/geo/"):
+        city = query.get("q", ["?"])[0]
+        seed = int(hashlib.sha256(city.encode("utf-8")).hexdigest()[:8], 16)
+        return _json([{"name": city, "country": "XX", "lat": seed % 18000 / 100 - 90,
+                       "lon": seed // 18000 % 36000 / 100 - 180}])
+    return _json({"cod": 200, "name": f"{query.get('lat', ['?'])[0]},{query.get('lon', ['?'])[0]}",
+                  "main": {"temp": round(random.uniform(-5, 35), 1), "humidity": random.randint(20, 95)},
+                  "weather": [{"description": "scattered clouds"}], "wind": {"speed": round(random.uniform(0, 12), 1)},
+                  "padding": server.behaviour.padding()})
+
+
+def newsapi_route(server, method, path, query, headers, body):
+    topic = query.get("q", ["general"])[0]
+    return _json({"status": "ok", "articles": [
+        {"title": f"{topic} headline {i}", "url": f"https://news.example.test/{topic}/{i}",
+         "description": f"What happened in {topic} today, part {i}.",
+         "content": server.behaviour.padding()} for i in range(10)]})
+
+
+def gemini_route(server, method, path, query, headers, body):
+    if not path.endswith(":generateContent"):
+        return _json({"error": {"message": f"unsupported path {path}"}}, status=404)
+    prompt_chars = sum(len(part.get("text", "")) for content in json.loads(body).get("contents", [])
+                       for part in content.get("parts", []))
+    text = f"Summary of {prompt_chars} characters. " + server.behaviour.padding()
+    return _json({"candidates": [{"content": {"parts": [{"text": text}], "role": "model"},
+                                  "finishReason": "STOP", "index": 0}]})
+
+
+DRIVE_STORED_FOLDER = "bench-restore-folder"  # Uploads into this folder are kept for ranged downloads
+
+
+def drive_file_get(server, path, query, headers):
+    """Drive v3 file GET: ``fields=size`` metadata, or the content of a stored upload, honouring Range."""
+    file_id = path.rsplit("/", 1)[-1]
+    with server.state_lock:
+        stored = server.state.get("stored", {}).get(file_id)
+    if stored is None:
+        return _json({"error": "file not found"}, status=404)
+    size = os.path.getsize(stored)
+    if query.get("alt", [""])[0] != "media":
+        return _json({"id": file_id, "size": str(size)})
+    match = re.match(r"bytes=(\d+)-(\d*)$", headers.get("Range", ""))
+    start, end = (int(match.group(1)), min(int(match.group(2) or size - 1), size - 1)) if match else (0, size - 1)
+    with open(stored, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start + 1)
+    server.behaviour.stats.add("bytes_served", len(data))
+    if not match:
+        return 200, {"Content-Type": "application/octet-stream"}, data
+    return 206, {"Content-Type": "application/octet-stream", "Content-Range": f"bytes {start}-{end}/{size}"}, data
+
+
+def drive_route(server, method, path, query, headers, body):
+    """Drive v3 resumable uploads: a POST opens a session, PUTs append chunks or ask for the offset.
+
+    Content is only kept for uploads into DRIVE_STORED_FOLDER, so backup runs don't fill the disk.
+    """
+    if method == "GET":
+        return drive_file_get(server, path, query, headers)
+    if method == "POST":
+        session_id = uuid.uuid4().hex
+        metadata = json.loads(body or b"{}")
+        with server.state_lock:
+            server.state[session_id] = {"received": 0, "name": metadata.get("name", "upload"),
+                                        "store": DRIVE_STORED_FOLDER in metadata.get("parents", [])}
+        return 200, {"Location": f"{server.url}/upload/session/{session_id}"}, b""
+    session_id = path.rsplit("/", 1)[-1]
+    with server.state_lock:
+        session = server.state.get(session_id)
+    if session is None:
+        return _json({"error": "unknown session"}, status=404)
+    match = re.match(r"bytes (\*|(\d+)-(\d+))/(\*|\d+)", headers.get("Content-Range", ""))
+    if not match:
+        return _json({"error": "bad Content-Range"}, status=400)
+    if match.group(2) is not None and int(match.group(2)) == session["received"]:
+        session["received"] += len(body)
+        server.behaviour.stats.add("bytes", len(body))
+        if session["store"]:
+            with open(os.path.join(server.state["store_dir"], session_id), "ab") as f:
+                f.write(body)
+    total = match.group(4)
+    if total != "*" and session["received"] >= int(total):
+        if session["store"]:
+            with server.state_lock:
+                server.state.setdefault("stored", {})[f"file-{session_id}"] = os.path.join(
+                    server.state["store_dir"], session_id)
+                server.state.setdefault("listing", {})[f"file-{session_id}"] = {
+                    "title": session["name"], "parent": DRIVE_STORED_FOLDER, "size": session["received"]}
+        return _json({"id": f"file-{session_id}", "name": session["name"], "size": str(session["received"])})
+    range_header = {"Range": f"bytes=0-{session['received'] - 1}"} if session["received"] else {}
+    return 308, range_header, b""
+
+
+def website_route(server, method, path, query, headers, body):
+    return 200, {"Content-Type": "text/html"}, server.behaviour.padding().encode("ascii")
+
+
+HTTP_ROUTES = {"coingecko": coingecko_route, "openweathermap": openweathermap_route, "newsapi": newsapi_route,
+               "gemini": gemini_route, "drive": drive_route, "website": website_route}
+
+
+class StubSMTPServer(socketserver.ThreadingTCPServer):
+    """Minimal SMTP server that accepts everything, without AUTH or STARTTLS."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, behaviour: StubBehaviour):
+        super().__init__(("127.0.0.1", 0), StubSMTPHandler)
+        self.behaviour = behaviour
+
+    @property
+    def url(self) -> str:
+        return f"smtp://127.0.0.1:{self.server_address[1]}"
+
+
+class StubSMTPHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        behaviour: StubBehaviour = self.server.behaviour
+        behaviour.stats.add("connections")
+        self.wfile.write(b"220 bench ESMTP\r\n")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command == b"EHLO":
+                self.wfile.write(b"250-bench\r\n250 8BITMIME\r\n")
+            elif command == b"DATA":
+                self.wfile.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                behaviour.stats.add("requests")
+                behaviour.delay()
+                if behaviour.should_fail():
+                    behaviour.stats.add("injected_errors")
+                    self.wfile.write(b"451 4.3.0 Injected temporary failure\r\n")
+                else:
+                    self.wfile.write(b"250 2.0.0 Queued\r\n")
+            elif command == b"QUIT":
+                self.wfile.write(b"221 Bye\r\n")
+                return
+            else:  # HELO, MAIL, RCPT, RSET, NOOP
+                self.wfile.write(b"250 OK\r\n")
+
+
+def start_stubs(names: List[str], overrides: Dict[str, Dict[str, float]]) -> Dict[str, Any]:
+    stubs = {}
+    for name in names:
+        behaviour = StubBehaviour(**{**STUB_DEFAULTS[name], **overrides.get(name, {})})
+        server = StubSMTPServer(behaviour) if name == "smtp" else StubHTTPServer(name, behaviour, HTTP_ROUTES[name])
+        threading.Thread(target=server.serve_forever, name=f"stub-{name}", daemon=True).start()
+        stubs[name] = server
+    return stubs
+
+
+def make_pdf(pages: List[str]) -> bytes:
+    """A minimal valid PDF with one Helvetica text page per entry in ``pages``."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        lines = [line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for line in text.splitlines()]
+        stream = "BT /F1 10 Tf 12 TL 40 800 Td " + " ".join(f"({line}) '" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream".encode("latin-1"))
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents {len(objects)} 0 R "
+                       "/Resources << /Font << /F1 3 0 R >> >> >>".encode("latin-1"))
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>".encode("latin-1")
+    out, offsets = bytearray(b"%PDF-1.4\n"), []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode("latin-1") + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    out += b"".join(f"{offset:010d} 00000 n \n".encode("latin-1") for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    return bytes(out)
+
+
+class BenchUpload(BytesIO):
+    """Stands in for Streamlit's UploadedFile, which summarize_pdf_content reads via getvalue() and name."""
+
+    def __init__(self, data: bytes, name: str):
+        super().__init__(data)
+        self.name = name
+
+
+class BenchDriveAuth:
+    access_token_expired = False
+
+    class credentials:
+        access_token = "bench-token"
+
+
+class BenchDriveFileList:
+    def __init__(self, items: List[Dict[str, Any]]):
+        self.items = items
+
+    def GetList(self) -> List[Dict[str, Any]]:
+        return self.items
+
+
+class BenchDriveClient:
+    """Replaces the PyDrive2 client: an access token, plus folder listings of the stand-in's stored files."""
+
+    auth = BenchDriveAuth()
+
+    def __init__(self, stub: Any):
+        self.stub = stub
+
+    def ListFile(self, params: Dict[str, str]) -> BenchDriveFileList:
+        if "mimeType='application/vnd.google-apps.folder'" in params["q"]:
+            return BenchDriveFileList([])  # Folders only exist as pre-seeded index entries
+        parent = re.search(r"'([^']*)' in parents", params["q"]).group(1)
+        with self.stub.state_lock:
+            listing = dict(self.stub.state.get("listing", {}))
+        return BenchDriveFileList([{"id": file_id, "title": meta["title"], "fileSize": str(meta["size"])}
+                                   for file_id, meta in listing.items() if meta["parent"] == parent])
+
+
+def make_backup_folder(root: str, size_mb: float, files: int = 40) -> str:
+    """Half compressible text, half random bytes, spread over ``files`` files."""
+    folder = os.path.join(root, "backup_source")
+    os.makedirs(folder, exist_ok=True)
+    per_file = max(1, int(size_mb * 1024 * 1024 / files))
+    rng = random.Random(0)
+    for i in range(files):
+        with open(os.path.join(folder, f"file_{i:03d}.{'txt' if i % 2 else 'bin'}"), "wb") as f:
+            if i % 2:
+                f.write((f"line {i} of some fairly repetitive log output\n" * (per_file // 44 + 1)).encode()[:per_file])
+            else:
+                f.write(rng.randbytes(per_file))
+    return folder
+
+
+def write_secrets(workdir: str, stubs: Dict[str, Any]):
+    """Point the app at the stand-ins; every value here is fake."""
+    os.makedirs(os.path.join(workdir, ".streamlit"), exist_ok=True)
+    secrets = {"OPENWEATHERMAP_API_KEY": "bench", "NEWS_API_KEY": "bench", "GEMINI_API_KEY": "bench",
+               "GMAIL_USER": "bench@example.test", "GMAIL_APP_PASSWORD": "bench"}
+    if "gemini" in stubs:
+        secrets["GEMINI_API_ENDPOINT"] = stubs["gemini"].url
+    if "smtp" in stubs:
+        secrets.update(SMTP_SERVER="127.0.0.1", SMTP_PORT=stubs["smtp"].server_address[1], SMTP_USE_SSL=False)
+    with open(os.path.join(workdir, ".streamlit", "secrets.toml"), "w") as f:
+        for key, value in secrets.items():
+            f.write(f"{key} = {json.dumps(value)}\n")
+
+
+def load_services(workdir: str, stubs: Dict[str, Any], args) -> Any:
+    """Import services.py from inside ``workdir`` with its endpoints and client-side limits set for the run."""
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_DIR)
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    import services
+    import streamlit as st
+    from streamlit.logger import set_log_level
+    st.secrets.load_if_toml_exists()  # Loading secrets re-applies Streamlit's logging config, so do it first
+    set_log_level("error")  # Also quiets the bare-mode ScriptRunContext warnings from worker threads
+    if "coingecko" in stubs:
+        services.COINGECKO_API_URL = stubs["coingecko"].url + "/api/v3/simple/price"
+    if "openweathermap" in stubs:
+        services.OPENWEATHER_API_URL = stubs["openweathermap"].url + "/data/2.5/weather"
+        services.OPENWEATHER_GEOCODE_URL = stubs["openweathermap"].url + "/geo/1.0/direct"
+    if "newsapi" in stubs:
+        services.NEWS_API_URL = stubs["newsapi"].url + "/v2/top-headlines"
+    if "drive" in stubs:
+        services.DRIVE_UPLOAD_URL = stubs["drive"].url + "/upload/drive/v3/files"
+        services.DRIVE_FILES_URL = stubs["drive"].url + "/drive/v3/files"
+        stubs["drive"].state["store_dir"] = tempfile.mkdtemp(prefix="drive-", dir=workdir)
+        services.INTEGRATIONS["drive"]["loader"] = lambda: BenchDriveClient(stubs["drive"])
+        services.DRIVE_INDEX_REFRESH_INTERVAL = float("inf")
+        services.get_drive_index().folders["root/Bench_Backups"] = "bench-folder"
+        services.get_drive_index().folders["root/Bench_Restore"] = DRIVE_STORED_FOLDER
+    # The stand-ins have no quotas, so the client-side throttles are opened up unless asked otherwise.
+    services.GEMINI_REQUESTS_PER_MINUTE = args.llm_rpm
+    services.get_llm_rate_limiter.clear()
+    outbox = services.get_email_outbox()
+    outbox.rate_limiter = services.RateLimiter(args.email_rpm, 60.0)
+    outbox.priority_rate_limiter = services.RateLimiter(args.email_rpm, 60.0)
+    return services
+
+
+def build_scenarios(services, workdir: str, stubs: Dict[str, Any], args) -> Dict[str, tuple]:
+    """Scenario -> (call(i), ok(result)); ``i`` is folded into --key-space to control cache hits."""
+    def key(i: int) -> int:
+        return i % args.key_space if args.key_space else i
+
+    run_id = uuid.uuid4().hex[:8]  # Keeps the persistent summary cache cold across runs
+    scenarios: Dict[str, tuple] = {
+        "prices": (lambda i: services.get_crypto_prices([f"coin-{run_id}-{key(i)}-{n}" for n in range(5)]),
+                   lambda r: len(r) == 5),
+        "weather": (lambda i: services.get_weather(f"City{run_id}{key(i)}"), lambda r: r.startswith("**")),
+        "weather_board": (lambda i: services.get_weather_board([f"Board{run_id}{key(i)}-{n}"
+                                                                for n in range(args.board_cities)]),
+                          lambda r: len(r) == args.board_cities and not any(c["error"] for c in r)),
+        "news": (lambda i: services.get_news_summary(f"topic{run_id}{key(i)}", num_articles=args.news_articles),
+                 lambda r: r.startswith("### Top News")),
+        "email": (lambda i: services.send_email(f"user{i}@example.test", f"Bench {i}", "Hello from the benchmark."),
+                  lambda r: r == "Email sent successfully!"),
+    }
+    if "website" in stubs:
+        scenarios["uptime"] = (lambda i: services.check_website_uptime(f"{stubs['website'].url}/page/{key(i)}"),
+                               lambda r: r.startswith("🟢"))
+    if "gemini" in stubs:
+        page_text = "\n".join(["The quarterly report covers revenue, costs and outlook for each region."] * 40)
+        pdfs = {}
+
+        def pdf_call(i: int):
+            k = key(i)
+            if k not in pdfs:
+                pdfs[k] = make_pdf([f"Document {run_id}-{k} page {p}\n{page_text}" for p in range(args.pdf_pages)])
+            return services.summarize_pdf_content(BenchUpload(pdfs[k], f"bench-{k}.pdf"))
+        scenarios["pdf"] = (pdf_call, lambda r: r.startswith("**Summary of"))
+    if "drive" in stubs:
+        folder = make_backup_folder(workdir, args.backup_mb)
+        scenarios["backup"] = (lambda i: services.backup_folder_to_drive(folder, "Bench_Backups"),
+                               lambda r: r.startswith("Backup of"))
+        if "restore" in args.scenarios.split(","):
+            # One stored backup; each call restores a single file from it, verified against the manifest.
+            services.backup_folder_to_drive(folder, "Bench_Restore")
+            snapshot = services.list_backup_snapshots("Bench_Restore")[0]
+            members = [m["name"] for m in services.list_snapshot_members(snapshot)]
+            scenarios["restore"] = (
+                lambda i: services.restore_backup(snapshot, os.path.join(workdir, "restored", str(i)),
+                                                  [members[key(i) % len(members)]]),
+                lambda r: len(r) == 1 and r[0]["status"] == "restored" and r[0]["verified"] == "sha256")
+    return scenarios
+
+
+def run_scenario(call: Callable[[int], Any], ok: Callable[[Any], bool], requests: int, concurrency: int) -> Dict[str, Any]:
+    def one(i: int) -> tuple:
+        started = time.perf_counter()
+        try:
+            result = call(i)
+            detail = None if ok(result) else str(result)[:160]
+        except Exception as e:
+            detail = f"{type(e).__name__}: {e}"[:160]
+        return time.perf_counter() - started, detail
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - started
+    latencies = np.array([elapsed for elapsed, _ in results]) * 1000
+    failures = collections.Counter(detail for _, detail in results if detail is not None)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {"requests": requests, "concurrency": concurrency, "errors": sum(failures.values()),
+            "error_rate": round(sum(failures.values()) / requests, 4), "wall_s": round(wall, 3),
+            "throughput_rps": round(requests / wall, 2),
+            "latency_ms": {"p50": round(p50, 1), "p95": round(p95, 1), "p99": round(p99, 1),
+                           "mean": round(float(latencies.mean()), 1), "max": round(float(latencies.max()), 1)},
+            "top_errors": [{"error": detail, "count": count} for detail, count in failures.most_common(3)]}
+
+
+def parse_stub_overrides(values: List[str], error_rate: Optional[float]) -> Dict[str, Dict[str, float]]:
+    overrides: Dict[str, Dict[str, float]] = {}
+    if error_rate is not None:
+        for name in STUB_DEFAULTS:
+            overrides.setdefault(name, {})["error_rate"] = error_rate
+    for value in values:
+        name, _, settings = value.partition(":")
+        if name not in STUB_DEFAULTS:
+            raise SystemExit(f"Unknown stub '{name}'; choose from {', '.join(STUB_DEFAULTS)}.")
+        for setting in filter(None, settings.split(",")):
+            field, _, number = setting.partition("=")
+            if field not in STUB_DEFAULTS[name]:
+                raise SystemExit(f"Unknown stub setting '{field}'; choose from {', '.join(STUB_DEFAULTS[name])}.")
+            overrides.setdefault(name, {})[field] = float(number)
+    return overrides
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results: Dict[str, Any], baseline: Optional[Dict[str, Any]]):
+    header = f"{'scenario':<14}{'reqs':>6}{'conc':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}"
+    print(header + ("   vs baseline (rps / p95)" if baseline else ""))
+    for name, r in results["scenarios"].items():
+        line = (f"{name:<14}{r['requests']:>6}{r['concurrency']:>6}{r['throughput_rps']:>9.2f}"
+                f"{r['latency_ms']['p50']:>10.1f}{r['latency_ms']['p95']:>10.1f}{r['latency_ms']['p99']:>10.1f}"
+                f"{r['errors']:>8}")
+        before = (baseline or {}).get("scenarios", {}).get(name)
+        if before:
+            def change(new, old):
+                return f"{(new - old) / old * 100:+.0f}%" if old else "n/a"
+            line += (f"   {change(r['throughput_rps'], before['throughput_rps'])} / "
+                     f"{change(r['latency_ms']['p95'], before['latency_ms']['p95'])}")
+        print(line)
+        for error in r["top_errors"]:
+            print(f"{'':<14}  {error['count']}x {error['error']}")
+    savings = results.get("precompression") or {}
+    if savings.get("raw_tokens"):
+        model_time = ("n/a" if savings["model_s_saved"] is None else f"~{savings['model_s_saved']:.1f}s")
+        print(f"\nLLM pre-compression: {savings['raw_tokens']:,.0f} -> {savings['sent_tokens']:,.0f} prompt tokens "
+              f"({savings['saved_pct']:.0f}% saved), model time saved {model_time}, "
+              f"local work {savings['compress_s']:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset of: "
+                        + ", ".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=50, help="Calls per scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent callers per scenario")
+    parser.add_argument("--key-space", type=int, default=0,
+                        help="Distinct cities/queries/documents cycled through; 0 makes every call a cache miss")
+    parser.add_argument("--stub", action="append", default=[], metavar="SERVICE:key=value,...",
+                        help="Override stand-in latency_ms, jitter_ms, error_rate or payload_kb")
+    parser.add_argument("--error-rate", type=float, help="Injected error rate for every stand-in")
+    parser.add_argument("--news-articles", type=int, default=3)
+    parser.add_argument("--board-cities", type=int, default=30, help="Cities per weather_board call")
+    parser.add_argument("--pdf-pages", type=int, default=20)
+    parser.add_argument("--backup-mb", type=float, default=32)
+    parser.add_argument("--llm-rpm", type=int, default=100000,
+                        help="Client-side Gemini limit; pass the app's GEMINI_REQUESTS_PER_MINUTE to include it")
+    parser.add_argument("--email-rpm", type=int, default=100000,
+                        help="Client-side SMTP limit per outbox lane; the email scenario uses the priority lane, "
+                             "so pass the app's EMAIL_PRIORITY_PER_MINUTE to include it")
+    parser.add_argument("--output", default=os.path.join(REPO_DIR, "bench_results.json"))
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    selected = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in selected if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    output = os.path.abspath(args.output)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    overrides = parse_stub_overrides(args.stub, args.error_rate)
+    stubs = start_stubs(sorted({stub for name in selected for stub in SCENARIOS[name]}), overrides)
+    workdir = tempfile.mkdtemp(prefix="dashboard-bench-")
+    write_secrets(workdir, stubs)
+    services = load_services(workdir, stubs, args)
+    scenarios = build_scenarios(services, workdir, stubs, args)
+
+    results: Dict[str, Any] = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "git_commit": git_commit(),
+        "python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "stubs": {name: {**STUB_DEFAULTS[name], **overrides.get(name, {})} for name in stubs},
+        "scenarios": {},
+    }
+    for name in selected:
+        print(f"Running {name}...", file=sys.stderr)
+        before = {stub: stubs[stub].behaviour.stats.snapshot() for stub in SCENARIOS[name]}
+        call, ok = scenarios[name]
+        results["scenarios"][name] = run_scenario(call, ok, args.requests, args.concurrency)
+        results["scenarios"][name]["upstream"] = {
+            stub: {event: count - before[stub].get(event, 0)
+                   for event, count in stubs[stub].behaviour.stats.snapshot().items()}
+            for stub in SCENARIOS[name]}
+
+    results["app_spans"] = services.metrics.summary()  # The app's own instrumentation, broken down per call
+    results["precompression"] = services.precompression_savings()
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print_report(results, baseline)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3356 @@
+"""Automation services behind the dashboard: integrations, caches, background workers and module functions.
+
+Imported once per server process, so nothing here is re-executed when a widget triggers a rerun. Nothing
+in this module draws UI; functions return user-facing strings or raise APIError for app.py to display.
+"""
+import time
+import logging
+from typing import Optional, List, Dict, Any, Union, Callable
+import streamlit as st
+import datetime
+import requests
+from requests.adapters import HTTPAdapter
+import zipfile
+import os
+from datetime import datetime as dt_object
+import smtplib
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+import io
+from io import BytesIO, StringIO
+import psutil
+import numpy as np
+import socket
+from functools import wraps
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+import math
+import itertools
+import http.client
+import ssl
+from urllib.parse import urlsplit, urljoin
+import sqlite3
+import json
+import hashlib
+import struct
+import zlib
+import collections
+import random
+from email.utils import parsedate_to_datetime
+import queue
+import re
+import csv
+from string import Template
+import bisect
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Constants
+MAX_LLM_INPUT_LENGTH = 5000
+MAX_TEXT_LENGTH_PDF = 15000
+WEBSITE_CHECK_TIMEOUT = 5
+WEBSITE_MONITOR_WORKERS = 64  # Upper bound on concurrent checks in bulk mode
+WEBSITE_MAX_IDLE_PER_HOST = 4  # Keep-alive connections kept open per host
+WEBSITE_MAX_REDIRECTS = 5
+DATA_DIR = ".dashboard_data"  # Local state (history, caches) that should survive restarts
+UPTIME_DB_PATH = os.path.join(DATA_DIR, "uptime.db")
+UPTIME_POLL_INTERVAL = 60  # Seconds between background checks of monitored URLs
+UPTIME_ROLLUP_BUCKET = 300  # Raw checks are rolled up into 5-minute buckets
+UPTIME_RAW_RETENTION_DAYS = 2
+UPTIME_ROLLUP_RETENTION_DAYS = 90
+UPTIME_SUMMARY_WINDOW = 24 * 3600
+GEMINI_REQUESTS_PER_MINUTE = 15  # Client-side cap; match this to the Gemini quota of your API key
+LLM_MAX_CONCURRENCY = 4
+SUMMARY_CACHE_PATH = os.path.join(DATA_DIR, "summaries.db")
+NEWS_SUMMARY_PROMPT = ("Summarize the following news article briefly (1-2 sentences), "
+                       "highlighting the main topic and outcome: {text}")
+CHARS_PER_TOKEN = 4  # Rough English-text average, good enough for budgeting prompts
+PDF_CHUNK_TOKENS = MAX_TEXT_LENGTH_PDF // CHARS_PER_TOKEN  # Token budget of one map/reduce prompt
+NEWS_ARTICLE_TOKENS = MAX_LLM_INPUT_LENGTH // CHARS_PER_TOKEN  # Budget of one article after pre-compression
+PDF_COMPRESSION_RATIO = 0.5  # Share of each extracted section's tokens sent on; 1.0 only drops duplicates/boilerplate
+PRECOMPRESS_DUPLICATE_SIMILARITY = 0.85  # TF-IDF cosine above which a sentence repeats an earlier one
+PRECOMPRESS_MIN_WORDS = 3  # Shorter fragments (page numbers, stray headings) are dropped from over-budget text
+PRECOMPRESS_BOILERPLATE_MAX_WORDS = 12  # Only lines this short can be dropped as boilerplate
+PRECOMPRESS_MIN_RESULT_SHARE = 0.1  # Below this share of the budget the original text is sent instead
+LLM_LATENCY_SAMPLES = 200  # Recent (prompt tokens, seconds) pairs behind the time-saved estimate
+PRECOMPRESS_MAX_SENTENCE_CHARS = 600  # Unpunctuated text (tables, lists) is split into lines, then pieces of this size
+PDF_SUMMARY_PROMPT = ("Summarize the following document content concisely, "
+                      "highlighting key findings or arguments:\n\n{text}")
+PDF_CHUNK_PROMPT = ("The following is one section of a longer document. Summarize it concisely, "
+                    "keeping key findings, figures and arguments:\n\n{text}")
+PDF_REDUCE_PROMPT = ("The following are summaries of consecutive sections of one document. Combine them into "
+                     "a single concise summary, highlighting key findings or arguments:\n\n{text}")
+BACKUP_STATE_DIR = os.path.join(DATA_DIR, "backup_state")  # Last manifest per (source folder, Drive folder)
+BACKUP_BLOB_FOLDER = "blobs"  # Drive subfolder holding content-addressed file blobs
+BACKUP_EXCLUDE_DIRS = {DATA_DIR}
+BACKUP_BLOCK_SIZE = 1024 * 1024  # Unit of parallel compression
+BACKUP_COMPRESSION_LEVEL = 6
+BACKUP_COMPRESSION_WINDOW = 4  # Blocks in flight per core; bounds memory use of the archive stream
+BACKUP_MANIFEST_NAME = ".backup_manifest.json"  # Checksums appended to every streamed ZIP
+DRIVE_UPLOAD_URL = "https://www.googleapis.com/upload/drive/v3/files"
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # Must be a multiple of 256 KiB
+UPLOAD_MAX_RETRIES = 5
+DRIVE_INDEX_PATH = os.path.join(DATA_DIR, "drive_index.json")
+DRIVE_INDEX_REFRESH_INTERVAL = 300  # Seconds between change-feed syncs of the Drive index
+DRIVE_FILES_URL = "https://www.googleapis.com/drive/v3/files"
+RESTORE_RANGE_SIZE = 1024 * 1024  # Bytes per ranged download request
+RESTORE_READAHEAD = 3  # Ranges fetched ahead of a sequential reader; bounds memory per open archive
+RESTORE_WORKERS = 8  # Files extracted concurrently, each over its own ranged reader
+SYSTEM_SAMPLE_INTERVAL = 2.0  # Seconds between background system samples
+SYSTEM_HISTORY_SECONDS = 30 * 60  # Ring buffers hold this much history, then overwrite the oldest samples
+SYSTEM_TOP_PROCESSES = 5
+SYSTEM_METRICS = ["time", "cpu", "memory", "disk_read", "disk_write", "net_sent", "net_recv"]
+# Upper bounds (ms) of the latency histogram buckets stored with each rollup; one overflow bucket follows.
+LATENCY_BUCKETS_MS = [5, 10, 20, 35, 50, 75, 100, 150, 200, 300, 400, 500, 750,
+                      1000, 1500, 2000, 3000, 5000, 7500, 10000]
+# Span histograms extend the latency buckets to cover minute-long backups and summaries.
+SPAN_BUCKETS_MS = LATENCY_BUCKETS_MS + [15000, 30000, 60000, 120000, 300000, 600000]
+METRICS_RATE_WINDOW = 300  # Seconds of recent calls behind the per-minute call and error rates
+METRICS_BIND_ADDRESS = "127.0.0.1"  # Interface for the optional Prometheus endpoint (METRICS_PORT secret)
+SMTP_SERVER = 'smtp.gmail.com'
+SMTP_PORT = 465
+SMTP_USE_SSL = True  # Implicit TLS; with False the connection is upgraded via STARTTLS when offered
+SMTP_TIMEOUT = 30
+EMAIL_POOL_SIZE = 2  # Persistent SMTP connections draining the outgoing queue
+EMAIL_MESSAGES_PER_MINUTE = 20  # Shared across the pool to stay under the provider's sending limits
+EMAIL_PRIORITY_PER_MINUTE = 5  # Part of EMAIL_MESSAGES_PER_MINUTE kept for single and scheduled sends
+EMAIL_MESSAGES_PER_CONNECTION = 100  # Reconnect (and re-authenticate) after this many sends
+EMAIL_IDLE_TIMEOUT = 60  # Close a worker's connection after this long without work
+EMAIL_MAX_ATTEMPTS = 3
+EMAIL_BATCH_HISTORY = 20  # Finished batches kept for status display
+SCHEDULER_DB_PATH = os.path.join(DATA_DIR, "scheduler.db")
+SCHEDULER_WORKERS = 3
+SCHEDULER_MAX_SLEEP = 60  # Upper bound on how long the scheduler thread sleeps between checks
+SCHEDULER_RUN_HISTORY = 50  # Runs kept per job
+SCHEDULER_DETAIL_CHARS = 4000  # Stored length of each run's result or error text
+GEMINI_MODEL_NAME = 'models/gemini-1.5-flash'
+PRICE_CACHE_TTL = 30  # Seconds a fetched price is shared across all sessions
+PRICE_VS_CURRENCY = "usd"
+DEFAULT_CRYPTO_ASSETS = ["bitcoin", "ethereum"]
+PRICE_POLL_INTERVAL = 60  # Seconds between background price polls of tracked assets
+PRICE_HISTORY_SECONDS = 2 * 86400  # Price history kept per asset
+PRICE_HISTORY_DIR = os.path.join(DATA_DIR, "price_history")  # Memory-mapped history files; "" keeps it in memory
+PRICE_CHANGE_WINDOWS = {"1h": 3600, "24h": 86400}  # Windows of the change, moving average and volatility figures
+PRICE_SPARKLINE_SECONDS = 86400
+PRICE_SPARKLINE_POINTS = 96
+CRYPTO_SYMBOLS = {"bitcoin": "BTC", "ethereum": "ETH", "solana": "SOL", "cardano": "ADA",
+                  "ripple": "XRP", "dogecoin": "DOGE", "litecoin": "LTC", "polkadot": "DOT"}
+
+RETRY_BASE_DELAY = 0.5  # Seconds; backoff is full-jitter exponential from here
+RETRY_MAX_DELAY = 8.0
+RETRY_DEADLINE = 12.0  # Total seconds a call may spend waiting between retries
+BREAKER_FAILURE_THRESHOLD = 3  # Consecutive failed calls before a host's circuit opens
+BREAKER_RESET_TIMEOUT = 30.0  # Seconds an open circuit fails fast before letting one trial call through
+LAST_GOOD_MAX_ENTRIES = 512  # Most recent successful results kept for serve_stale fallbacks
+RESPONSE_CACHE_PATH = os.path.join(DATA_DIR, "response_cache.db")
+RESPONSE_CACHE_MAX_ENTRIES = 512  # In-memory LRU tier; the SQLite tier is bounded by TTL pruning
+RESPONSE_CACHE_PRUNE_INTERVAL = 600  # Seconds between sweeps of expired SQLite rows, done from store()
+# Per-source (fresh, stale) TTLs in seconds. Fresh entries are served as-is, stale ones are served
+# immediately while a background refresh runs, and anything older is refetched before returning.
+CACHE_TTLS = {
+    "prices": (PRICE_CACHE_TTL, 10 * 60),
+    "weather": (10 * 60, 60 * 60),
+    "news": (15 * 60, 6 * 3600),
+    "geocode": (30 * 86400, 365 * 86400),  # City coordinates practically never change
+}
+WEATHER_BOARD_WORKERS = 32  # Concurrent city lookups; also the size of the pooled weather session
+
+# API Endpoints
+COINGECKO_API_URL = "https://api.coingecko.com/api/v3/simple/price"
+OPENWEATHER_API_URL = "http://api.openweathermap.org/data/2.5/weather"
+OPENWEATHER_GEOCODE_URL = "http://api.openweathermap.org/geo/1.0/direct"
+NEWS_API_URL = "https://newsapi.org/v2/top-headlines"
+
+
+# --- 1. Configuration & API Key Loading ---
+def get_secret(name: str) -> Optional[str]:
+    """Read a secret; a missing secrets file, missing key or 'YOUR_...' placeholder all count as unset."""
+    try:
+        value = st.secrets.get(name)
+    except FileNotFoundError:
+        return None
+    if not value or str(value).startswith("YOUR_"):
+        return None
+    return value
+
+
+@st.cache_resource
+def get_process_profile() -> Dict[str, Any]:
+    """Timings that describe this server process: its first (cold) run and each integration's first load."""
+    return {"cold_start": None, "integrations": {}}
+
+@st.cache_resource
+def get_integration_errors() -> Dict[str, str]:
+    """Integration name -> why its loader failed, for the UI to show next to the affected panel."""
+    return {}
+
+class IntegrationUnavailable(Exception):
+    """An optional integration is missing credentials or failed to load."""
+    pass
+
+# Heavy or credentialed integrations, loaded on first use. name -> label, required secrets, cached loader.
+INTEGRATIONS: Dict[str, Dict[str, Any]] = {}
+
+def integration(name: str, label: str, secrets: tuple = ()):
+    """Register ``loader`` as a lazily initialised, process-wide integration."""
+    def decorator(loader: Callable) -> Callable:
+        @wraps(loader)
+        def timed_loader():
+            started = time.perf_counter()
+            try:
+                return loader()
+            finally:
+                get_process_profile()["integrations"][label] = time.perf_counter() - started
+        INTEGRATIONS[name] = {"label": label, "secrets": list(secrets), "loader": st.cache_resource(timed_loader)}
+        return INTEGRATIONS[name]["loader"]
+    return decorator
+
+def missing_secrets(name: str) -> List[str]:
+    return [secret for secret in INTEGRATIONS[name]["secrets"] if not get_secret(secret)]
+
+def get_integration(name: str) -> Any:
+    """Load (once per process) and return an integration, or raise IntegrationUnavailable."""
+    spec = INTEGRATIONS[name]
+    missing = missing_secrets(name)
+    if missing:
+        raise IntegrationUnavailable(f"{spec['label']} is not configured. "
+                                     f"Set {', '.join(missing)} in .streamlit/secrets.toml.")
+    return spec["loader"]()
+
+@integration("llm", "Google Gemini", secrets=("GEMINI_API_KEY",))
+def load_llm_model():
+    import google.generativeai as genai
+    endpoint = get_secret("GEMINI_API_ENDPOINT")  # e.g. "http://127.0.0.1:8091" for a local stand-in
+    if endpoint:
+        genai.configure(api_key=get_secret("GEMINI_API_KEY"), transport="rest",
+                        client_options={"api_endpoint": endpoint})
+    else:
+        genai.configure(api_key=get_secret("GEMINI_API_KEY"))
+    return genai.GenerativeModel(GEMINI_MODEL_NAME)
+
+@integration("pdf", "PDF reader (PyPDF2)")
+def load_pdf_library():
+    import PyPDF2
+    return PyPDF2
+
+@integration("smtp", "Gmail SMTP", secrets=("GMAIL_USER", "GMAIL_APP_PASSWORD"))
+def load_smtp_config():
+    # SMTP_SERVER / SMTP_PORT / SMTP_USE_SSL secrets override the Gmail defaults, e.g. to point at a
+    # local test server such as `python -m aiosmtpd -n -l localhost:8025` with SMTP_USE_SSL = false.
+    try:
+        use_ssl = st.secrets.get("SMTP_USE_SSL", SMTP_USE_SSL)  # Read directly: get_secret treats False as unset
+    except FileNotFoundError:
+        use_ssl = SMTP_USE_SSL
+    return {"server": get_secret("SMTP_SERVER") or SMTP_SERVER, "port": int(get_secret("SMTP_PORT") or SMTP_PORT),
+            "use_ssl": str(use_ssl).lower() not in ("false", "0", "no"),
+            "user": get_secret("GMAIL_USER"), "password": get_secret("GMAIL_APP_PASSWORD")}
+
+
+# --- 2. Google Drive Authentication Setup (for PyDrive2) ---
+@integration("drive", "Google Drive")
+def init_google_drive():
+    get_integration_errors().pop("drive", None)
+    try:
+        from pydrive2.auth import GoogleAuth
+        from pydrive2.drive import GoogleDrive
+
+        gauth = GoogleAuth('settings.yaml')
+        gauth.LoadCredentialsFile("creds.json")
+
+        if gauth.credentials is None:
+            logger.warning("Google Drive authentication required. A browser window will open for initial setup.")
+            gauth.LocalWebserverAuth()
+        elif gauth.access_token_expired:
+            gauth.Refresh()
+        else:
+            gauth.Authorize()
+
+        gauth.SaveCredentialsFile("creds.json")
+        return GoogleDrive(gauth)
+    except Exception as e:
+        message = (f"Google Drive authentication failed: {e}. "
+                   "Ensure 'client_secrets.json' is in the root directory, "
+                   "Google Drive API is enabled in Google Cloud Console, "
+                   "and test user is added to OAuth consent screen (if applicable).")
+        logger.error(message)
+        get_integration_errors()["drive"] = message  # Shown by the Drive panels; the failed load stays cached
+        return None
+
+def get_drive():
+    """The authenticated Drive client, authenticating on first use; None if that failed."""
+    return get_integration("drive")
+
+def drive_unavailable_message() -> str:
+    """Why Drive is unavailable: the recorded authentication failure, or a generic hint."""
+    return get_integration_errors().get(
+        "drive", "Google Drive not authenticated. Please restart the app and ensure credentials are set up.")
+
+
+
+# --- 3. Function Definitions for Automation Modules ---
+
+class APIError(Exception):
+    """Custom exception for API-related errors."""
+    pass
+
+class CircuitOpenError(APIError):
+    """Raised instead of calling an upstream whose circuit breaker is open."""
+    pass
+
+def _histogram_percentile(hist: List[int], q: float, bounds: List[float] = LATENCY_BUCKETS_MS) -> Optional[float]:
+    """Estimate a percentile from bucket counts (one per bound plus overflow) by linear interpolation."""
+    total = sum(hist)
+    if not total:
+        return None
+    rank = q * total
+    cumulative = 0
+    lower = 0.0
+    for i, count in enumerate(hist):
+        upper = bounds[i] if i < len(bounds) else lower
+        if count and cumulative + count >= rank:
+            return lower + (upper - lower) * (rank - cumulative) / count
+        cumulative += count
+        lower = upper
+    return lower
+
+class Metrics:
+    """In-memory timing spans, error tallies and labelled counters shared by the whole process.
+
+    Each span name keeps a SPAN_BUCKETS_MS histogram, so percentiles cost the same no matter how
+    many calls were made. Only the last METRICS_RATE_WINDOW seconds of call times are kept, for rates.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spans: Dict[str, Dict[str, Any]] = {}
+        self.counters: collections.Counter = collections.Counter()  # (name, ((label, value), ...)) -> total
+
+    def observe(self, name: str, seconds: float, error: bool = False):
+        now = time.time()
+        bucket = bisect.bisect_left(SPAN_BUCKETS_MS, seconds * 1000)
+        with self._lock:
+            span = self._spans.get(name)
+            if span is None:
+                span = self._spans[name] = {"calls": 0, "errors": 0, "seconds": 0.0,
+                                            "hist": [0] * (len(SPAN_BUCKETS_MS) + 1), "recent": collections.deque()}
+            span["calls"] += 1
+            span["errors"] += error
+            span["seconds"] += seconds
+            span["hist"][bucket] += 1
+            span["recent"].append((now, error))
+            while span["recent"][0][0] < now - METRICS_RATE_WINDOW:
+                span["recent"].popleft()
+
+    @contextmanager
+    def span(self, name: str):
+        """Time the enclosed block; an exception escaping it counts as an error."""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.observe(name, time.perf_counter() - started, error=True)
+            raise
+        self.observe(name, time.perf_counter() - started)
+
+    def increment(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            self.counters[(name, tuple(sorted(labels.items())))] += value
+
+    def counter_totals(self) -> List[tuple]:
+        """``((name, labels), total)`` pairs sorted by name, copied under the lock."""
+        with self._lock:
+            return sorted(self.counters.items())
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """One row per span: totals, per-minute rates over the recent window, and latency percentiles."""
+        cutoff = time.time() - METRICS_RATE_WINDOW
+        rows = []
+        with self._lock:
+            for name, span in self._spans.items():
+                recent = [error for ts, error in span["recent"] if ts >= cutoff]
+                rows.append({
+                    "name": name, "calls": span["calls"], "errors": span["errors"],
+                    "error_rate": span["errors"] / span["calls"],
+                    "calls_per_min": len(recent) * 60 / METRICS_RATE_WINDOW,
+                    "recent_error_rate": sum(recent) / len(recent) if recent else 0.0,
+                    "total_s": span["seconds"], "mean_ms": span["seconds"] * 1000 / span["calls"],
+                    **{f"p{int(q * 100)}_ms": _histogram_percentile(span["hist"], q, SPAN_BUCKETS_MS)
+                       for q in (0.5, 0.95, 0.99)},
+                })
+        return sorted(rows, key=lambda row: row["total_s"], reverse=True)
+
+    def prometheus_text(self) -> str:
+        """Spans as histograms and counters as ``dashboard_<name>_total``, in Prometheus text format."""
+        lines = ["# HELP dashboard_span_duration_seconds Time spent in instrumented functions and external calls.",
+                 "# TYPE dashboard_span_duration_seconds histogram"]
+        with self._lock:
+            spans = {name: dict(span, hist=list(span["hist"])) for name, span in sorted(self._spans.items())}
+        for name, span in spans.items():
+            label = _prometheus_labels(span=name)
+            for bound, cumulative in zip(SPAN_BUCKETS_MS, itertools.accumulate(span["hist"])):
+                lines.append(f"dashboard_span_duration_seconds_bucket{_prometheus_labels(span=name, le=bound / 1000)} "
+                             f"{cumulative}")
+            lines.append(f'dashboard_span_duration_seconds_bucket{_prometheus_labels(span=name, le="+Inf")} '
+                         f"{span['calls']}")
+            lines.append(f"dashboard_span_duration_seconds_sum{label} {span['seconds']}")
+            lines.append(f"dashboard_span_duration_seconds_count{label} {span['calls']}")
+        lines += ["# HELP dashboard_span_errors_total Instrumented calls that raised.",
+                  "# TYPE dashboard_span_errors_total counter"]
+        lines += [f"dashboard_span_errors_total{_prometheus_labels(span=name)} {span['errors']}"
+                  for name, span in spans.items()]
+        for name, group in itertools.groupby(self.counter_totals(), key=lambda item: item[0][0]):
+            lines.append(f"# TYPE dashboard_{name}_total counter")
+            lines += [f"dashboard_{name}_total{_prometheus_labels(**dict(labels))} {value}"
+                      for (_, labels), value in group]
+        return "\n".join(lines) + "\n"
+
+def _prometheus_labels(**labels) -> str:
+    if not labels:
+        return ""
+    def escape(value: Any) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels.items()) + "}"
+
+@st.cache_resource
+def get_metrics() -> Metrics:
+    return Metrics()
+
+metrics = get_metrics()
+
+def instrumented(name: Optional[str] = None):
+    """Decorator recording a span for every call, named after the function unless ``name`` is given."""
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with metrics.span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+_RETRYABLE_EXCEPTION_NAMES = {"ResourceExhausted", "ServiceUnavailable", "DeadlineExceeded",
+                              "InternalServerError", "TooManyRequests"}  # google.api_core errors
+
+def _exception_chain(exc: BaseException):
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        yield exc
+        exc = exc.__cause__ or exc.__context__
+
+def is_retryable(exc: BaseException) -> bool:
+    """Transient failures (timeouts, dropped connections, 429, 5xx) are retryable; bad input and 4xx are not."""
+    for e in _exception_chain(exc):
+        if isinstance(e, CircuitOpenError):
+            return False
+        if isinstance(e, requests.exceptions.HTTPError) and e.response is not None:
+            return e.response.status_code == 429 or e.response.status_code >= 500
+        if isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                          ConnectionError, TimeoutError, http.client.RemoteDisconnected)):
+            return True
+        if type(e).__name__ in _RETRYABLE_EXCEPTION_NAMES:
+            return True
+    return False
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """Seconds requested by a Retry-After header anywhere in the exception chain, if any."""
+    for e in _exception_chain(exc):
+        response = getattr(e, "response", None)
+        value = response.headers.get("Retry-After") if response is not None and hasattr(response, "headers") else None
+        if not value:
+            continue
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                return None
+    return None
+
+class CircuitBreaker:
+    """Per-host breaker: opens after repeated failures, fails fast, then lets a single trial call through."""
+
+    def __init__(self, host: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"  # This caller is the trial; everyone else keeps failing fast
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def retry_in(self) -> float:
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+@st.cache_resource
+def get_resilience_registry() -> Dict[str, Any]:
+    """Process-wide circuit breakers (by host) and last good results (by call)."""
+    return {"lock": threading.Lock(), "breakers": {}, "last_good": collections.OrderedDict()}
+
+def _remember_last_good(key: tuple, result: Any):
+    """Keep ``result`` for serve_stale fallbacks, evicting the least recently used beyond LAST_GOOD_MAX_ENTRIES."""
+    registry = get_resilience_registry()
+    with registry["lock"]:
+        registry["last_good"][key] = result
+        registry["last_good"].move_to_end(key)
+        while len(registry["last_good"]) > LAST_GOOD_MAX_ENTRIES:
+            registry["last_good"].popitem(last=False)
+
+def _last_good(key: tuple) -> tuple:
+    """(found, result) of the last successful call with ``key``."""
+    registry = get_resilience_registry()
+    with registry["lock"]:
+        if key not in registry["last_good"]:
+            return False, None
+        registry["last_good"].move_to_end(key)
+        return True, registry["last_good"][key]
+
+_stale_fallbacks = threading.local()
+
+@contextmanager
+def detect_stale_fallback():
+    """Yield a dict whose "stale" flag is set if a serve_stale call in the block returned its last good result.
+
+    Callers use it to avoid caching or recording a fallback as if it had just been fetched.
+    """
+    outer = getattr(_stale_fallbacks, "outcome", None)
+    outcome = {"stale": False}
+    _stale_fallbacks.outcome = outcome
+    try:
+        yield outcome
+    finally:
+        _stale_fallbacks.outcome = outer
+        if outer is not None and outcome["stale"]:
+            outer["stale"] = True
+
+def _serve_last_good(key: tuple, target: str) -> tuple:
+    """(found, result) for a failed serve_stale call, flagging the enclosing detect_stale_fallback block."""
+    found, stale = _last_good(key)
+    if found:
+        metrics.increment("stale_results", target=target)
+        outcome = getattr(_stale_fallbacks, "outcome", None)
+        if outcome is not None:
+            outcome["stale"] = True
+    return found, stale
+
+def circuit_breaker_for(host: str) -> CircuitBreaker:
+    registry = get_resilience_registry()
+    with registry["lock"]:
+        if host not in registry["breakers"]:
+            registry["breakers"][host] = CircuitBreaker(host)
+        return registry["breakers"][host]
+
+def unhealthy_hosts() -> List[CircuitBreaker]:
+    registry = get_resilience_registry()
+    with registry["lock"]:
+        return [b for b in registry["breakers"].values() if b.state != "closed"]
+
+def retry_on_failure(max_retries: int = 3, delay: float = RETRY_BASE_DELAY, deadline: float = RETRY_DEADLINE,
+                     host: Optional[str] = None, serve_stale: bool = False):
+    """Decorator to retry transient failures with jittered exponential backoff.
+
+    Non-retryable errors fail immediately, Retry-After is honoured, and no retry starts past
+    ``deadline``. With ``host``, calls go through that host's circuit breaker; with
+    ``serve_stale``, the last good result for the same arguments is returned when the call fails, and
+    flagged to any enclosing ``detect_stale_fallback()`` block.
+    """
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            breaker = circuit_breaker_for(host) if host else None
+            key = (func.__qualname__, repr(args), repr(sorted(kwargs.items())))
+            target = host or func.__name__
+            if breaker and not breaker.allow():
+                metrics.increment("circuit_rejections", target=target)
+                found, stale = _serve_last_good(key, target) if serve_stale else (False, None)
+                if found:
+                    return stale
+                raise CircuitOpenError(f"{host} is failing; skipping calls for {breaker.retry_in():.0f}s")
+
+            started = time.monotonic()
+            last_exception = None
+            for attempt in range(max_retries):
+                try:
+                    result = func(*args, **kwargs)
+                except Exception as e:
+                    last_exception = e
+                    if not is_retryable(e) or attempt == max_retries - 1:
+                        break
+                    wait = retry_after_seconds(e)
+                    if wait is None:
+                        wait = random.uniform(0, min(RETRY_MAX_DELAY, delay * 2 ** attempt))
+                    if time.monotonic() - started + wait > deadline:
+                        break
+                    metrics.increment("retries", target=target)
+                    time.sleep(wait)
+                else:
+                    if breaker:
+                        breaker.record_success()
+                    if serve_stale:
+                        _remember_last_good(key, result)
+                    return result
+
+            if breaker:
+                # Only upstream trouble counts; a bad city or API key means the host answered, which also
+                # resolves a half-open trial instead of leaving the circuit stuck.
+                if is_retryable(last_exception):
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+            found, stale = _serve_last_good(key, target) if serve_stale else (False, None)
+            if found:
+                return stale
+            raise last_exception
+        return wrapper
+    return decorator
+
+@retry_on_failure(max_retries=3, host=urlsplit(COINGECKO_API_URL).hostname, serve_stale=True)
+@instrumented("http:coingecko")
+def fetch_crypto_prices(asset_ids: List[str], vs_currency: str = PRICE_VS_CURRENCY) -> Dict[str, float]:
+    """Get current prices for several CoinGecko asset IDs in a single request."""
+    try:
+        r = requests.get(COINGECKO_API_URL,
+                         params={"ids": ",".join(asset_ids), "vs_currencies": vs_currency},
+                         timeout=10)
+        r.raise_for_status()
+        data = r.json()
+        if not isinstance(data, dict):
+            raise APIError("Invalid response format from CoinGecko API")
+        # Unknown IDs are simply absent from the response.
+        return {asset: float(data[asset][vs_currency])
+                for asset in asset_ids if vs_currency in data.get(asset, {})}
+    except requests.exceptions.RequestException as e:
+        raise APIError(f"Network error fetching crypto prices: {e}")
+    except (KeyError, ValueError, TypeError) as e:
+        raise APIError(f"Error parsing crypto price data: {e}")
+
+class ResponseCache:
+    """Process-wide two-tier cache for upstream responses, with stale-while-revalidate.
+
+    A bounded in-memory LRU sits in front of a SQLite table that survives restarts. Values must be
+    JSON-serialisable. Freshness is decided per source from CACHE_TTLS, and hit, miss, stale and
+    eviction counts are kept per source.
+    """
+
+    def __init__(self, path: str = RESPONSE_CACHE_PATH, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_entries = max_entries
+        self.counters: collections.Counter = collections.Counter()  # (source, event) -> count
+        self.refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-refresh")
+        self._memory: collections.OrderedDict = collections.OrderedDict()  # key -> (value, fetched_at)
+        self._refreshing: set = set()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS responses "
+                               "(key TEXT PRIMARY KEY, source TEXT, value TEXT, fetched_at REAL)")
+            self._prune()
+
+    def _prune(self):
+        """Delete rows past their source's stale TTL; caller holds the lock inside a transaction."""
+        now = time.time()
+        for source, (_, stale_ttl) in CACHE_TTLS.items():
+            self._conn.execute("DELETE FROM responses WHERE source = ? AND fetched_at < ?",
+                               (source, now - stale_ttl))
+        self._pruned_at = now
+
+    @staticmethod
+    def _key(source: str, key: Any) -> str:
+        return json.dumps([source, key], sort_keys=True, default=str)
+
+    def _remember(self, key: str, entry: tuple, source: str):
+        """Insert into the LRU tier; caller holds the lock."""
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            evicted_key, _ = self._memory.popitem(last=False)
+            self.counters[(json.loads(evicted_key)[0], "evictions")] += 1
+
+    def lookup(self, source: str, key: Any) -> tuple:
+        """Return ``(value, "fresh" | "stale")``, or ``(None, None)`` when there is nothing usable."""
+        cache_key = self._key(source, key)
+        fresh_ttl, stale_ttl = CACHE_TTLS[source]
+        with self._lock:
+            entry = self._memory.get(cache_key)
+            tier = "memory"
+            if entry is not None:
+                self._memory.move_to_end(cache_key)
+            else:
+                row = self._conn.execute("SELECT value, fetched_at FROM responses WHERE key = ?",
+                                         (cache_key,)).fetchone()
+                if row:
+                    entry, tier = (json.loads(row[0]), row[1]), "disk"
+                    self._remember(cache_key, entry, source)
+            age = time.time() - entry[1] if entry is not None else None
+            if age is not None and age <= fresh_ttl:
+                self.counters[(source, f"{tier}_hits")] += 1
+                return entry[0], "fresh"
+            if age is not None and age <= stale_ttl:
+                self.counters[(source, "stale_hits")] += 1
+                return entry[0], "stale"
+            self.counters[(source, "misses")] += 1
+            return None, None
+
+    def store(self, source: str, key: Any, value: Any):
+        cache_key = self._key(source, key)
+        fetched_at = time.time()
+        with self._lock, self._conn:
+            self._remember(cache_key, (value, fetched_at), source)
+            self._conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                               (cache_key, source, json.dumps(value), fetched_at))
+            if fetched_at - self._pruned_at >= RESPONSE_CACHE_PRUNE_INTERVAL:
+                self._prune()
+
+    def refresh_in_background(self, source: str, key: Any, fetch: Callable[[], Any]):
+        """Refetch one entry off the request path, at most once at a time per key."""
+        cache_key = self._key(source, key)
+        with self._lock:
+            if cache_key in self._refreshing:
+                return
+            self._refreshing.add(cache_key)
+
+        def refresh():
+            try:
+                with detect_stale_fallback() as outcome:
+                    value = fetch()
+                if outcome["stale"]:  # Upstream failed; keep the cached entry's age rather than renewing it
+                    self.counters[(source, "refresh_errors")] += 1
+                else:
+                    self.store(source, key, value)
+                    self.counters[(source, "refreshes")] += 1
+            except Exception:  # The stale value stays in place; the next lookup will try again
+                self.counters[(source, "refresh_errors")] += 1
+            finally:
+                with self._lock:
+                    self._refreshing.discard(cache_key)
+        self.refresh_executor.submit(refresh)
+
+    def get_or_fetch(self, source: str, key: Any, fetch: Callable[[], Any]) -> Any:
+        value, state = self.lookup(source, key)
+        if state == "stale":
+            self.refresh_in_background(source, key, fetch)
+        if state is not None:
+            return value
+        with detect_stale_fallback() as outcome:
+            value = fetch()
+        if not outcome["stale"]:
+            self.store(source, key, value)
+        return value
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Counters grouped by source, plus the current size of the memory tier."""
+        grouped: Dict[str, Dict[str, int]] = {}
+        with self._lock:
+            for (source, event), count in self.counters.items():
+                grouped.setdefault(source, {})[event] = count
+            grouped["_memory"] = {"entries": len(self._memory), "capacity": self.max_entries}
+        return grouped
+
+@st.cache_resource
+def get_response_cache() -> ResponseCache:
+    return ResponseCache()
+
+def cached_response(source: str):
+    """Decorator serving ``func`` through the shared response cache, keyed by its arguments."""
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = [func.__qualname__, repr(args), repr(sorted(kwargs.items()))]
+            return get_response_cache().get_or_fetch(source, key, lambda: func(*args, **kwargs))
+        return wrapper
+    return decorator
+
+class PriceEngine:
+    """Batched, de-duplicated crypto price lookups shared by every session.
+
+    Each (asset, currency) price lives in the shared response cache under the "prices" source; stale
+    prices are returned at once and refreshed in the background. Assets that another session is
+    already fetching are waited on rather than requested again, so any number of simultaneous
+    refreshes collapse into a single upstream call.
+    """
+
+    def __init__(self, cache: ResponseCache):
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._in_flight: Dict[tuple, Future] = {}  # (asset, currency) -> batch future
+
+    def get_prices(self, assets: List[str], vs_currency: str = PRICE_VS_CURRENCY) -> Dict[str, float]:
+        assets = list(dict.fromkeys(assets))
+        prices: Dict[str, float] = {}
+        waiting: Dict[str, Future] = {}
+        to_fetch: List[str] = []
+        to_refresh: List[str] = []
+        with self._lock:
+            for asset in assets:
+                value, state = self.cache.lookup("prices", [asset, vs_currency])
+                in_flight = (asset, vs_currency) in self._in_flight
+                if state is not None:
+                    prices[asset] = value
+                    if state == "stale" and not in_flight:
+                        to_refresh.append(asset)
+                elif in_flight:
+                    waiting[asset] = self._in_flight[(asset, vs_currency)]
+                else:
+                    to_fetch.append(asset)
+            batch = self._claim(to_fetch, vs_currency)
+            refresh_batch = self._claim(to_refresh, vs_currency)
+
+        if to_refresh:
+            self.cache.refresh_executor.submit(self._fetch_quietly, to_refresh, vs_currency, refresh_batch)
+        if to_fetch:
+            prices.update(self._fetch(to_fetch, vs_currency, batch))
+        for asset, future in waiting.items():
+            result = future.result()
+            if asset in result:
+                prices[asset] = result[asset]
+        return {asset: prices[asset] for asset in assets if asset in prices}
+
+    def _claim(self, assets: List[str], vs_currency: str) -> Future:
+        """Mark ``assets`` as being fetched; caller holds the lock."""
+        batch = Future()
+        for asset in assets:
+            self._in_flight[(asset, vs_currency)] = batch
+        return batch
+
+    def _release(self, assets: List[str], vs_currency: str):
+        with self._lock:
+            for asset in assets:
+                self._in_flight.pop((asset, vs_currency), None)
+
+    def _fetch(self, assets: List[str], vs_currency: str, batch: Future) -> Dict[str, float]:
+        try:
+            with detect_stale_fallback() as outcome:
+                fetched = fetch_crypto_prices(assets, vs_currency)
+            if not outcome["stale"]:  # A fallback is neither a fresh cache entry nor a new history sample
+                for asset, price in fetched.items():
+                    self.cache.store("prices", [asset, vs_currency], price)
+                get_price_history().record(fetched, vs_currency)
+        except Exception as e:
+            batch.set_exception(e)  # Waiters on this batch must never be left blocked
+            raise
+        else:
+            batch.set_result(fetched)
+            return fetched
+        finally:
+            self._release(assets, vs_currency)
+
+    def _fetch_quietly(self, assets: List[str], vs_currency: str, batch: Future):
+        try:
+            self._fetch(assets, vs_currency, batch)
+        except Exception:  # Background refresh; the stale prices already returned stay cached
+            pass
+
+@st.cache_resource
+def get_price_engine() -> PriceEngine:
+    return PriceEngine(get_response_cache())
+
+@instrumented()
+def get_crypto_prices(assets: List[str]) -> Dict[str, float]:
+    """Get prices for any number of assets through the shared price engine; they are then polled in the background."""
+    get_price_history().track(assets)
+    return get_price_engine().get_prices(assets, PRICE_VS_CURRENCY)
+
+def parse_asset_list(raw: str) -> List[str]:
+    """Turn a comma-separated list of CoinGecko IDs into a clean list."""
+    return list(dict.fromkeys(a.strip().lower() for a in raw.split(",") if a.strip()))
+
+def crypto_display_name(asset: str) -> str:
+    return CRYPTO_SYMBOLS.get(asset, asset.replace("-", " ").title())
+
+class DriveIndex:
+    """Local index of Drive folder IDs and files uploaded by this app.
+
+    Loaded once per process and kept current through the Drive changes feed (a page token, not a
+    listing), so resolving a known folder costs no API calls at all. Folder creation is serialised
+    so concurrent backups cannot both create the same folder.
+    """
+
+    def __init__(self, path: str = DRIVE_INDEX_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            data = {}
+        self.folders: Dict[str, str] = data.get("folders", {})  # "<parent_id>/<title>" -> folder id
+        self.files: Dict[str, Dict[str, Any]] = data.get("files", {})  # file id -> title, parent, size
+        self.page_token: Optional[str] = data.get("page_token")
+        self.refreshed_at = 0.0
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path + ".tmp", "w") as f:
+            json.dump({"folders": self.folders, "files": self.files, "page_token": self.page_token}, f)
+        os.replace(self.path + ".tmp", self.path)
+
+    def refresh(self, force: bool = False):
+        """Apply Drive changes since the stored page token, at most every DRIVE_INDEX_REFRESH_INTERVAL seconds."""
+        with self._lock:
+            if not force and time.time() - self.refreshed_at < DRIVE_INDEX_REFRESH_INTERVAL:
+                return
+            service = get_drive().auth.service
+            if self.page_token is None:
+                self.page_token = service.changes().getStartPageToken().execute()["startPageToken"]
+            else:
+                token = self.page_token
+                while token:
+                    page = service.changes().list(
+                        pageToken=token, includeDeleted=True, maxResults=1000,
+                        fields="nextPageToken,newStartPageToken,"
+                               "items(fileId,deleted,file(id,title,mimeType,parents(id),labels/trashed,fileSize))",
+                    ).execute()
+                    for change in page.get("items", []):
+                        self._apply_change(change)
+                    token = page.get("nextPageToken")
+                    self.page_token = page.get("newStartPageToken", self.page_token)
+            self.refreshed_at = time.time()
+            self._save()
+
+    def _apply_change(self, change: Dict[str, Any]):
+        file_id = change["fileId"]
+        file = change.get("file") or {}
+        gone = change.get("deleted") or file.get("labels", {}).get("trashed")
+        for key in [k for k, v in self.folders.items() if v == file_id]:
+            del self.folders[key]
+        self.files.pop(file_id, None)
+        if gone or not file:
+            return
+        parents = [p["id"] for p in file.get("parents", [])] or ["root"]
+        if file.get("mimeType") == "application/vnd.google-apps.folder":
+            for parent in parents:
+                self.folders[f"{parent}/{file['title']}"] = file_id
+        elif any(parent in self.folders.values() for parent in parents):
+            self.record_file(file_id, file["title"], parents[0], int(file.get("fileSize", 0)), save=False)
+
+    def folder_id(self, title: str, parent_id: str = "root", create: bool = True) -> str:
+        """Return the ID of folder ``title`` under ``parent_id``, creating it if it does not exist.
+
+        With ``create=False`` a missing folder raises APIError instead.
+        """
+        key = f"{parent_id}/{title}"
+        with self._lock:
+            self.refresh()  # A no-op unless the refresh interval has passed
+            if key not in self.folders:
+                drive = get_drive()
+                escaped = title.replace("\\", "\\\\").replace("'", "\\'")
+                found = drive.ListFile({'q': f"title = '{escaped}' and '{parent_id}' in parents and "
+                                             "mimeType='application/vnd.google-apps.folder' and trashed=false"}).GetList()
+                if found:
+                    self.folders[key] = found[0]['id']
+                elif not create:
+                    raise APIError(f"No Google Drive folder named '{title}'")
+                else:
+                    folder = drive.CreateFile({'title': title, 'mimeType': 'application/vnd.google-apps.folder',
+                                               'parents': [{'id': parent_id}]})
+                    folder.Upload()
+                    self.folders[key] = folder['id']
+                self._save()
+            return self.folders[key]
+
+    def record_file(self, file_id: str, title: str, parent_id: str, size: int = 0, save: bool = True):
+        with self._lock:
+            self.files[file_id] = {"title": title, "parent": parent_id, "size": size}
+            if save:
+                self._save()
+
+    def files_in(self, parent_id: str) -> Dict[str, Dict[str, Any]]:
+        """Indexed files directly inside ``parent_id``, keyed by file ID."""
+        with self._lock:
+            return {fid: meta for fid, meta in self.files.items() if meta["parent"] == parent_id}
+
+    def sync_folder(self, parent_id: str) -> Dict[str, Dict[str, Any]]:
+        """Replace the indexed files of ``parent_id`` with a Drive listing of it and return them.
+
+        The change feed only covers files uploaded since the index was built, so this picks up older
+        backups and blobs, and files uploaded from other machines.
+        """
+        items = get_drive().ListFile({'q': f"'{parent_id}' in parents and trashed=false and "
+                                           "mimeType != 'application/vnd.google-apps.folder'"}).GetList()
+        with self._lock:
+            for file_id in [fid for fid, meta in self.files.items() if meta["parent"] == parent_id]:
+                del self.files[file_id]
+            for item in items:
+                self.record_file(item['id'], item['title'], parent_id, int(item.get('fileSize', 0)), save=False)
+            self._save()
+            return self.files_in(parent_id)
+
+@st.cache_resource
+def get_drive_index() -> DriveIndex:
+    return DriveIndex()
+
+def find_or_create_drive_folder(title: str, parent_id: str = "root") -> str:
+    """Return the ID of the Drive folder called ``title`` under ``parent_id``, creating it if missing."""
+    return get_drive_index().folder_id(title, parent_id)
+
+def _dos_datetime(timestamp: float) -> tuple:
+    t = time.localtime(max(timestamp, 315532800))  # ZIP timestamps cannot predate 1980
+    return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday)
+
+@instrumented("zip:deflate_block")
+def _deflate_block(data: bytes, zdict: bytes, last: bool) -> bytes:
+    """Raw-deflate one block so it can be concatenated with its neighbours into a single stream."""
+    if zdict:
+        compressor = zlib.compressobj(BACKUP_COMPRESSION_LEVEL, zlib.DEFLATED, -15, zdict=zdict)
+    else:
+        compressor = zlib.compressobj(BACKUP_COMPRESSION_LEVEL, zlib.DEFLATED, -15)
+    # A sync flush ends on a byte boundary without setting BFINAL, so only the last block terminates the stream.
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+def _zip_local_header(entry: Dict[str, Any]) -> bytes:
+    name = entry["name"].encode("utf-8")
+    extra = struct.pack("<HHQQ", 1, 16, 0, 0) if entry["zip64"] else b""
+    sizes = 0xFFFFFFFF if entry["zip64"] else 0
+    return struct.pack("<IHHHHHIIIHH", 0x04034b50, 45 if entry["zip64"] else 20, 0x0808, 8,
+                       entry["dos_time"], entry["dos_date"], 0, sizes, sizes, len(name), len(extra)) + name + extra
+
+def _zip_data_descriptor(entry: Dict[str, Any]) -> bytes:
+    if entry["zip64"]:
+        return struct.pack("<IIQQ", 0x08074b50, entry["crc"], entry["compress_size"], entry["size"])
+    if entry["compress_size"] > 0xFFFFFFFF or entry["size"] > 0xFFFFFFFF:
+        raise APIError(f"'{entry['name']}' grew past 4 GiB while it was being archived")
+    return struct.pack("<IIII", 0x08074b50, entry["crc"], entry["compress_size"], entry["size"])
+
+def _zip_central_directory(entries: List[Dict[str, Any]], cd_offset: int) -> bytes:
+    records = []
+    for entry in entries:
+        name = entry["name"].encode("utf-8")
+        zip64_fields = []
+        size, compress_size, offset = entry["size"], entry["compress_size"], entry["offset"]
+        if size >= 0xFFFFFFFF:
+            zip64_fields.append(size)
+            size = 0xFFFFFFFF
+        if compress_size >= 0xFFFFFFFF:
+            zip64_fields.append(compress_size)
+            compress_size = 0xFFFFFFFF
+        if offset >= 0xFFFFFFFF:
+            zip64_fields.append(offset)
+            offset = 0xFFFFFFFF
+        extra = struct.pack(f"<HH{len(zip64_fields)}Q", 1, 8 * len(zip64_fields), *zip64_fields) if zip64_fields else b""
+        version = 45 if entry["zip64"] or zip64_fields else 20
+        records.append(struct.pack("<IHHHHHHIIIHHHHHII", 0x02014b50, (3 << 8) | version, version, 0x0808, 8,
+                                   entry["dos_time"], entry["dos_date"], entry["crc"], compress_size, size,
+                                   len(name), len(extra), 0, 0, 0, (entry["mode"] & 0xFFFF) << 16, offset)
+                       + name + extra)
+    central = b"".join(records)
+    count, size = len(entries), len(central)
+    trailer = b""
+    if count >= 0xFFFF or size >= 0xFFFFFFFF or cd_offset >= 0xFFFFFFFF:
+        zip64_eocd_offset = cd_offset + size
+        trailer += struct.pack("<IQHHIIQQQQ", 0x06064b50, 44, 45, 45, 0, 0, count, count, size, cd_offset)
+        trailer += struct.pack("<IIQI", 0x07064b50, 0, zip64_eocd_offset, 1)
+    trailer += struct.pack("<IHHHHIIH", 0x06054b50, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+                           min(size, 0xFFFFFFFF), min(cd_offset, 0xFFFFFFFF), 0)
+    return central + trailer
+
+def iter_parallel_zip(folder_path: str, block_size: int = BACKUP_BLOCK_SIZE) -> Any:
+    """Yield a ZIP archive of ``folder_path`` piece by piece while deflating blocks on every core.
+
+    Each file is cut into ``block_size`` blocks that are compressed independently, primed with the
+    previous 32 KiB as a dictionary like pigz, and concatenated into one valid deflate stream. Only a
+    bounded window of blocks is held in memory. A BACKUP_MANIFEST_NAME member recording every file's
+    size, CRC-32 and SHA-256 is appended last so restores can be verified.
+    """
+    workers = os.cpu_count() or 1
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="deflate")
+    pending: collections.deque = collections.deque()
+    entries: List[Dict[str, Any]] = []
+    offset = 0
+
+    def drain(limit: int):
+        nonlocal offset
+        while len(pending) > limit:
+            kind, entry, payload = pending.popleft()
+            if kind == "header":
+                entry["offset"] = offset
+                data = payload
+            elif kind == "data":
+                data = payload.result()
+                entry["compress_size"] += len(data)
+            else:
+                data = _zip_data_descriptor(entry)
+            offset += len(data)
+            yield data
+
+    def add_member(name: str, blocks, size_hint: int, mtime: float, mode: int):
+        dos_time, dos_date = _dos_datetime(mtime)
+        entry = {"name": name, "zip64": size_hint * 1.05 > 0xFFFFFFFF, "dos_time": dos_time, "dos_date": dos_date,
+                 "mode": mode, "crc": 0, "size": 0, "compress_size": 0, "offset": 0}
+        digest = hashlib.sha256()
+        pending.append(("header", entry, _zip_local_header(entry)))
+        zdict = b""
+        for block, last in blocks:
+            entry["crc"] = zlib.crc32(block, entry["crc"])
+            entry["size"] += len(block)
+            digest.update(block)
+            pending.append(("data", entry, executor.submit(_deflate_block, block, zdict, last)))
+            zdict = (zdict + block)[-32768:]
+            yield from drain(BACKUP_COMPRESSION_WINDOW * workers)
+        pending.append(("descriptor", entry, None))
+        entries.append(entry)
+        entry["sha256"] = digest.hexdigest()
+
+    def file_blocks(f):
+        block = f.read(block_size)
+        while True:
+            next_block = f.read(block_size) if block else b""
+            yield block, not next_block
+            if not next_block:
+                return
+            block = next_block
+
+    try:
+        for root, dirs, files in os.walk(folder_path):
+            dirs[:] = [d for d in dirs if os.path.normpath(os.path.relpath(os.path.join(root, d), folder_path))
+                       not in BACKUP_EXCLUDE_DIRS]
+            for file in files:
+                file_path = os.path.join(root, file)
+                arcname = os.path.relpath(file_path, folder_path).replace(os.sep, "/")
+                try:
+                    f = open(file_path, "rb")
+                except OSError:
+                    continue  # Unreadable or vanished since the walk listed it
+                with f:
+                    stat = os.fstat(f.fileno())
+                    yield from add_member(arcname, file_blocks(f), stat.st_size, stat.st_mtime, stat.st_mode)
+
+        manifest = json.dumps({e["name"]: {"size": e["size"], "crc32": e["crc"], "sha256": e["sha256"]}
+                               for e in entries}).encode("utf-8")
+        yield from add_member(BACKUP_MANIFEST_NAME, iter([(manifest, True)]), len(manifest), time.time(), 0o100644)
+        yield from drain(0)
+        yield _zip_central_directory(entries, offset)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+class ResumableUpload:
+    """Google Drive resumable upload fed from a stream of unknown length.
+
+    Bytes are sent in UPLOAD_CHUNK_SIZE pieces and only the unconfirmed part of the current chunk is
+    kept in memory. After a dropped connection or a 5xx, the session is asked how much it has, and
+    the upload continues from the last byte the server confirmed.
+    """
+
+    def __init__(self, metadata: Dict[str, Any], access_token: Callable[[], str],
+                 upload_url: Optional[str] = None, chunk_size: int = UPLOAD_CHUNK_SIZE,
+                 session: Optional[requests.Session] = None):
+        if chunk_size % (256 * 1024):
+            raise ValueError("chunk_size must be a multiple of 256 KiB")
+        self.metadata = metadata
+        self.access_token = access_token
+        self.upload_url = upload_url or DRIVE_UPLOAD_URL
+        self.chunk_size = chunk_size
+        self.session = session or requests.Session()
+        self.session_uri: Optional[str] = None
+        self.confirmed = 0  # Bytes the server has acknowledged
+        self.resumes = 0
+
+    def _headers(self, **extra) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.access_token()}", **extra}
+
+    @instrumented("drive:upload_start")
+    def start(self):
+        """Open the upload session, retrying 429s, 5xx and dropped connections like chunk sends."""
+        failures = 0
+        while True:
+            try:
+                r = self.session.post(f"{self.upload_url}?uploadType=resumable",
+                                      json=self.metadata, timeout=30,
+                                      headers=self._headers(**{"X-Upload-Content-Type": self.metadata.get(
+                                          "mimeType", "application/octet-stream")}))
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if failures >= UPLOAD_MAX_RETRIES:
+                    raise
+            else:
+                if (r.status_code != 429 and r.status_code < 500) or failures >= UPLOAD_MAX_RETRIES:
+                    r.raise_for_status()
+                    self.session_uri = r.headers["Location"]
+                    return
+            failures += 1
+            time.sleep(min(2 ** failures, 30))
+
+    def _handle(self, r: requests.Response) -> Optional[Dict[str, Any]]:
+        """Return the file resource when the upload is complete; otherwise record the confirmed offset."""
+        if r.status_code in (200, 201):
+            return r.json()
+        if r.status_code == 308:
+            confirmed = r.headers.get("Range")  # e.g. "bytes=0-524287"; absent when nothing has been stored yet
+            self.confirmed = int(confirmed.rsplit("-", 1)[1]) + 1 if confirmed else 0
+            return None
+        if r.status_code == 429 or r.status_code >= 500:
+            raise requests.exceptions.ConnectionError(f"Upload interrupted with HTTP {r.status_code}")
+        raise APIError(f"Upload rejected with HTTP {r.status_code}: {r.text[:200]}")
+
+    def _query_offset(self, total: Optional[int]) -> Optional[Dict[str, Any]]:
+        r = self.session.put(self.session_uri, timeout=30,
+                             headers=self._headers(**{"Content-Range": f"bytes */{total if total is not None else '*'}"}))
+        return self._handle(r)
+
+    def _send(self, buffer: bytearray, final: bool) -> Optional[Dict[str, Any]]:
+        """Send ``buffer`` (which starts at ``self.confirmed``) until the server holds all of it."""
+        base = self.confirmed
+        end = base + len(buffer)
+        total = end if final else None
+        failures = stalls = 0
+        while True:
+            before = self.confirmed
+            if before < base:
+                raise APIError("Upload session lost data that was already confirmed; restart the backup")
+            remaining = bytes(buffer[before - base:])
+            if not remaining and not final:
+                return None
+            content_range = f"bytes {before}-{end - 1}/{total or '*'}" if remaining else f"bytes */{total}"
+            try:
+                with metrics.span("drive:upload_chunk"):
+                    r = self.session.put(self.session_uri, data=remaining, timeout=60,
+                                         headers=self._headers(**{"Content-Range": content_range}))
+                    result = self._handle(r)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                failures += 1
+                if failures > UPLOAD_MAX_RETRIES:
+                    raise
+                time.sleep(min(2 ** failures, 30))
+                self.resumes += 1
+                try:
+                    result = self._query_offset(total)
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                    continue
+                if result is not None:
+                    return result
+                continue  # The failure is already counted; resend from the confirmed offset
+            if result is not None:
+                return result
+            if self.confirmed == before and remaining:
+                stalls += 1  # A 308 that accepted nothing; don't spin forever
+                if stalls > UPLOAD_MAX_RETRIES:
+                    raise APIError("Upload made no progress after repeated attempts")
+
+    def upload(self, stream) -> Dict[str, Any]:
+        """Upload every piece yielded by ``stream`` and return the created Drive file resource."""
+        if self.session_uri is None:
+            self.start()
+        buffer = bytearray()
+        for piece in stream:
+            buffer += piece
+            while len(buffer) >= self.chunk_size:
+                self._send(buffer[:self.chunk_size], final=False)
+                del buffer[:self.chunk_size]
+        result = self._send(buffer, final=True)
+        if result is None:
+            raise APIError("Upload finished without the server confirming the file")
+        return result
+
+def _drive_access_token() -> str:
+    drive = get_drive()
+    if drive.auth.access_token_expired:
+        drive.auth.Refresh()
+    return drive.auth.credentials.access_token
+
+@instrumented()
+def backup_folder_to_drive(folder_path=".", drive_folder_name="Automated_Backups"):
+    """Stream a ZIP of ``folder_path`` straight into a resumable Drive upload; nothing is written locally."""
+    drive = get_drive()
+    if not drive:
+        return drive_unavailable_message()
+    if not os.path.exists(folder_path):
+        return f"Error: Local folder '{folder_path}' does not exist."
+    now = dt_object.now().strftime("%Y%m%d_%H%M%S")
+    base_folder_name = os.path.basename(os.path.abspath(folder_path))
+    zip_title = f"backup_{base_folder_name}_{now}.zip"
+    try:
+        target_folder_id = find_or_create_drive_folder(drive_folder_name)
+        upload = ResumableUpload({"name": zip_title, "parents": [target_folder_id], "mimeType": "application/zip"},
+                                 _drive_access_token)
+        uploaded_bytes = 0
+
+        def counted(stream):
+            nonlocal uploaded_bytes
+            for piece in stream:
+                uploaded_bytes += len(piece)
+                yield piece
+
+        uploaded_file = upload.upload(counted(iter_parallel_zip(folder_path)))
+        get_drive_index().record_file(uploaded_file['id'], zip_title, target_folder_id, uploaded_bytes)
+        resumed = f", resumed {upload.resumes} time(s)" if upload.resumes else ""
+        return (f"Backup of `{folder_path}` streamed to Google Drive "
+                f"as `{uploaded_file.get('name', zip_title)}` in folder `{drive_folder_name}` "
+                f"({uploaded_bytes / (1024**2):.2f} MB{resumed}).")
+    except Exception as e:
+        return f"Error during backup to Google Drive: {e}"
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _upload_blob(path: str, sha256: str, blob_folder_id: str) -> Dict[str, Any]:
+    """Upload ``path`` as blob ``sha256``, hashing the bytes as they are sent.
+
+    Returns the file id plus the SHA-256 and size of what was actually stored. A file edited since it
+    was hashed is renamed to the hash of the uploaded content, so blob names always match their bytes.
+    """
+    digest, size = hashlib.sha256(), 0
+
+    def hashed(f):
+        nonlocal size
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+            size += len(block)
+            yield block
+
+    with open(path, "rb") as f:
+        uploaded = ResumableUpload({"name": sha256, "parents": [blob_folder_id]},
+                                   _drive_access_token).upload(hashed(f))
+    actual = digest.hexdigest()
+    if actual != sha256:
+        renamed = get_drive().CreateFile({'id': uploaded['id']})
+        renamed['title'] = actual
+        renamed.Upload()
+    return {"id": uploaded['id'], "sha256": actual, "size": size}
+
+def _backup_state_path(folder_path: str, drive_folder_name: str) -> str:
+    state_id = hashlib.sha256(f"{os.path.abspath(folder_path)}\0{drive_folder_name}".encode("utf-8")).hexdigest()[:16]
+    return os.path.join(BACKUP_STATE_DIR, f"{state_id}.json")
+
+def load_backup_state(folder_path: str, drive_folder_name: str) -> Dict[str, Any]:
+    try:
+        with open(_backup_state_path(folder_path, drive_folder_name)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {"files": {}, "blobs": []}
+
+def save_backup_state(folder_path: str, drive_folder_name: str, state: Dict[str, Any]):
+    path = _backup_state_path(folder_path, drive_folder_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)  # Atomic, so a crash never leaves a half-written manifest
+
+def build_backup_manifest(folder_path: str, previous: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Map each file's relative path to size, mtime and SHA-256.
+
+    Files whose size and mtime match ``previous`` keep their recorded hash and are not read.
+    """
+    manifest = {}
+    for root, dirs, files in os.walk(folder_path):
+        dirs[:] = [d for d in dirs if os.path.normpath(os.path.relpath(os.path.join(root, d), folder_path))
+                   not in BACKUP_EXCLUDE_DIRS]
+        for file in files:
+            file_path = os.path.join(root, file)
+            arcname = os.path.relpath(file_path, folder_path).replace(os.sep, "/")
+            try:
+                stat = os.stat(file_path)
+                known = previous.get(arcname)
+                if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+                    sha256 = known["sha256"]
+                else:
+                    sha256 = _file_sha256(file_path)
+            except OSError:
+                continue  # Vanished or unreadable mid-walk; it will be picked up next run
+            manifest[arcname] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+    return manifest
+
+@instrumented()
+def incremental_backup_to_drive(folder_path=".", drive_folder_name="Automated_Backups"):
+    """Upload only new content as SHA-256-named blobs, plus a small JSON index of this snapshot."""
+    drive = get_drive()
+    if not drive:
+        return drive_unavailable_message()
+    if not os.path.exists(folder_path):
+        return f"Error: Local folder '{folder_path}' does not exist."
+    try:
+        state = load_backup_state(folder_path, drive_folder_name)
+        manifest = build_backup_manifest(folder_path, state["files"])
+        drive_index = get_drive_index()
+        target_folder_id = drive_index.folder_id(drive_folder_name)
+        blob_folder_id = drive_index.folder_id(BACKUP_BLOB_FOLDER, target_folder_id)
+        # Blobs already on Drive count as known even if the local state was lost.
+        known_blobs = set(state["blobs"]) | {meta["title"] for meta in drive_index.files_in(blob_folder_id).values()}
+        changed = sum(1 for arcname, entry in manifest.items() if state["files"].get(arcname) != entry)
+
+        uploaded_bytes, new_blobs = 0, 0
+        for arcname, entry in manifest.items():
+            if entry["sha256"] in known_blobs:
+                continue
+            blob = _upload_blob(os.path.join(folder_path, arcname), entry["sha256"], blob_folder_id)
+            # A file edited after hashing is recorded as uploaded; its new mtime gets it re-hashed next run.
+            entry.update(sha256=blob["sha256"], size=blob["size"])
+            drive_index.record_file(blob["id"], blob["sha256"], blob_folder_id, blob["size"], save=False)
+            known_blobs.add(blob["sha256"])
+            uploaded_bytes += blob["size"]
+            new_blobs += 1
+            state["blobs"] = sorted(known_blobs)
+            save_backup_state(folder_path, drive_folder_name, state)  # Keep progress if a later upload fails
+
+        base_folder_name = os.path.basename(os.path.abspath(folder_path))
+        snapshot_title = f"snapshot_{base_folder_name}_{dt_object.now().strftime('%Y%m%d_%H%M%S')}.json"
+        snapshot = drive.CreateFile({'title': snapshot_title, 'parents': [{'id': target_folder_id}],
+                                     'mimeType': 'application/json'})
+        snapshot.SetContentString(json.dumps({"source": base_folder_name, "created": time.time(),
+                                              "blob_folder": BACKUP_BLOB_FOLDER, "files": manifest}))
+        snapshot.Upload()
+        drive_index.record_file(snapshot['id'], snapshot_title, target_folder_id)
+
+        state["files"] = manifest
+        save_backup_state(folder_path, drive_folder_name, state)
+        return (f"Incremental backup of `{folder_path}` complete: {len(manifest)} files, {changed} changed, "
+                f"{new_blobs} new blobs ({uploaded_bytes / (1024**2):.2f} MB uploaded). "
+                f"Snapshot index `{snapshot_title}` saved in folder `{drive_folder_name}`.")
+    except Exception as e:
+        return f"Error during incremental backup to Google Drive: {e}"
+
+@st.cache_resource
+def get_drive_download_session() -> requests.Session:
+    """Keep-alive session shared by every ranged download of a restore."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=RESTORE_WORKERS * (RESTORE_READAHEAD + 1))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+@st.cache_resource
+def get_restore_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=RESTORE_WORKERS * (RESTORE_READAHEAD + 1), thread_name_prefix="restore")
+
+@retry_on_failure(max_retries=3, host=urlsplit(DRIVE_FILES_URL).hostname)
+@instrumented("drive:download_range")
+def fetch_drive_range(file_id: str, start: int = 0, end: Optional[int] = None) -> bytes:
+    """Download bytes ``start``..``end`` (inclusive) of a Drive file, or the whole file without ``end``."""
+    headers = {"Authorization": f"Bearer {_drive_access_token()}"}
+    if end is not None:
+        headers["Range"] = f"bytes={start}-{end}"
+    r = get_drive_download_session().get(f"{DRIVE_FILES_URL}/{file_id}", params={"alt": "media"},
+                                         headers=headers, timeout=60)
+    r.raise_for_status()
+    if end is not None and r.status_code != 206:
+        raise APIError(f"Drive ignored the byte range for file {file_id}")
+    return r.content
+
+@retry_on_failure(max_retries=3, host=urlsplit(DRIVE_FILES_URL).hostname)
+@instrumented("drive:file_size")
+def fetch_drive_file_size(file_id: str) -> int:
+    headers = {"Authorization": f"Bearer {_drive_access_token()}"}
+    r = get_drive_download_session().get(f"{DRIVE_FILES_URL}/{file_id}", params={"fields": "size"},
+                                         headers=headers, timeout=30)
+    r.raise_for_status()
+    return int(r.json()["size"])
+
+class RemoteFile(io.RawIOBase):
+    """Read-only, seekable view of a Drive file that downloads only the byte ranges that are read.
+
+    Reads are served from RESTORE_RANGE_SIZE blocks. While reads move forward, the next
+    RESTORE_READAHEAD blocks (up to ``readahead_limit``) are requested in parallel, so one large member
+    still downloads over several connections; only those few blocks are ever held in memory. Blocks in
+    ``pinned`` are shared between readers of the same file, e.g. the tail holding a ZIP's central directory.
+    """
+
+    def __init__(self, file_id: str, size: int, executor: Optional[ThreadPoolExecutor] = None,
+                 block_size: int = RESTORE_RANGE_SIZE, readahead: int = RESTORE_READAHEAD,
+                 pinned: Optional[Dict[int, Future]] = None):
+        super().__init__()
+        self.file_id = file_id
+        self.size = size
+        self.executor = executor or get_restore_executor()
+        self.block_size = block_size
+        self.readahead = readahead
+        self._pos = 0
+        self._blocks: collections.OrderedDict = collections.OrderedDict()  # block index -> Future of bytes
+        self._last_block: Optional[int] = None
+        self.pinned = pinned or {}
+        self.readahead_limit: Optional[int] = None  # Offset past which nothing is fetched ahead of the reader
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: self.size}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def _block(self, index: int) -> Future:
+        if index in self.pinned:
+            return self.pinned[index]
+        if index not in self._blocks:
+            start = index * self.block_size
+            end = min(start + self.block_size, self.size) - 1
+            self._blocks[index] = self.executor.submit(fetch_drive_range, self.file_id, start, end)
+            while len(self._blocks) > self.readahead + 2:
+                oldest = next(iter(self._blocks))
+                if oldest == index:
+                    break
+                self._blocks.pop(oldest).cancel()
+        return self._blocks[index]
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self.size - self._pos
+        pieces = []
+        while size > 0 and self._pos < self.size:
+            index = self._pos // self.block_size
+            block = self._block(index)
+            if self._last_block is not None and index in (self._last_block, self._last_block + 1):
+                end = self.size if self.readahead_limit is None else min(self.size, self.readahead_limit)
+                last = (end - 1) // self.block_size
+                for ahead in range(index + 1, min(index + self.readahead, last) + 1):
+                    self._block(ahead)
+            self._last_block = index
+            data = block.result()
+            offset = self._pos - index * self.block_size
+            piece = data[offset:offset + size]
+            if not piece:
+                raise APIError(f"Drive returned a short range for file {self.file_id}")
+            pieces.append(piece)
+            self._pos += len(piece)
+            size -= len(piece)
+        return b"".join(pieces)
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        for block in self._blocks.values():
+            block.cancel()
+        self._blocks.clear()
+        super().close()
+
+def _snapshot_created(title: str) -> Optional[dt_object]:
+    match = re.search(r"_(\d{8}_\d{6})\.(?:zip|json)$", title)
+    return dt_object.strptime(match.group(1), "%Y%m%d_%H%M%S") if match else None
+
+def list_backup_snapshots(drive_folder_name: str = "Automated_Backups") -> List[Dict[str, Any]]:
+    """Backups in ``drive_folder_name``, newest first, listed from Drive so older backups are included.
+
+    ZIPs from backup_folder_to_drive have kind "zip"; snapshot indexes from
+    incremental_backup_to_drive have kind "incremental".
+    """
+    index = get_drive_index()
+    folder_id = index.folder_id(drive_folder_name, create=False)
+    snapshots = []
+    for file_id, meta in index.sync_folder(folder_id).items():
+        title = meta["title"]
+        if title.startswith("backup_") and title.endswith(".zip"):
+            kind = "zip"
+        elif title.startswith("snapshot_") and title.endswith(".json"):
+            kind = "incremental"
+        else:
+            continue
+        snapshots.append({"id": file_id, "title": title, "kind": kind, "size": meta.get("size", 0),
+                          "created": _snapshot_created(title), "folder_id": folder_id})
+    snapshots.sort(key=lambda s: (s["created"] or dt_object.min, s["title"]), reverse=True)
+    return snapshots
+
+def _open_snapshot_archive(snapshot: Dict[str, Any]) -> Callable[[], RemoteFile]:
+    """Return an opener of RemoteFiles over a ZIP snapshot that all share one download of its last block."""
+    size = snapshot.get("size") or fetch_drive_file_size(snapshot["id"])
+    last = (size - 1) // RESTORE_RANGE_SIZE
+    pinned = {last: get_restore_executor().submit(fetch_drive_range, snapshot["id"], last * RESTORE_RANGE_SIZE,
+                                                  size - 1)} if size else {}
+    return lambda: RemoteFile(snapshot["id"], size, pinned=pinned)
+
+def _load_incremental_snapshot(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+    return json.loads(fetch_drive_range(snapshot["id"]))
+
+def list_snapshot_members(snapshot: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Files in a snapshot with their sizes; for a ZIP only the central directory is downloaded."""
+    if snapshot["kind"] == "incremental":
+        files = _load_incremental_snapshot(snapshot)["files"]
+        return [{"name": name, "size": entry["size"]} for name, entry in sorted(files.items())]
+    with _open_snapshot_archive(snapshot)() as f, zipfile.ZipFile(f) as archive:
+        return [{"name": info.filename, "size": info.file_size} for info in archive.infolist()
+                if not info.is_dir() and info.filename != BACKUP_MANIFEST_NAME]
+
+def _restore_path(target_dir: str, name: str) -> str:
+    target = os.path.abspath(target_dir)
+    path = os.path.abspath(os.path.join(target, *name.split("/")))
+    if os.path.commonpath([target, path]) != target or path == target:
+        raise APIError(f"Refusing to restore '{name}' outside the target folder")
+    return path
+
+def _write_verified(chunks, path: str, expected: Optional[Dict[str, Any]], mtime: Optional[float]) -> Dict[str, Any]:
+    """Stream ``chunks`` into ``path`` via a temporary file, checking size and SHA-256 against ``expected``."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".restoring"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in chunks:
+                digest.update(chunk)
+                size += len(chunk)
+                f.write(chunk)
+        if expected and (size != expected["size"] or digest.hexdigest() != expected["sha256"]):
+            raise APIError(f"Checksum mismatch (got {size} bytes, sha256 {digest.hexdigest()[:12]}…)")
+        if mtime is not None:
+            os.utime(tmp_path, (mtime, mtime))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return {"size": size, "sha256": digest.hexdigest()}
+
+def _restore_in_parallel(names: List[str], restore_one: Callable[[str], Dict[str, Any]],
+                         workers: int, progress: Optional[Callable]) -> List[Dict[str, Any]]:
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(names)))) as executor:
+        futures = {executor.submit(restore_one, name): name for name in names}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results.append({"name": name, "status": "restored", "error": "", **future.result()})
+            except (APIError, OSError, zipfile.BadZipFile, requests.exceptions.RequestException) as e:
+                results.append({"name": name, "status": "failed", "error": str(e)})
+            if progress:
+                progress(len(results), len(names))
+    return sorted(results, key=lambda r: r["name"])
+
+def _select_members(available: List[str], members: Optional[List[str]]) -> tuple:
+    if not members:
+        return available, []
+    known = set(available)
+    missing = [{"name": name, "status": "failed", "error": "Not in this backup"} for name in members if name not in known]
+    return [name for name in members if name in known], missing
+
+def restore_from_zip(open_archive: Callable[[], Any], target_dir: str, members: Optional[List[str]] = None,
+                     workers: int = RESTORE_WORKERS, progress: Optional[Callable] = None) -> List[Dict[str, Any]]:
+    """Extract ``members`` (default: every file) of a ZIP backup into ``target_dir`` in parallel.
+
+    ``open_archive`` returns a fresh seekable file object; each worker opens its own, so with a
+    RemoteFile only the central directory and the selected members are downloaded. zipfile checks
+    each member's CRC-32, and members listed in the archive's BACKUP_MANIFEST_NAME are also checked
+    against the recorded size and SHA-256.
+    """
+    with open_archive() as f, zipfile.ZipFile(f) as archive:
+        infos = {info.filename: info for info in archive.infolist() if not info.is_dir()}
+        manifest = json.loads(archive.read(BACKUP_MANIFEST_NAME)) if BACKUP_MANIFEST_NAME in infos else {}
+    names, missing = _select_members([name for name in infos if name != BACKUP_MANIFEST_NAME], members)
+    local = threading.local()
+    opened = []
+
+    def restore_one(name: str) -> Dict[str, Any]:
+        if not hasattr(local, "archive"):
+            local.file = open_archive()
+            local.archive = zipfile.ZipFile(local.file)
+            opened.extend([local.archive, local.file])
+        info = infos[name]
+        if isinstance(local.file, RemoteFile):
+            # Local header, data and descriptor; the local extra field may differ from the central one.
+            local.file.readahead_limit = (info.header_offset + 30 + len(info.orig_filename.encode("utf-8"))
+                                          + len(info.extra) + info.compress_size + 24 + 1024)
+        path = _restore_path(target_dir, name)
+        mtime = time.mktime(info.date_time + (0, 0, -1))
+        with local.archive.open(info) as member:
+            result = _write_verified(iter(lambda: member.read(RESTORE_RANGE_SIZE), b""), path, manifest.get(name), mtime)
+        return {**result, "verified": "sha256" if name in manifest else "crc32"}
+
+    try:
+        return missing + _restore_in_parallel(names, restore_one, workers, progress)
+    finally:
+        for handle in opened:
+            handle.close()
+
+def restore_incremental_snapshot(snapshot: Dict[str, Any], target_dir: str, members: Optional[List[str]] = None,
+                                 workers: int = RESTORE_WORKERS,
+                                 progress: Optional[Callable] = None) -> List[Dict[str, Any]]:
+    """Rebuild files of an incremental snapshot from their content-addressed blobs, verifying each SHA-256."""
+    index = get_drive_index()
+    data = _load_incremental_snapshot(snapshot)
+    files = data["files"]
+    blob_folder_id = index.folder_id(data.get("blob_folder", BACKUP_BLOB_FOLDER), snapshot["folder_id"], create=False)
+    names, missing = _select_members(sorted(files), members)
+    blobs = {meta["title"]: file_id for file_id, meta in index.files_in(blob_folder_id).items()}
+    if any(files[name]["sha256"] not in blobs for name in names):  # E.g. blobs uploaded before the index existed
+        blobs = {meta["title"]: file_id for file_id, meta in index.sync_folder(blob_folder_id).items()}
+
+    def restore_one(name: str) -> Dict[str, Any]:
+        entry = files[name]
+        path = _restore_path(target_dir, name)
+        if entry["sha256"] not in blobs:
+            raise APIError("Blob missing from Drive")
+        with RemoteFile(blobs[entry["sha256"]], entry["size"]) as blob:
+            result = _write_verified(iter(lambda: blob.read(RESTORE_RANGE_SIZE), b""), path, entry,
+                                     entry["mtime_ns"] / 1e9)
+        return {**result, "verified": "sha256"}
+
+    return missing + _restore_in_parallel(names, restore_one, workers, progress)
+
+@instrumented()
+def restore_backup(snapshot: Dict[str, Any], target_dir: str, members: Optional[List[str]] = None,
+                   progress: Optional[Callable] = None) -> List[Dict[str, Any]]:
+    """Restore ``members`` (default: all files) of a snapshot from list_backup_snapshots into ``target_dir``.
+
+    Returns one row per file with its status, size, checksum and how it was verified.
+    """
+    if not get_drive():
+        raise APIError(drive_unavailable_message())
+    if snapshot["kind"] == "incremental":
+        return restore_incremental_snapshot(snapshot, target_dir, members, progress=progress)
+    return restore_from_zip(_open_snapshot_archive(snapshot), target_dir, members, progress=progress)
+
+def describe_restore(results: List[Dict[str, Any]], target_dir: str) -> str:
+    restored = [r for r in results if r["status"] == "restored"]
+    failed = len(results) - len(restored)
+    size = sum(r["size"] for r in restored)
+    summary = f"Restored {len(restored)} file(s) ({size / (1024**2):.2f} MB) into `{target_dir}` with verified checksums"
+    return summary + (f"; {failed} file(s) failed." if failed else ".")
+
+@st.cache_resource
+def get_weather_session() -> requests.Session:
+    """One keep-alive session for all OpenWeatherMap calls, sized for a full weather board."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=WEATHER_BOARD_WORKERS)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def format_weather(report: Dict[str, Any]) -> str:
+    return (f"**{report['temp_c']}°C**, {report['description'].capitalize()}. "
+            f"Humidity: {report['humidity']}%, Wind: {report['wind_speed']} m/s.")
+
+@instrumented()
+def get_weather(city: str = "London") -> str:
+    """Get weather information for a city."""
+    if not get_secret("OPENWEATHERMAP_API_KEY"):
+        return "Please set your OpenWeatherMap API key in .streamlit/secrets.toml."
+    return format_weather(get_city_weather(city))
+
+def get_city_weather(city: str) -> Dict[str, Any]:
+    """Current conditions for a city name, resolved to coordinates through the geocode cache."""
+    place = geocode_city(city.strip())
+    return {"city": city.strip(), **place, **fetch_weather_at(place["lat"], place["lon"])}
+
+@cached_response("geocode")
+@retry_on_failure(max_retries=3, host=urlsplit(OPENWEATHER_GEOCODE_URL).hostname)
+@instrumented("http:openweathermap_geo")
+def geocode_city(city: str) -> Dict[str, Any]:
+    """Resolve a city name (optionally "City,CC") to its best-matching coordinates."""
+    try:
+        response = get_weather_session().get(
+            OPENWEATHER_GEOCODE_URL, params={"q": city, "limit": 1, "appid": get_secret("OPENWEATHERMAP_API_KEY")},
+            timeout=10)
+        response.raise_for_status()
+        matches = response.json()
+    except requests.exceptions.RequestException as e:
+        raise APIError(f"Network error geocoding '{city}': {e}")
+    except ValueError as e:
+        raise APIError(f"Error parsing geocoding data: {e}")
+    if not matches:  # Not cached, so a corrected spelling is looked up again
+        raise APIError(f"City not found: {city}")
+    match = matches[0]
+    return {"name": match.get("name", city), "country": match.get("country", ""), "state": match.get("state", ""),
+            "lat": round(float(match["lat"]), 4), "lon": round(float(match["lon"]), 4)}
+
+@cached_response("weather")
+@retry_on_failure(max_retries=3, host=urlsplit(OPENWEATHER_API_URL).hostname, serve_stale=True)
+@instrumented("http:openweathermap")
+def fetch_weather_at(lat: float, lon: float) -> Dict[str, Any]:
+    try:
+        response = get_weather_session().get(
+            OPENWEATHER_API_URL,
+            params={"lat": lat, "lon": lon, "units": "metric", "appid": get_secret("OPENWEATHERMAP_API_KEY")},
+            timeout=10)
+        response.raise_for_status()
+        data = response.json()
+        
+        if data.get("cod") != 200:
+            raise APIError(f"Weather API error: {data.get('message', 'Unknown error')}")
+            
+        return {"temp_c": data["main"]["temp"], "feels_like_c": data["main"].get("feels_like"),
+                "humidity": data["main"]["humidity"], "pressure_hpa": data["main"].get("pressure"),
+                "description": data["weather"][0]["description"], "wind_speed": data["wind"]["speed"],
+                "observed_at": data.get("dt")}
+    except requests.exceptions.RequestException as e:
+        raise APIError(f"Network error fetching weather: {e}")
+    except (KeyError, ValueError, IndexError) as e:
+        raise APIError(f"Error parsing weather data: {e}")
+
+@instrumented()
+def get_weather_board(cities: List[str], max_workers: int = WEATHER_BOARD_WORKERS) -> List[Dict[str, Any]]:
+    """Current conditions for many cities at once; a city that fails gets an ``error`` instead of data.
+
+    Names are geocoded once and cached, then every city is fetched concurrently over the pooled
+    session, so a warm refresh of the whole board costs about one round trip.
+    """
+    if not get_secret("OPENWEATHERMAP_API_KEY"):
+        raise APIError("Please set your OpenWeatherMap API key in .streamlit/secrets.toml.")
+    cities = list(dict.fromkeys(c.strip() for c in cities if c.strip()))
+    if not cities:
+        return []
+
+    def one(city: str) -> Dict[str, Any]:
+        try:
+            return {**get_city_weather(city), "error": None}
+        except APIError as e:
+            return {"city": city, "error": str(e)}
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(cities)), thread_name_prefix="weather") as executor:
+        return list(executor.map(one, cities))
+
+class RateLimiter:
+    """Thread-safe token bucket allowing ``rate`` calls per ``period`` seconds."""
+
+    def __init__(self, rate: int, period: float = 60.0):
+        self.capacity = float(rate)
+        self.fill_rate = rate / period
+        self._tokens = float(rate)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Block until a call is allowed; return False if that would exceed ``timeout``."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.fill_rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.fill_rate
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+class SummaryCache:
+    """Persistent SQLite map from a content key to a finished LLM summary."""
+
+    def __init__(self, path: str = SUMMARY_CACHE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS summaries "
+                               "(key TEXT PRIMARY KEY, summary TEXT, created_at INTEGER)")
+
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT summary FROM summaries WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, summary: str):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO summaries VALUES (?, ?, ?)", (key, summary, int(time.time())))
+
+@st.cache_resource
+def get_llm_rate_limiter() -> RateLimiter:
+    return RateLimiter(GEMINI_REQUESTS_PER_MINUTE, 60.0)
+
+@st.cache_resource
+def get_llm_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=LLM_MAX_CONCURRENCY, thread_name_prefix="llm")
+
+@st.cache_resource
+def get_summary_cache() -> SummaryCache:
+    return SummaryCache()
+
+def describe_llm_error(e: Exception, context: str = "Could not summarize article") -> str:
+    """Turn a Gemini exception into the message shown in place of a summary."""
+    if "429" in str(e) and "quota" in str(e).lower():
+        return f"LLM Quota Exceeded. Please try again later. (Error: {e})"
+    elif "blocked" in str(e).lower() or "safety" in str(e).lower():
+        return "Content blocked by safety settings. Cannot summarize."
+    return f"{context} (LLM Error: {e})"
+
+@st.cache_resource
+def get_llm_latency_samples() -> Dict[str, Any]:
+    """Prompt size and duration of recent successful Gemini calls."""
+    return {"lock": threading.Lock(), "samples": collections.deque(maxlen=LLM_LATENCY_SAMPLES)}
+
+@retry_on_failure(max_retries=3, host="generativelanguage.googleapis.com")
+def generate_with_llm(prompt: str) -> str:
+    """One Gemini call, paced by the shared client-side rate limiter."""
+    with metrics.span("llm:rate_limit_wait"):
+        get_llm_rate_limiter().acquire()
+    started = time.perf_counter()
+    with metrics.span("llm:gemini"):
+        text = get_integration("llm").generate_content(prompt).text.strip()
+    latency = get_llm_latency_samples()
+    with latency["lock"]:
+        latency["samples"].append((estimate_tokens(prompt), time.perf_counter() - started))
+    return text
+
+# Removed wherever they occur: NewsAPI's "[+1234 chars]" truncation marker, page counters and bare links.
+_INLINE_BOILERPLATE = re.compile(r"\[\+\d+ chars\]|\bpage \d+ of \d+\b|https?://\S+", re.IGNORECASE)
+# Short standalone lines starting with these carry no content worth summarizing.
+_BOILERPLATE_SENTENCE = re.compile(
+    r"^\W*(?:©|copyright\b|all rights reserved|subscribe\b|sign up\b|newsletter\b|click here|read more|"
+    r"advertisement\b|privacy policy|terms of (?:use|service)|follow us|share this|"
+    r"(?:we|this (?:site|website)) uses? cookies|accept (?:all )?cookies)", re.IGNORECASE)
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_WORD = re.compile(r"[a-z0-9]+")
+
+def _split_sentences(paragraph: str) -> Any:
+    for sentence in _SENTENCE_END.split(paragraph):
+        pieces = sentence.splitlines() if len(sentence) > PRECOMPRESS_MAX_SENTENCE_CHARS else [sentence]
+        for piece in pieces:
+            piece = " ".join(piece.split())
+            while len(piece) > PRECOMPRESS_MAX_SENTENCE_CHARS:
+                cut = piece.rfind(" ", 0, PRECOMPRESS_MAX_SENTENCE_CHARS)
+                cut = cut if cut > 0 else PRECOMPRESS_MAX_SENTENCE_CHARS
+                yield piece[:cut]
+                piece = piece[cut:].strip()
+            if piece:
+                yield piece
+
+@instrumented()
+def precompress_text(text: str, max_tokens: int, seen: Optional[set] = None,
+                     source: str = "text") -> Dict[str, Any]:
+    """Shrink ``text`` for an LLM prompt without calling one.
+
+    Sentences that (nearly) repeat an earlier one are dropped. Text over ``max_tokens`` also loses
+    short standalone boilerplate lines and fragments, and if it is still over budget, the sentences
+    closest to the TF-IDF centroid of the text are kept, in their original order. ``seen`` carries
+    exact-duplicate fingerprints across calls, e.g. to drop a PDF's running headers from every
+    section. If almost nothing would be left, the original text (cut to the budget) is returned
+    instead. Returns the text with raw and kept token counts.
+    """
+    sentences: List[str] = []
+    paragraph_of: List[int] = []
+    words: List[List[str]] = []
+    dropped = collections.Counter()
+    seen = seen if seen is not None else set()
+    raw_tokens = estimate_tokens(text)
+    over_budget = raw_tokens > max_tokens
+    for paragraph_index, paragraph in enumerate(re.split(r"\n\s*\n", text)):
+        for sentence in _split_sentences(_INLINE_BOILERPLATE.sub(" ", paragraph)):
+            sentence_words = _WORD.findall(sentence.lower())
+            if over_budget and (len(sentence_words) < PRECOMPRESS_MIN_WORDS or (
+                    len(sentence_words) <= PRECOMPRESS_BOILERPLATE_MAX_WORDS and _BOILERPLATE_SENTENCE.match(sentence))):
+                dropped["boilerplate"] += 1
+                continue
+            if not sentence_words:
+                continue
+            fingerprint = hashlib.sha1(" ".join(sentence_words).encode("utf-8")).digest()
+            if fingerprint in seen:
+                dropped["duplicates"] += 1
+                continue
+            seen.add(fingerprint)
+            sentences.append(sentence)
+            paragraph_of.append(paragraph_index)
+            words.append(sentence_words)
+
+    keep = np.ones(len(sentences), dtype=bool)
+    if len(sentences) > 1:
+        vocabulary: Dict[str, int] = {}
+        rows = np.repeat(np.arange(len(words)), [len(w) for w in words])
+        columns = np.array([vocabulary.setdefault(w, len(vocabulary)) for sentence_words in words for w in sentence_words])
+        counts = np.zeros((len(words), len(vocabulary)), dtype=np.float32)
+        np.add.at(counts, (rows, columns), 1.0)
+        idf = np.log((1 + len(words)) / (1 + np.count_nonzero(counts, axis=0))) + 1.0
+        vectors = np.log1p(counts) * idf
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        similarity = vectors @ vectors.T
+        for j in range(1, len(sentences)):
+            if np.any(similarity[j, :j][keep[:j]] > PRECOMPRESS_DUPLICATE_SIMILARITY):
+                keep[j] = False
+        dropped["duplicates"] += int(np.count_nonzero(~keep))
+
+        sizes = np.array([estimate_tokens(sentence) + 1 for sentence in sentences])
+        if sizes[keep].sum() > max_tokens:
+            centroid = vectors[keep].mean(axis=0)
+            scores = np.where(keep, vectors @ centroid, -np.inf)
+            budget = max_tokens
+            selected = np.zeros_like(keep)
+            for i in np.argsort(-scores, kind="stable")[:np.count_nonzero(keep)]:
+                if sizes[i] <= budget:
+                    selected[i] = True
+                    budget -= sizes[i]
+            dropped["ranked_out"] += int(np.count_nonzero(keep & ~selected))
+            keep = selected
+
+    compressed = "\n\n".join(" ".join(sentences[i] for i in paragraph)
+                             for _, paragraph in itertools.groupby(np.flatnonzero(keep), key=lambda i: paragraph_of[i]))
+    tokens = estimate_tokens(compressed)
+    fallback = tokens < PRECOMPRESS_MIN_RESULT_SHARE * min(raw_tokens, max_tokens)
+    if fallback:
+        compressed = text.strip()[:max_tokens * CHARS_PER_TOKEN]
+        tokens = estimate_tokens(compressed)
+    metrics.increment("precompress_tokens", raw_tokens, source=source, stage="raw")
+    metrics.increment("precompress_tokens", tokens, source=source, stage="sent")
+    return {"text": compressed, "raw_tokens": raw_tokens, "tokens": tokens, "sentences": len(sentences),
+            "kept": int(np.count_nonzero(keep)), "fallback": fallback, **dropped}
+
+def precompression_savings() -> Dict[str, Any]:
+    """Prompt tokens saved by pre-compression so far, and the model time that saved.
+
+    Model time is the saved tokens times the per-token slope of a least-squares fit of recent Gemini
+    latencies against prompt size, so the fixed cost of a call is not counted as saved. It is None
+    until calls of at least two different sizes have been seen.
+    """
+    totals = collections.Counter()
+    for (name, labels), value in metrics.counter_totals():
+        if name == "precompress_tokens":
+            totals[dict(labels)["stage"]] += value
+    latency = get_llm_latency_samples()
+    with latency["lock"]:
+        samples = np.array(latency["samples"], dtype=float).reshape(-1, 2)
+    saved = totals["raw"] - totals["sent"]
+    model_seconds_saved = None
+    if len(samples) >= 2 and np.ptp(samples[:, 0]) > 0:
+        seconds_per_token = max(0.0, float(np.polyfit(samples[:, 0], samples[:, 1], 1)[0]))
+        model_seconds_saved = saved * seconds_per_token
+    compress_seconds = next((row["total_s"] for row in metrics.summary() if row["name"] == "precompress_text"), 0.0)
+    return {"raw_tokens": totals["raw"], "sent_tokens": totals["sent"], "saved_tokens": saved,
+            "saved_pct": saved / totals["raw"] * 100 if totals["raw"] else 0.0,
+            "compress_s": compress_seconds, "model_s_saved": model_seconds_saved}
+
+@instrumented()
+def summarize_articles(articles: List[Dict[str, Any]]) -> List[str]:
+    """Summarize articles concurrently, reusing cached summaries keyed by URL and content hash."""
+    cache = get_summary_cache()
+    executor = get_llm_executor()
+    prompt_hash = hashlib.sha256(NEWS_SUMMARY_PROMPT.encode("utf-8")).hexdigest()
+    summaries: List[Optional[str]] = [None] * len(articles)
+    pending = {}
+    for i, article in enumerate(articles):
+        title = f"Title: {article.get('title', 'No Title')}\n"
+        body = f"{article.get('description') or ''}\n\n{article.get('content') or ''}"
+        key = cache.make_key(article.get("url", "#"), hashlib.sha256((title + body).encode("utf-8")).hexdigest(),
+                             prompt_hash)
+        summaries[i] = cache.get(key)
+        if summaries[i] is None:
+            # The description is often repeated as the first sentence of the content; it is sent once.
+            text = title + precompress_text(body, NEWS_ARTICLE_TOKENS - estimate_tokens(title), source="news")["text"]
+            pending[i] = (key, executor.submit(generate_with_llm, NEWS_SUMMARY_PROMPT.format(text=text)))
+    for i, (key, future) in pending.items():
+        try:
+            summaries[i] = future.result()
+            cache.put(key, summaries[i])
+        except Exception as e:  # Failures are reported in place and never cached
+            summaries[i] = describe_llm_error(e)
+    return summaries
+
+@cached_response("news")
+@retry_on_failure(max_retries=3, host=urlsplit(NEWS_API_URL).hostname, serve_stale=True)
+@instrumented("http:newsapi")
+def fetch_news_articles(query: str, language: str = "en") -> List[Dict[str, Any]]:
+    """Get top headlines matching ``query`` from NewsAPI."""
+    try:
+        response = requests.get(NEWS_API_URL, params={"q": query, "language": language, "apiKey": get_secret("NEWS_API_KEY")},
+                                timeout=10)
+        response.raise_for_status()
+        return response.json().get("articles", [])
+    except requests.exceptions.RequestException as e:
+        raise APIError(f"Error fetching news from NewsAPI: {e}")
+
+def build_news_digest(query: str = "general", language: str = "en", num_articles: int = 3) -> str:
+    """Markdown list of the top headlines for ``query`` with a summary of each; raises APIError."""
+    articles = fetch_news_articles(query, language)
+    if not articles:
+        return f"No news found for '{query}'."
+
+    selected = articles[:num_articles]
+    summary_parts = []
+    for i, (article, summary_text) in enumerate(zip(selected, summarize_articles(selected))):
+        title = article.get("title", "No Title")
+        article_url = article.get("url", "#")
+        summary_parts.append(f"**{i+1}. [{title}]({article_url})**\n   - {summary_text}")
+
+    return "### Top News Headlines:\n" + "\n\n".join(summary_parts)
+
+@instrumented()
+def get_news_summary(query="general", language="en", num_articles=3):
+    if not get_secret("NEWS_API_KEY"):
+        return "Please set your NewsAPI.org API key in .streamlit/secrets.toml."
+    if not get_secret("GEMINI_API_KEY"):
+        return "Please set your Google Gemini API key in .streamlit/secrets.toml for summarization."
+
+    try:
+        return build_news_digest(query, language, num_articles)
+    except APIError as e:
+        return str(e)
+    except Exception as e:
+        return f"An unexpected error occurred during news processing: {e}"
+
+class HostConnectionPool:
+    """Thread-safe pool of idle keep-alive HTTP(S) connections, keyed by host."""
+
+    def __init__(self, max_idle_per_host: int = WEBSITE_MAX_IDLE_PER_HOST, timeout: float = WEBSITE_CHECK_TIMEOUT):
+        self.max_idle_per_host = max_idle_per_host
+        self.timeout = timeout
+        self._ssl_context = ssl.create_default_context()
+        self._lock = threading.Lock()
+        self._idle: Dict[tuple, List[http.client.HTTPConnection]] = {}
+
+    def acquire(self, scheme: str, host: str, port: int) -> tuple:
+        """Return ``(connection, timings)``; timings are zero for a reused connection."""
+        with self._lock:
+            idle = self._idle.get((scheme, host, port))
+            if idle:
+                return idle.pop(), {"dns_ms": 0.0, "connect_ms": 0.0, "reused": True}
+
+        start = time.perf_counter()
+        addr_infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        resolved = time.perf_counter()
+        sock = None
+        last_error: Optional[Exception] = None
+        for family, sock_type, proto, _, sockaddr in addr_infos:
+            try:
+                sock = socket.socket(family, sock_type, proto)
+                sock.settimeout(self.timeout)
+                sock.connect(sockaddr)
+                break
+            except OSError as e:
+                last_error = e
+                sock.close()
+                sock = None
+        if sock is None:
+            raise last_error or OSError(f"Could not connect to {host}:{port}")
+        if scheme == "https":
+            sock = self._ssl_context.wrap_socket(sock, server_hostname=host)
+            conn = http.client.HTTPSConnection(host, port, timeout=self.timeout, context=self._ssl_context)
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=self.timeout)
+        conn.sock = sock  # http.client skips its own connect() when a socket is already attached
+        connected = time.perf_counter()
+        return conn, {"dns_ms": (resolved - start) * 1000, "connect_ms": (connected - resolved) * 1000, "reused": False}
+
+    def release(self, scheme: str, host: str, port: int, conn: http.client.HTTPConnection):
+        with self._lock:
+            idle = self._idle.setdefault((scheme, host, port), [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+@st.cache_resource
+def get_website_connection_pool() -> HostConnectionPool:
+    return HostConnectionPool()
+
+def _timed_get(pool: HostConnectionPool, url: str) -> Dict[str, Any]:
+    """Issue one GET over a pooled connection and time each phase of it."""
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError(f"Unsupported URL: {url}")
+    port = parts.port or (443 if scheme == "https" else 80)
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+    headers = {"User-Agent": "PersonalAutomationDashboard/1.0", "Connection": "keep-alive"}
+
+    for attempt in range(2):
+        conn, timings = pool.acquire(scheme, parts.hostname, port)
+        try:
+            start = time.perf_counter()
+            conn.request("GET", path, headers=headers)
+            response = conn.getresponse()
+            first_byte = time.perf_counter()
+            response.read()
+            done = time.perf_counter()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            conn.close()
+            if timings["reused"] and attempt == 0:
+                continue  # The server dropped an idle keep-alive connection; retry on a fresh one
+            raise
+        except Exception:
+            conn.close()
+            raise
+        if response.will_close:
+            conn.close()
+        else:
+            pool.release(scheme, parts.hostname, port, conn)
+        return {
+            "status": response.status,
+            "location": response.getheader("Location"),
+            "dns_ms": timings["dns_ms"],
+            "connect_ms": timings["connect_ms"],
+            "ttfb_ms": (first_byte - start) * 1000,
+            "total_ms": timings["dns_ms"] + timings["connect_ms"] + (done - start) * 1000,
+            "reused": timings["reused"],
+        }
+
+@instrumented("http:website")
+def probe_website(url: str, pool: Optional[HostConnectionPool] = None) -> Dict[str, Any]:
+    """Check a URL (following redirects) and record DNS, connect, TTFB and total time in ms."""
+    pool = pool or get_website_connection_pool()
+    url = url.strip()
+    if "://" not in url:
+        url = "https://" + url
+    result = {"url": url, "up": False, "status": None, "error": None,
+              "dns_ms": 0.0, "connect_ms": 0.0, "ttfb_ms": 0.0, "total_ms": 0.0, "reused": False}
+    current = url
+    started = time.perf_counter()
+    breaker = circuit_breaker_for(urlsplit(url).hostname or url)
+    if not breaker.allow():  # Checks still report DOWN, they just stop hammering a dead host
+        result["error"] = f"Host failing repeatedly; next check in {breaker.retry_in():.0f}s"
+        return result
+    try:
+        for hop_number in range(WEBSITE_MAX_REDIRECTS + 1):
+            hop = _timed_get(pool, current)
+            for field in ("dns_ms", "connect_ms", "ttfb_ms", "total_ms"):
+                result[field] += hop[field]
+            result["reused"] = hop["reused"] and (hop_number == 0 or result["reused"])
+            result["status"] = hop["status"]
+            if hop["status"] in (301, 302, 303, 307, 308) and hop["location"]:
+                current = urljoin(current, hop["location"])
+                continue
+            break
+        result["up"] = result["status"] == 200
+        breaker.record_success()
+    except (OSError, http.client.HTTPException, ValueError) as e:
+        result["error"] = str(e) or type(e).__name__
+        result["total_ms"] = (time.perf_counter() - started) * 1000
+        breaker.record_failure()
+    return result
+
+@instrumented()
+def check_websites_bulk(urls: List[str], max_workers: int = WEBSITE_MONITOR_WORKERS,
+                        pool: Optional[HostConnectionPool] = None) -> List[Dict[str, Any]]:
+    """Check many URLs concurrently over shared keep-alive connections."""
+    urls = list(dict.fromkeys(u.strip() for u in urls if u.strip()))
+    if not urls:
+        return []
+    pool = pool or get_website_connection_pool()
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as executor:
+        return list(executor.map(lambda u: probe_website(u, pool), urls))
+
+@instrumented()
+def check_website_uptime(url):
+    result = probe_website(url)
+    if result["error"]:
+        return f"🔴 {url} is DOWN (Error: {result['error']})"
+    if result["up"]:
+        return f"🟢 {url} is UP (Status: {result['status']}, {result['total_ms']:.0f} ms)"
+    return f"🟠 {url} is DOWN (Status: {result['status']})"
+
+class UptimeStore:
+    """SQLite-backed history of uptime checks.
+
+    Raw checks are kept for UPTIME_RAW_RETENTION_DAYS. Every write also folds the
+    check into a fixed-size rollup row (count, ups, latency histogram) per URL and
+    UPTIME_ROLLUP_BUCKET, so summaries and charts never scan raw rows.
+    """
+
+    def __init__(self, path: str = UPTIME_DB_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS targets (url TEXT PRIMARY KEY, added_at INTEGER)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS checks "
+                               "(ts INTEGER, url TEXT, up INTEGER, status INTEGER, total_ms REAL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS checks_url_ts ON checks (url, ts)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS rollups "
+                               "(url TEXT, bucket INTEGER, checks INTEGER, ups INTEGER, latency_sum REAL, hist TEXT, "
+                               "PRIMARY KEY (url, bucket)) WITHOUT ROWID")
+
+    def targets(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT url FROM targets ORDER BY added_at")]
+
+    def add_target(self, url: str):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR IGNORE INTO targets VALUES (?, ?)", (url, int(time.time())))
+
+    def remove_target(self, url: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM targets WHERE url = ?", (url,))
+
+    def record(self, results: List[Dict[str, Any]], ts: Optional[float] = None):
+        """Append raw checks and fold them into their rollup buckets in one transaction."""
+        ts = int(ts if ts is not None else time.time())
+        bucket = ts - ts % UPTIME_ROLLUP_BUCKET
+        with self._lock, self._conn:
+            for r in results:
+                latency = None if r["error"] else r["total_ms"]
+                self._conn.execute("INSERT INTO checks VALUES (?, ?, ?, ?, ?)",
+                                   (ts, r["url"], int(r["up"]), r["status"], latency))
+                row = self._conn.execute("SELECT checks, ups, latency_sum, hist FROM rollups WHERE url = ? AND bucket = ?",
+                                         (r["url"], bucket)).fetchone()
+                checks, ups, latency_sum, hist = (row[0], row[1], row[2], json.loads(row[3])) if row else \
+                    (0, 0, 0.0, [0] * (len(LATENCY_BUCKETS_MS) + 1))
+                if latency is not None:
+                    hist[next((i for i, b in enumerate(LATENCY_BUCKETS_MS) if latency <= b), len(LATENCY_BUCKETS_MS))] += 1
+                    latency_sum += latency
+                self._conn.execute("INSERT OR REPLACE INTO rollups VALUES (?, ?, ?, ?, ?, ?)",
+                                   (r["url"], bucket, checks + 1, ups + int(r["up"]), latency_sum, json.dumps(hist)))
+
+    def prune(self, now: Optional[float] = None):
+        """Apply retention: drop raw checks first, rollups much later."""
+        now = now if now is not None else time.time()
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM checks WHERE ts < ?", (now - UPTIME_RAW_RETENTION_DAYS * 86400,))
+            self._conn.execute("DELETE FROM rollups WHERE bucket < ?", (now - UPTIME_ROLLUP_RETENTION_DAYS * 86400,))
+
+    def _rollups(self, url: str, window: float) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT bucket, checks, ups, latency_sum, hist FROM rollups WHERE url = ? AND bucket >= ? ORDER BY bucket",
+                (url, int(time.time() - window))).fetchall()
+
+    def summary(self, url: str, window: float = UPTIME_SUMMARY_WINDOW) -> Dict[str, Any]:
+        """Uptime percentage and latency percentiles for ``url`` over the last ``window`` seconds."""
+        checks = ups = 0
+        hist = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        for _, bucket_checks, bucket_ups, _, bucket_hist in self._rollups(url, window):
+            checks += bucket_checks
+            ups += bucket_ups
+            hist = [a + b for a, b in zip(hist, json.loads(bucket_hist))]
+        return {
+            "url": url,
+            "checks": checks,
+            "uptime_pct": 100.0 * ups / checks if checks else None,
+            "p50_ms": _histogram_percentile(hist, 0.50),
+            "p95_ms": _histogram_percentile(hist, 0.95),
+            "p99_ms": _histogram_percentile(hist, 0.99),
+        }
+
+    def history(self, url: str, window: float = UPTIME_SUMMARY_WINDOW) -> List[Dict[str, Any]]:
+        """One point per rollup bucket, for charting."""
+        points = []
+        for bucket, checks, ups, latency_sum, hist in self._rollups(url, window):
+            measured = sum(json.loads(hist))
+            points.append({
+                "time": dt_object.fromtimestamp(bucket),
+                "uptime_pct": 100.0 * ups / checks if checks else None,
+                "avg_ms": latency_sum / measured if measured else None,
+            })
+        return points
+
+class UptimePoller(threading.Thread):
+    """Daemon thread that checks every monitored URL each UPTIME_POLL_INTERVAL seconds."""
+
+    def __init__(self, store: UptimeStore, interval: float = UPTIME_POLL_INTERVAL):
+        super().__init__(name="uptime-poller", daemon=True)
+        self.store = store
+        self.interval = interval
+        self.pool = HostConnectionPool()
+        self.last_run: Optional[float] = None
+        self.last_results: List[Dict[str, Any]] = []
+        self._wake = threading.Event()
+        self._last_prune = 0.0
+
+    def poll_now(self):
+        self._wake.set()
+
+    def run(self):
+        while True:
+            try:
+                urls = self.store.targets()
+                results = check_websites_bulk(urls, pool=self.pool) if urls else []
+                if results:
+                    self.store.record(results)
+                self.last_results = results
+                if time.time() - self._last_prune > 3600:
+                    self.store.prune()
+                    self._last_prune = time.time()
+            except Exception as e:  # Site failures are already results; this is store trouble such as a locked DB
+                logger.warning("Uptime poller error: %s", e)
+            self.last_run = time.time()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+@st.cache_resource
+def get_uptime_poller() -> UptimePoller:
+    poller = UptimePoller(UptimeStore())
+    poller.start()
+    return poller
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def iter_pdf_pages(pdf_reader) -> Any:
+    """Yield the text of each page, extracting lazily one page at a time."""
+    for page in pdf_reader.pages:
+        yield page.extract_text() or ""
+
+def chunk_text(pages, max_tokens: int = PDF_CHUNK_TOKENS) -> Any:
+    """Group page texts into chunks of at most ``max_tokens``, splitting oversized pages."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    buffer: List[str] = []
+    size = 0
+    for page_text in pages:
+        page_text = page_text.strip()
+        while len(page_text) > max_chars:  # A single page larger than a chunk is cut at paragraph/space boundaries
+            cut = max(page_text.rfind("\n", 0, max_chars), page_text.rfind(" ", 0, max_chars))
+            cut = cut if cut > max_chars // 2 else max_chars
+            if buffer:
+                yield "\n".join(buffer)
+                buffer, size = [], 0
+            yield page_text[:cut]
+            page_text = page_text[cut:].strip()
+        if not page_text:
+            continue
+        if size + len(page_text) > max_chars and buffer:
+            yield "\n".join(buffer)
+            buffer, size = [], 0
+        buffer.append(page_text)
+        size += len(page_text) + 1
+    if buffer:
+        yield "\n".join(buffer)
+
+def _cached_llm_call(prompt_template: str, text: str) -> Future:
+    """Submit a summarization to the shared LLM pool, short-circuiting on a cache hit."""
+    cache = get_summary_cache()
+    key = cache.make_key(prompt_template, hashlib.sha256(text.encode("utf-8")).hexdigest())
+    cached = cache.get(key)
+    if cached is not None:
+        future = Future()
+        future.set_result(cached)
+        return future
+
+    def call():
+        summary = generate_with_llm(prompt_template.format(text=text))
+        cache.put(key, summary)
+        return summary
+    return get_llm_executor().submit(call)
+
+@instrumented()
+def map_reduce_summarize(chunks, progress: Optional[Callable] = None) -> str:
+    """Summarize chunks concurrently as they arrive, then merge the partial summaries level by level."""
+    report = progress or (lambda stage, done, total: None)
+    futures = [_cached_llm_call(PDF_CHUNK_PROMPT, chunk) for chunk in chunks]
+    done = 0
+    for _ in as_completed(futures):
+        done += 1
+        report("Summarizing sections", done, len(futures))
+    partials = [f.result() for f in futures]
+
+    level = 1
+    while len(partials) > 1:
+        groups: List[List[str]] = [[]]
+        for partial in partials:
+            group_tokens = sum(estimate_tokens(p) for p in groups[-1])
+            if len(groups[-1]) >= 2 and group_tokens + estimate_tokens(partial) > PDF_CHUNK_TOKENS:
+                groups.append([])
+            groups[-1].append(partial)
+        futures = [_cached_llm_call(PDF_REDUCE_PROMPT, "\n\n".join(group)) if len(group) > 1 else None
+                   for group in groups]
+        pending = [f for f in futures if f is not None]
+        done = 0
+        for _ in as_completed(pending):
+            done += 1
+            report(f"Merging summaries (level {level})", done, len(pending))
+        partials = [f.result() if f is not None else group[0] for f, group in zip(futures, groups)]
+        level += 1
+    return partials[0]
+
+@instrumented()
+def summarize_pdf_content(uploaded_file, progress: Optional[Callable] = None):
+    """Summarize a PDF of any length; ``progress(stage, done, total)`` is called as work completes."""
+    if not get_secret("GEMINI_API_KEY"):
+        return "Please set your Google Gemini API key in .streamlit/secrets.toml for summarization."
+    if uploaded_file is None:
+        return "Please upload a PDF file to summarize."
+    report = progress or (lambda stage, done, total: None)
+    PyPDF2 = get_integration("pdf")
+    try:
+        pdf_bytes = uploaded_file.getvalue()
+        cache = get_summary_cache()
+        document_key = cache.make_key("pdf", hashlib.sha256(pdf_bytes).hexdigest(),
+                                      PDF_SUMMARY_PROMPT, PDF_CHUNK_PROMPT, PDF_REDUCE_PROMPT)
+        summary = cache.get(document_key)
+        if summary is None:
+            pdf_reader = PyPDF2.PdfReader(BytesIO(pdf_bytes))
+            total_pages = len(pdf_reader.pages)
+
+            def pages_with_progress():
+                for page_num, page_text in enumerate(iter_pdf_pages(pdf_reader), start=1):
+                    report("Extracting pages", page_num, total_pages)
+                    yield page_text
+
+            # Chunks are produced lazily, so section summaries start while later pages are still being extracted.
+            # Sections are extracted larger than a prompt and pre-compressed down to one, which also means
+            # fewer LLM calls; running headers and repeated boilerplate are dropped across the whole document.
+            seen_sentences: set = set()
+            chunks = (precompress_text(chunk, PDF_CHUNK_TOKENS, seen=seen_sentences, source="pdf")["text"]
+                      for chunk in chunk_text(pages_with_progress(), int(PDF_CHUNK_TOKENS / PDF_COMPRESSION_RATIO)))
+            chunks = (chunk for chunk in chunks if chunk)
+            first_chunk, second_chunk = next(chunks, None), next(chunks, None)
+            if first_chunk is None:
+                return "Could not extract text from the PDF. It might be an image-based PDF, password-protected, or empty."
+            if second_chunk is None:
+                report("Summarizing document", 0, 1)
+                summary = _cached_llm_call(PDF_SUMMARY_PROMPT, first_chunk).result()
+                report("Summarizing document", 1, 1)
+            else:
+                summary = map_reduce_summarize(itertools.chain([first_chunk, second_chunk], chunks), progress=report)
+            cache.put(document_key, summary)
+        return f"**Summary of '{uploaded_file.name}':**\n\n{summary}"
+    except PyPDF2.errors.PdfReadError:
+        return "Error reading PDF file. It might be corrupted or not a valid PDF."
+    except Exception as e:
+        return describe_llm_error(e, "An unexpected error occurred during PDF summarization")
+
+def build_email_message(sender: str, to_email: str, subject: str, body: str) -> MIMEMultipart:
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'plain'))
+    return msg
+
+class EmailOutbox:
+    """Background queue of outgoing email drained by a small pool of persistent SMTP connections.
+
+    Each worker keeps one authenticated connection open across messages and reconnects when the
+    server drops it, after EMAIL_MESSAGES_PER_CONNECTION sends, or after sitting idle. Bulk batches
+    share the pool and one token bucket; priority messages (single and scheduled sends) have their
+    own worker and a reserved slice of the rate, so they never wait behind a bulk batch. Together
+    the two stay under EMAIL_MESSAGES_PER_MINUTE.
+    """
+
+    def __init__(self, workers: int = EMAIL_POOL_SIZE, rate: int = EMAIL_MESSAGES_PER_MINUTE,
+                 priority_rate: int = EMAIL_PRIORITY_PER_MINUTE):
+        self.rate_limiter = RateLimiter(rate - priority_rate, 60.0)
+        self.priority_rate_limiter = RateLimiter(priority_rate, 60.0)
+        self._queue: queue.Queue = queue.Queue()
+        self._priority_queue: queue.Queue = queue.Queue()
+        self._messages: Dict[str, Dict[str, Any]] = {}  # message id -> status record
+        self._batches: Dict[str, List[str]] = {}  # batch id -> message ids, oldest first
+        self._ids = itertools.count(1)
+        self._changed = threading.Condition()
+        for i in range(workers):
+            threading.Thread(target=self._work, args=(False,), name=f"email-sender-{i}", daemon=True).start()
+        threading.Thread(target=self._work, args=(True,), name="email-sender-priority", daemon=True).start()
+
+    def submit(self, config: Dict[str, Any], messages: List[Dict[str, str]], priority: bool = False) -> str:
+        """Queue ``messages`` (dicts with to/subject/body) and return a batch id for status polling.
+
+        Messages are sent with the ``config`` they were submitted with; ``priority`` puts them on the
+        lane reserved for single and scheduled sends.
+        """
+        with self._changed:
+            batch_id = f"batch-{next(self._ids)}"
+            ids = []
+            for message in messages:
+                message_id = f"{batch_id}-{len(ids) + 1}"
+                self._messages[message_id] = {"id": message_id, "to": message["to"], "subject": message["subject"],
+                                              "body": message["body"], "config": config, "status": "queued",
+                                              "attempts": 0, "error": None, "sent_at": None}
+                ids.append(message_id)
+            self._batches[batch_id] = ids
+            while len(self._batches) > EMAIL_BATCH_HISTORY:
+                for message_id in self._batches.pop(next(iter(self._batches))):
+                    self._messages.pop(message_id, None)
+        for message_id in ids:
+            (self._priority_queue if priority else self._queue).put(message_id)
+        return batch_id
+
+    def batch_status(self, batch_id: str) -> List[Dict[str, Any]]:
+        with self._changed:
+            return [{k: v for k, v in self._messages[m].items() if k not in ("body", "config")}
+                    for m in self._batches.get(batch_id, []) if m in self._messages]
+
+    def wait(self, batch_id: str, timeout: Optional[float]) -> List[Dict[str, Any]]:
+        """Block until every message in the batch is sent or failed, or ``timeout`` (if any) passes."""
+        def settled():
+            return all(self._messages[m]["status"] in ("sent", "failed")
+                       for m in self._batches.get(batch_id, []) if m in self._messages)
+        with self._changed:
+            self._changed.wait_for(settled, timeout)
+        return self.batch_status(batch_id)
+
+    def _update(self, record: Dict[str, Any], **fields):
+        with self._changed:
+            record.update(fields)
+            self._changed.notify_all()
+
+    @staticmethod
+    @instrumented("smtp:connect")
+    def _connect(config: Dict[str, Any]) -> smtplib.SMTP:
+        if config["use_ssl"]:
+            smtp = smtplib.SMTP_SSL(config["server"], config["port"], timeout=SMTP_TIMEOUT)
+        else:
+            smtp = smtplib.SMTP(config["server"], config["port"], timeout=SMTP_TIMEOUT)
+        try:
+            smtp.ehlo()
+            if not config["use_ssl"] and smtp.has_extn("starttls"):
+                smtp.starttls()
+                smtp.ehlo()
+            if smtp.has_extn("auth"):  # Local test servers typically accept mail without authentication
+                smtp.login(config["user"], config["password"])
+        except Exception:
+            smtp.close()
+            raise
+        return smtp
+
+    @staticmethod
+    def _close(smtp: Optional[smtplib.SMTP]) -> None:
+        if smtp is not None:
+            try:
+                smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                smtp.close()
+        return None
+
+    def _work(self, priority: bool):
+        lane = self._priority_queue if priority else self._queue
+        smtp, smtp_config, sent_on_connection = None, None, 0
+        while True:
+            try:
+                message_id = lane.get(timeout=EMAIL_IDLE_TIMEOUT)
+            except queue.Empty:
+                smtp = self._close(smtp)
+                continue
+            with self._changed:
+                record = self._messages.get(message_id)
+            if record is None:  # Batch already dropped from history
+                continue
+            config = record["config"]
+            self._update(record, status="sending")
+            error = None
+            for attempt in range(1, EMAIL_MAX_ATTEMPTS + 1):
+                self._update(record, attempts=attempt)
+                try:
+                    if smtp is not None and (smtp_config != config or sent_on_connection >= EMAIL_MESSAGES_PER_CONNECTION):
+                        smtp = self._close(smtp)
+                    if smtp is None:
+                        smtp, smtp_config, sent_on_connection = self._connect(config), config, 0
+                    (self.priority_rate_limiter if priority else self.rate_limiter).acquire()
+                    with metrics.span("smtp:send"):
+                        smtp.send_message(build_email_message(config["user"], record["to"], record["subject"],
+                                                              record["body"]))
+                    sent_on_connection += 1
+                    error = None
+                    break
+                except smtplib.SMTPRecipientsRefused as e:
+                    error = f"Recipient refused: {', '.join(e.recipients)}"
+                    break
+                except smtplib.SMTPResponseException as e:
+                    reply = e.smtp_error.decode(errors="replace") if isinstance(e.smtp_error, bytes) else e.smtp_error
+                    error = f"{e.smtp_code} {reply}"
+                    if e.smtp_code >= 500:  # Permanent: bad credentials, rejected sender or content
+                        break
+                    smtp = self._close(smtp)
+                except (smtplib.SMTPException, OSError) as e:
+                    error = str(e) or type(e).__name__
+                    smtp = self._close(smtp)  # Reconnect and re-authenticate on the next attempt
+                if attempt < EMAIL_MAX_ATTEMPTS:
+                    time.sleep(min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+            if error is None:
+                self._update(record, status="sent", error=None, sent_at=dt_object.now().strftime("%H:%M:%S"))
+            else:
+                self._update(record, status="failed", error=error)
+
+@st.cache_resource
+def get_email_outbox() -> EmailOutbox:
+    return EmailOutbox()
+
+def parse_email_recipients(raw: str = "", csv_text: str = "") -> List[Dict[str, str]]:
+    """Collect recipients from pasted addresses and/or CSV rows, de-duplicated by address.
+
+    A CSV needs an ``email`` column; its other columns (header names lower-cased) become template
+    fields. Entries without an ``@`` are dropped.
+    """
+    recipients: Dict[str, Dict[str, str]] = {}
+    for address in raw.replace(",", "\n").replace(";", "\n").splitlines():
+        address = address.strip()
+        if "@" in address:
+            recipients.setdefault(address.lower(), {"email": address})
+    if csv_text:
+        for row in csv.DictReader(StringIO(csv_text)):
+            fields = {(k or "").strip().lower(): (v or "").strip() for k, v in row.items()}
+            if "@" in fields.get("email", ""):
+                recipients[fields["email"].lower()] = fields
+    return list(recipients.values())
+
+def render_bulk_emails(recipients: List[Dict[str, str]], subject_template: str, body_template: str) -> List[Dict[str, str]]:
+    """Fill ``$field`` placeholders per recipient; unknown placeholders are left as written."""
+    subject, body = Template(subject_template), Template(body_template)
+    return [{"to": r["email"], "subject": subject.safe_substitute(r), "body": body.safe_substitute(r)}
+            for r in recipients]
+
+def queue_bulk_email(recipients: List[Dict[str, str]], subject_template: str, body_template: str) -> str:
+    """Queue one templated message per recipient on the shared outbox and return the batch id."""
+    return get_email_outbox().submit(get_integration("smtp"),
+                                     render_bulk_emails(recipients, subject_template, body_template))
+
+@instrumented()
+def send_email(to_email, subject, message_body, timeout: Optional[float] = SMTP_TIMEOUT):
+    """Send one message on the outbox's priority lane, waiting up to ``timeout`` (forever if None) for it."""
+    try:
+        smtp_config = get_integration("smtp")
+    except IntegrationUnavailable as e:
+        return f"{e} Email sending needs both."
+    outbox = get_email_outbox()
+    batch_id = outbox.submit(smtp_config, [{"to": to_email, "subject": subject, "body": message_body}],
+                             priority=True)
+    (record,) = outbox.wait(batch_id, timeout)
+    if record["status"] == "sent":
+        return "Email sent successfully!"
+    if record["status"] != "failed":
+        return "Email queued; it will be sent in the background."
+    return (f"Error sending email: {record['error']}. "
+            "Please check your Gmail credentials and 'App passwords' settings "
+            "(if using 2FA) or ensure Less Secure App Access is enabled (for older setups).")
+
+def _open_ring_storage(path: str, length: int) -> np.ndarray:
+    """Memory-map ``length`` float64s at ``path``, starting a new zeroed file if the size does not match."""
+    if os.path.exists(path) and os.path.getsize(path) == length * 8:
+        return np.memmap(path, dtype=np.float64, mode="r+", shape=(length,))
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    return np.memmap(path, dtype=np.float64, mode="w+", shape=(length,))  # Sparse until rows are written
+
+class RingBuffer:
+    """Fixed-capacity float64 ring buffer of rows; memory use never grows past ``capacity`` rows.
+
+    With ``path``, rows and the write position live in a memory-mapped file, so the buffer survives
+    restarts; a file of a different capacity or width is started afresh.
+    """
+
+    def __init__(self, capacity: int, width: int = 1, path: Optional[str] = None):
+        length = 2 + capacity * width
+        if path is None:
+            storage = np.full(length, np.nan)
+            storage[:2] = 0
+        else:
+            storage = _open_ring_storage(path, length)
+        self.path = path
+        self._storage = storage
+        self._header = storage[:2]  # Next write index, row count
+        self._data = storage[2:].reshape(capacity, width)
+        if not (0 <= self._header[0] < capacity and 0 <= self._header[1] <= capacity):
+            self._header[:] = 0
+        self._next = int(self._header[0])
+        self._count = int(self._header[1])
+        self._lock = threading.Lock()
+
+    def append(self, row):
+        with self._lock:
+            self._data[self._next] = row
+            self._next = (self._next + 1) % len(self._data)
+            self._count = min(self._count + 1, len(self._data))
+            self._header[:] = (self._next, self._count)
+
+    def values(self) -> np.ndarray:
+        """All stored rows, oldest first (a copy)."""
+        with self._lock:
+            if self._count < len(self._data):
+                return np.array(self._data[:self._count])
+            return np.concatenate((self._data[self._next:], self._data[:self._next]))
+
+    def flush(self):
+        """Write a memory-mapped buffer's dirty pages to disk."""
+        if self.path is not None:
+            with self._lock:
+                self._storage.flush()
+
+    def __len__(self):
+        return self._count
+
+class SystemSampler(threading.Thread):
+    """Daemon thread sampling CPU, memory, disk and network rates plus top processes at a fixed rate."""
+
+    def __init__(self, interval: float = SYSTEM_SAMPLE_INTERVAL, history_seconds: float = SYSTEM_HISTORY_SECONDS):
+        super().__init__(name="system-sampler", daemon=True)
+        self.interval = interval
+        capacity = max(1, int(history_seconds / interval))
+        self.metrics = RingBuffer(capacity, len(SYSTEM_METRICS))
+        self.per_core = RingBuffer(capacity, psutil.cpu_count() or 1)
+        self.top_processes: List[Dict[str, Any]] = []
+
+    def run(self):
+        psutil.cpu_percent(percpu=True)  # Prime the counters; the first real reading covers one interval
+        prev_disk, prev_net, prev_time = psutil.disk_io_counters(), psutil.net_io_counters(), time.monotonic()
+        while True:
+            time.sleep(self.interval)
+            started = time.perf_counter()
+            try:
+                per_core = psutil.cpu_percent(percpu=True)
+                disk, net, now = psutil.disk_io_counters(), psutil.net_io_counters(), time.monotonic()
+                elapsed = max(now - prev_time, 1e-6)
+
+                def rate(current, previous, field):
+                    if current is None or previous is None:
+                        return np.nan
+                    return max(getattr(current, field) - getattr(previous, field), 0) / elapsed
+
+                self.metrics.append([time.time(), float(np.mean(per_core)), psutil.virtual_memory().percent,
+                                     rate(disk, prev_disk, "read_bytes"), rate(disk, prev_disk, "write_bytes"),
+                                     rate(net, prev_net, "bytes_sent"), rate(net, prev_net, "bytes_recv")])
+                self.per_core.append(per_core)
+                prev_disk, prev_net, prev_time = disk, net, now
+
+                # process_iter caches Process objects, so cpu_percent is the usage since the previous sample.
+                processes = [p.info for p in psutil.process_iter(["pid", "name", "cpu_percent", "memory_percent"])]
+                self.top_processes = sorted(processes, key=lambda info: info["cpu_percent"] or 0.0,
+                                            reverse=True)[:SYSTEM_TOP_PROCESSES]
+                metrics.observe("psutil:sample", time.perf_counter() - started)
+            except Exception as e:  # Keep sampling through transient psutil errors
+                metrics.observe("psutil:sample", time.perf_counter() - started, error=True)
+                logger.warning("System sampler error: %s", e)
+
+    def latest(self) -> Optional[Dict[str, float]]:
+        values = self.metrics.values()
+        return dict(zip(SYSTEM_METRICS, values[-1])) if len(values) else None
+
+    def window(self, seconds: float) -> np.ndarray:
+        """Metric rows from the last ``seconds``, oldest first."""
+        values = self.metrics.values()
+        return values[np.searchsorted(values[:, 0], time.time() - seconds):]
+
+    def stats(self, seconds: float) -> Dict[str, Dict[str, float]]:
+        """Min/avg/max of every metric over the last ``seconds``."""
+        values = self.window(seconds)
+        if not len(values):
+            return {}
+        mins, means, maxes = np.nanmin(values, axis=0), np.nanmean(values, axis=0), np.nanmax(values, axis=0)
+        return {name: {"min": mins[i], "avg": means[i], "max": maxes[i]}
+                for i, name in enumerate(SYSTEM_METRICS) if name != "time"}
+
+@st.cache_resource
+def get_system_sampler() -> SystemSampler:
+    sampler = SystemSampler()
+    sampler.start()
+    return sampler
+
+class PriceHistory:
+    """Per-asset (time, price) ring buffers with vectorized indicators.
+
+    Every upstream price fetch is recorded, at most one per PRICE_CACHE_TTL per asset, so a buffer of
+    PRICE_HISTORY_SECONDS / PRICE_CACHE_TTL rows always spans at least PRICE_HISTORY_SECONDS. With a
+    ``directory``, each buffer is a memory-mapped file there and history survives restarts.
+    """
+
+    def __init__(self, directory: Optional[str] = PRICE_HISTORY_DIR, seconds: float = PRICE_HISTORY_SECONDS):
+        self.directory = directory or None
+        self.capacity = max(2, int(seconds / PRICE_CACHE_TTL))
+        self._buffers: Dict[tuple, RingBuffer] = {}
+        self._tracked = dict.fromkeys(DEFAULT_CRYPTO_ASSETS)
+        self._lock = threading.Lock()
+        if self.directory and os.path.isdir(self.directory):
+            for file in sorted(os.listdir(self.directory)):
+                asset, _, currency = file[:-len(".f64")].rpartition("_")
+                if file.endswith(".f64") and currency == PRICE_VS_CURRENCY:
+                    self._tracked[asset] = None
+
+    def _buffer(self, asset: str, vs_currency: str, create: bool = True) -> Optional[RingBuffer]:
+        with self._lock:
+            key = (asset, vs_currency)
+            if key not in self._buffers:
+                path = None
+                if self.directory:
+                    path = os.path.join(self.directory, re.sub(r"[^a-z0-9_.-]", "-", f"{asset}_{vs_currency}") + ".f64")
+                if not create and (path is None or not os.path.exists(path)):
+                    return None
+                self._buffers[key] = RingBuffer(self.capacity, 2, path)
+            return self._buffers[key]
+
+    def track(self, assets: List[str]):
+        """Add ``assets`` to the set the price poller keeps up to date."""
+        with self._lock:
+            self._tracked.update(dict.fromkeys(assets))
+
+    def tracked(self) -> List[str]:
+        with self._lock:
+            return list(self._tracked)
+
+    def record(self, prices: Dict[str, float], vs_currency: str = PRICE_VS_CURRENCY, ts: Optional[float] = None):
+        ts = time.time() if ts is None else ts
+        for asset, price in prices.items():
+            if price is not None:
+                self._buffer(asset, vs_currency).append([ts, price])
+
+    def flush(self):
+        with self._lock:
+            buffers = list(self._buffers.values())
+        for buffer in buffers:
+            buffer.flush()
+
+    def series(self, asset: str, vs_currency: str = PRICE_VS_CURRENCY, seconds: Optional[float] = None) -> np.ndarray:
+        """(time, price) rows for ``asset``, oldest first, optionally only the last ``seconds``."""
+        buffer = self._buffer(asset, vs_currency, create=False)
+        values = buffer.values() if buffer is not None else np.empty((0, 2))
+        if seconds is not None and len(values):
+            values = values[np.searchsorted(values[:, 0], values[-1, 0] - seconds):]
+        return values
+
+    def indicators(self, asset: str, vs_currency: str = PRICE_VS_CURRENCY,
+                   windows: Dict[str, float] = PRICE_CHANGE_WINDOWS) -> Optional[Dict[str, Any]]:
+        """Latest price plus percent change, moving average and volatility over each of ``windows``.
+
+        All windows are computed at once from prefix sums. A window's figures are None until the
+        history reaches back past its start. Volatility is the realized volatility of log returns
+        over the window, in percent.
+        """
+        values = self.series(asset, vs_currency)
+        if not len(values):
+            return None
+        times, prices = values[:, 0], values[:, 1]
+        cutoffs = times[-1] - np.array(list(windows.values()), dtype=float)
+        starts = np.searchsorted(times, cutoffs, side="left")  # First sample inside each window
+        refs = np.searchsorted(times, cutoffs, side="right") - 1  # Last sample at or before each window's start
+        covered = refs >= 0
+        n = len(prices)
+        price_sums = np.concatenate(([0.0], np.cumsum(prices)))
+        variance_sums = np.concatenate(([0.0], np.cumsum(np.diff(np.log(prices)) ** 2)))
+        change = (prices[-1] / prices[np.maximum(refs, 0)] - 1) * 100
+        sma = (price_sums[n] - price_sums[starts]) / (n - starts)
+        volatility = np.sqrt(variance_sums[n - 1] - variance_sums[np.minimum(np.maximum(refs, 0), n - 1)]) * 100
+
+        def figure(values: np.ndarray, i: int) -> Optional[float]:
+            return float(values[i]) if covered[i] else None
+
+        return {"price": float(prices[-1]), "updated": float(times[-1]), "samples": n,
+                "windows": {label: {"change_pct": figure(change, i), "sma": figure(sma, i),
+                                    "volatility_pct": figure(volatility, i)}
+                            for i, label in enumerate(windows)}}
+
+    def sparkline(self, asset: str, vs_currency: str = PRICE_VS_CURRENCY, seconds: float = PRICE_SPARKLINE_SECONDS,
+                  points: int = PRICE_SPARKLINE_POINTS) -> List[float]:
+        """Up to ``points`` evenly spaced prices from the last ``seconds``, for a metric sparkline."""
+        prices = self.series(asset, vs_currency, seconds)[:, 1]
+        if len(prices) > points:
+            prices = prices[np.linspace(0, len(prices) - 1, points).astype(int)]
+        return prices.tolist()
+
+@st.cache_resource
+def get_price_history() -> PriceHistory:
+    return PriceHistory()
+
+class PricePoller(threading.Thread):
+    """Daemon thread that refreshes every tracked asset's price each PRICE_POLL_INTERVAL seconds."""
+
+    def __init__(self, history: PriceHistory, interval: float = PRICE_POLL_INTERVAL):
+        super().__init__(name="price-poller", daemon=True)
+        self.history = history
+        self.interval = interval
+        self.last_run: Optional[float] = None
+
+    def run(self):
+        while True:
+            try:
+                # Goes through the price engine, so a poll never duplicates a fetch another session just made.
+                get_crypto_prices(self.history.tracked())
+                self.history.flush()
+            except Exception as e:  # CoinGecko down with nothing cached yet, or a failed flush; retry next interval
+                logger.warning("Price poller error: %s", e)
+            self.last_run = time.time()
+            time.sleep(self.interval)
+
+@st.cache_resource
+def get_price_poller() -> PricePoller:
+    poller = PricePoller(get_price_history())
+    poller.start()
+    return poller
+
+@instrumented()
+def get_machine_report(sampler: Optional[SystemSampler] = None):
+    """Gathers and formats detailed system information; CPU comes from the background sampler."""
+    report = []
+    report.append(f"**System Information ({dt_object.now().strftime('%Y-%m-%d %H:%M:%S')})**")
+    report.append("---")
+
+    latest = sampler.latest() if sampler else None
+    if latest:
+        per_core = sampler.per_core.values()[-1]
+        report.append(f"CPU Usage: {latest['cpu']:.1f}% (per core: {', '.join(f'{c:.0f}%' for c in per_core)})")
+    else:
+        report.append(f"CPU Usage: {psutil.cpu_percent(interval=None):.1f}%")
+
+    svmem = psutil.virtual_memory()
+    mem_total_gb = svmem.total / (1024**3)
+    mem_used_gb = svmem.used / (1024**3)
+    mem_percent = svmem.percent
+    report.append(f"Memory Usage: {mem_used_gb:.2f} GB / {mem_total_gb:.2f} GB ({mem_percent:.1f}%)")
+
+    disk_usage = psutil.disk_usage(os.getcwd())
+    disk_total_gb = disk_usage.total / (1024**3)
+    disk_used_gb = disk_usage.used / (1024**3)
+    disk_percent = disk_usage.percent
+    report.append(f"Disk Usage ({os.getcwd()}): {disk_used_gb:.2f} GB / {disk_total_gb:.2f} GB ({disk_percent:.1f}%)")
+
+    report.append("\n**Network Interfaces:**")
+    net_if_addrs = psutil.net_if_addrs()
+    if not net_if_addrs:
+        report.append("  No network interfaces found.")
+    else:
+        for interface_name, interface_addresses in net_if_addrs.items():
+            report.append(f"  - **{interface_name}:**")
+            found_ip = False
+            for addr in interface_addresses:
+                # IMPORTANT: Use socket module constants as a fallback or primary for AF_INET/AF_INET6
+                # And use hasattr checks for AF_LINK/AF_PACKET as they are OS-dependent or not always present.
+                if addr.family == socket.AF_INET: # IPv4 address
+                    report.append(f"    - IP Address: {addr.address}")
+                    report.append(f"    - Netmask: {addr.netmask}")
+                    if addr.broadcast: report.append(f"    - Broadcast: {addr.broadcast}")
+                    found_ip = True
+                elif addr.family == socket.AF_INET6: # IPv6 address
+                    report.append(f"    - IPv6 Address: {addr.address}")
+                # Check for platform-specific MAC address constants
+                elif hasattr(socket, 'AF_LINK') and addr.family == socket.AF_LINK: # Often macOS, BSD
+                    report.append(f"    - MAC Address: {addr.address}")
+                elif hasattr(socket, 'AF_PACKET') and addr.family == socket.AF_PACKET: # Often Linux
+                    report.append(f"    - MAC Address: {addr.address}")
+                # Fallback for systems where MAC address family might not be explicitly AF_LINK/AF_PACKET,
+                # but might appear as another family with a MAC-like address string.
+                elif not found_ip and addr.address and len(addr.address.replace(':', '')) == 12 and all(c in '0123456789abcdefABCDEF' for c in addr.address.replace(':', '')):
+                    report.append(f"    - MAC Address (heuristic): {addr.address}")
+
+            if not found_ip and not interface_addresses: # If no IP address found for interface
+                report.append("    - No address details.")
+
+    boot_time_timestamp = psutil.boot_time()
+    boot_time_dt = dt_object.fromtimestamp(boot_time_timestamp)
+    current_time_dt = dt_object.now()
+    uptime_duration = current_time_dt - boot_time_dt
+    report.append(f"\nSystem Boot Time: {boot_time_dt.strftime('%Y-%m-%d %H:%M:%S')}")
+    report.append(f"System Uptime: {uptime_duration}")
+
+    return "\n".join(report)
+
+
+class IntervalTrigger:
+    """Fires every ``seconds``, written as e.g. ``every 90s``, ``every 15m``, ``every 2h`` or ``every 1d``."""
+
+    UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+    def __init__(self, expression: str):
+        match = re.fullmatch(r"every\s+(\d+)\s*([smhd])", expression.strip().lower())
+        if not match or int(match.group(1)) == 0:
+            raise ValueError(f"Invalid interval '{expression}'. Use e.g. 'every 15m'.")
+        self.seconds = int(match.group(1)) * self.UNITS[match.group(2)]
+
+    def next_after(self, ts: float) -> float:
+        return ts + self.seconds
+
+class CronTrigger:
+    """Five-field cron expression (minute hour day-of-month month day-of-week) in local time.
+
+    Fields accept ``*``, numbers, ranges ``a-b``, lists ``a,b`` and steps ``*/n`` or ``a-b/n``.
+    Day-of-week runs 0-6 from Sunday (7 is also Sunday). As in cron, when both day fields are
+    restricted a day matching either one fires.
+    """
+
+    FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression: str):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"Invalid cron expression '{expression}': expected 5 fields.")
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            self._parse(part, low, high) for part, (low, high) in zip(parts, self.FIELDS))
+        self.weekdays = {day % 7 for day in weekdays}
+        self._any_day, self._any_weekday = parts[2] == "*", parts[4] == "*"
+
+    @staticmethod
+    def _parse(field: str, low: int, high: int) -> set:
+        values = set()
+        for part in field.split(","):
+            span, _, step = part.partition("/")
+            try:
+                if span == "*":
+                    start, end = low, high
+                elif "-" in span:
+                    start, end = (int(v) for v in span.split("-", 1))
+                else:
+                    start = int(span)
+                    end = high if step else start
+                step = int(step) if step else 1
+            except ValueError:
+                raise ValueError(f"Invalid cron field '{field}'.")
+            if not low <= start <= end <= high or step < 1:
+                raise ValueError(f"Cron field '{field}' is outside {low}-{high}.")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, day: dt_object) -> bool:
+        in_days, in_weekdays = day.day in self.days, (day.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return in_days and in_weekdays
+        return in_days or in_weekdays
+
+    def next_after(self, ts: float) -> float:
+        t = dt_object.fromtimestamp(ts).replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        limit = t + datetime.timedelta(days=4 * 366)  # Long enough to reach any 29 February
+        while t < limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + datetime.timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + datetime.timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += datetime.timedelta(minutes=1)
+            else:
+                return t.timestamp()
+        raise ValueError("Cron expression never fires.")
+
+def parse_trigger(expression: str) -> Union[IntervalTrigger, CronTrigger]:
+    """Parse an ``every <n><s|m|h|d>`` interval or a five-field cron expression; raises ValueError."""
+    if expression.strip().lower().startswith("every"):
+        return IntervalTrigger(expression)
+    return CronTrigger(expression)
+
+# Schedulable jobs defined in code. id -> label, function, default trigger/params, enabled, max_instances.
+SCHEDULED_JOBS: Dict[str, Dict[str, Any]] = {}
+
+def scheduled_job(job_id: str, label: str, trigger: str, enabled: bool = True, max_instances: int = 1, **params):
+    """Register ``func`` as a job; its schedule and keyword params are then kept in the job store.
+
+    ``max_instances`` caps concurrent runs of the job; a run that would exceed it is skipped.
+    """
+    parse_trigger(trigger)
+
+    def decorator(func: Callable) -> Callable:
+        SCHEDULED_JOBS[job_id] = {"label": label, "func": func, "trigger": trigger, "enabled": enabled,
+                                  "max_instances": max_instances, "params": params}
+        return func
+    return decorator
+
+class JobStore:
+    """SQLite-backed schedule (trigger, enabled flag, params, next run) and run history per job."""
+
+    def __init__(self, path: str = SCHEDULER_DB_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS jobs "
+                               "(job_id TEXT PRIMARY KEY, trigger TEXT, enabled INTEGER, params TEXT, next_run REAL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS runs "
+                               "(job_id TEXT, started_at REAL, duration REAL, status TEXT, detail TEXT)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS runs_job_started ON runs (job_id, started_at)")
+
+    def register(self, job_id: str, trigger: str, enabled: bool, params: Dict[str, Any]):
+        """Add a job with its defaults unless it is already stored; stored schedules win."""
+        next_run = parse_trigger(trigger).next_after(time.time())
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR IGNORE INTO jobs VALUES (?, ?, ?, ?, ?)",
+                               (job_id, trigger, int(enabled), json.dumps(params), next_run))
+
+    def jobs(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT job_id, trigger, enabled, params, next_run FROM jobs").fetchall()
+        return {job_id: {"trigger": trigger, "enabled": bool(enabled), "params": json.loads(params),
+                         "next_run": next_run} for job_id, trigger, enabled, params, next_run in rows}
+
+    def update(self, job_id: str, trigger: str, enabled: bool, params: Dict[str, Any]):
+        if not isinstance(params, dict):
+            raise ValueError("Parameters must be a JSON object.")
+        next_run = parse_trigger(trigger).next_after(time.time())
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE jobs SET trigger = ?, enabled = ?, params = ?, next_run = ? WHERE job_id = ?",
+                               (trigger, int(enabled), json.dumps(params), next_run, job_id))
+
+    def set_next_run(self, job_id: str, next_run: float):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE jobs SET next_run = ? WHERE job_id = ?", (next_run, job_id))
+
+    def record_run(self, job_id: str, started_at: float, duration: float, status: str, detail: str):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT INTO runs VALUES (?, ?, ?, ?, ?)",
+                               (job_id, started_at, duration, status, detail[:SCHEDULER_DETAIL_CHARS]))
+            self._conn.execute("DELETE FROM runs WHERE job_id = ? AND started_at < (SELECT started_at FROM runs "
+                               "WHERE job_id = ? ORDER BY started_at DESC LIMIT 1 OFFSET ?)",
+                               (job_id, job_id, SCHEDULER_RUN_HISTORY - 1))
+
+    def runs(self, job_id: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        query = "SELECT job_id, started_at, duration, status, detail FROM runs"
+        args: tuple = ()
+        if job_id is not None:
+            query, args = query + " WHERE job_id = ?", (job_id,)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY started_at DESC LIMIT ?", args + (limit,)).fetchall()
+        return [{"job_id": r[0], "started_at": r[1], "duration": r[2], "status": r[3], "detail": r[4]} for r in rows]
+
+    def failure_counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT job_id, COUNT(*) FROM runs WHERE status = 'failed' GROUP BY job_id"))
+
+class JobScheduler(threading.Thread):
+    """Daemon thread that dispatches due jobs onto a worker pool, so runs never block Streamlit reruns.
+
+    Schedules live in the JobStore, so they survive restarts. Occurrences missed while the app was
+    down run once at startup, then the job continues on its schedule.
+    """
+
+    def __init__(self, store: JobStore, workers: int = SCHEDULER_WORKERS):
+        super().__init__(name="job-scheduler", daemon=True)
+        self.store = store
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self.running: collections.Counter = collections.Counter()  # job id -> runs in progress
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        for job_id, spec in SCHEDULED_JOBS.items():
+            store.register(job_id, spec["trigger"], spec["enabled"], spec["params"])
+
+    def wake(self):
+        """Re-read the schedule now, e.g. after it was edited."""
+        self._wake.set()
+
+    def run_now(self, job_id: str) -> bool:
+        """Start ``job_id`` immediately, outside its schedule; False if its concurrency limit is reached."""
+        return self._dispatch(job_id, self.store.jobs()[job_id]["params"])
+
+    def _dispatch(self, job_id: str, params: Dict[str, Any]) -> bool:
+        spec = SCHEDULED_JOBS[job_id]
+        with self._lock:
+            if self.running[job_id] >= spec["max_instances"]:
+                overlapping = True
+            else:
+                overlapping = False
+                self.running[job_id] += 1
+        if overlapping:
+            self.store.record_run(job_id, time.time(), 0.0, "skipped", "Previous run still in progress.")
+            return False
+        self.executor.submit(self._execute, job_id, spec["func"], params)
+        return True
+
+    def _execute(self, job_id: str, func: Callable, params: Dict[str, Any]):
+        started_at = time.time()
+        try:
+            with metrics.span(f"job:{job_id}"):
+                status, detail = "ok", str(func(**params))
+        except Exception as e:
+            status, detail = "failed", f"{type(e).__name__}: {e}"
+        finally:
+            with self._lock:
+                self.running[job_id] -= 1
+        self.store.record_run(job_id, started_at, time.time() - started_at, status, detail)
+
+    def run(self):
+        while True:
+            next_wake = time.time() + SCHEDULER_MAX_SLEEP
+            try:
+                now = time.time()
+                for job_id, job in self.store.jobs().items():
+                    if job_id not in SCHEDULED_JOBS or not job["enabled"]:
+                        continue
+                    if job["next_run"] <= now:
+                        self._dispatch(job_id, job["params"])
+                        job["next_run"] = parse_trigger(job["trigger"]).next_after(now)
+                        self.store.set_next_run(job_id, job["next_run"])
+                    next_wake = min(next_wake, job["next_run"])
+            except Exception as e:  # A bad stored trigger or DB error; jobs themselves record their own failures
+                logger.exception("Job scheduler error: %s", e)
+            self._wake.wait(max(0.0, next_wake - time.time()))
+            self._wake.clear()
+
+@st.cache_resource
+def get_scheduler() -> JobScheduler:
+    scheduler = JobScheduler(JobStore())
+    scheduler.start()
+    return scheduler
+
+def run_scheduled_task(job_id: str) -> str:
+    """Trigger a registered job now on the scheduler's worker pool."""
+    if get_scheduler().run_now(job_id):
+        return f"Task '{SCHEDULED_JOBS[job_id]['label']}' started in the background."
+    return f"Task '{SCHEDULED_JOBS[job_id]['label']}' is already running; this run was skipped."
+
+@scheduled_job("backup", "Incremental Drive backup", "0 2 * * *", enabled=False,
+               folder_path=".", drive_folder_name="Automated_Backups")
+def backup_job(folder_path: str, drive_folder_name: str) -> str:
+    if get_drive() is None:
+        raise IntegrationUnavailable(drive_unavailable_message())
+    result = incremental_backup_to_drive(folder_path, drive_folder_name)
+    if result.startswith("Error"):
+        raise RuntimeError(result)
+    return result
+
+@scheduled_job("uptime_check", "Uptime check of monitored sites", "every 5m")
+def uptime_check_job() -> str:
+    """Run the uptime poller's cycle now; checking separately would record every target twice."""
+    poller = get_uptime_poller()
+    previous_run = poller.last_run
+    poller.poll_now()
+    deadline = time.monotonic() + UPTIME_POLL_INTERVAL
+    while poller.last_run == previous_run and time.monotonic() < deadline:
+        time.sleep(0.2)
+    if poller.last_run == previous_run:
+        raise RuntimeError("The uptime poller did not finish a check in time")
+    results = poller.last_results
+    return f"{sum(1 for r in results if r['up'])}/{len(results)} monitored sites up."
+
+@scheduled_job("news_digest", "News digest email", "0 7 * * *", enabled=False,
+               query="technology", num_articles=5, to_email="")
+def news_digest_job(query: str, num_articles: int, to_email: str) -> str:
+    if not get_secret("NEWS_API_KEY") or not get_secret("GEMINI_API_KEY"):
+        raise IntegrationUnavailable("The news digest needs NEWS_API_KEY and GEMINI_API_KEY.")
+    to_email = to_email or get_secret("GMAIL_USER")
+    digest = build_news_digest(query, num_articles=num_articles)
+    # Wait for the outcome: the job should fail only when the send itself did.
+    result = send_email(to_email, f"News digest: {query} ({dt_object.now():%Y-%m-%d})", digest, timeout=None)
+    if result != "Email sent successfully!":
+        raise RuntimeError(result)
+    return f"Digest of {query!r} sent to {to_email}."
+
+@scheduled_job("machine_report", "Machine report", "every 1h")
+def machine_report_job() -> str:
+    return get_machine_report(get_system_sampler())
+
+
+def metrics_exposition() -> str:
+    """The full /metrics payload: spans and counters plus response-cache and circuit-breaker state."""
+    lines = [metrics.prometheus_text().rstrip("\n"), "# TYPE dashboard_response_cache_events_total counter"]
+    for source, counts in sorted(get_response_cache().stats().items()):
+        if not source.startswith("_"):
+            lines += [f"dashboard_response_cache_events_total{_prometheus_labels(source=source, event=event)} {count}"
+                      for event, count in sorted(counts.items())]
+    registry = get_resilience_registry()
+    with registry["lock"]:
+        breakers = list(registry["breakers"].values())
+    lines.append("# TYPE dashboard_circuit_breaker_open gauge")
+    lines += [f"dashboard_circuit_breaker_open{_prometheus_labels(host=b.host)} {int(b.state != 'closed')}"
+              for b in breakers]
+    return "\n".join(lines) + "\n"
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Serves metrics_exposition() at /metrics for Prometheus to scrape."""
+
+    def do_GET(self):
+        if urlsplit(self.path).path != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics_exposition().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@st.cache_resource
+def get_metrics_server(port: int) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((METRICS_BIND_ADDRESS, port), MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server